@@ -0,0 +1,254 @@
+# In api_server.py
+import asyncio
+import hmac
+import json
+import math
+import os
+import time
+from urllib.parse import urlsplit, parse_qs
+from state import app_state, ARMED, RUNNING
+from run_store import query_run
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+               409: "Conflict", 503: "Service Unavailable"}
+
+def _finite(value):
+    # JSON has no NaN; a failed reading is sent as null
+    return value if math.isfinite(value) else None
+
+class ApiServer:
+    """Local HTTP control and streaming API, served from the acquisition loop.
+
+    GET  /status             state, batch and elapsed time
+    GET  /latest             latest value of every channel
+    GET  /bus                data bus metrics: depth, drops and lag of every subscriber
+    POST /start, POST /stop  same as the Start/Stop button (if allow_control); the request
+                             must carry the control_token in an X-Api-Token header; 409 unless
+                             a batch is armed (/start) or running (/stop)
+    GET  /stream             Server-Sent Events with new channel data; query parameters
+                             'channels' (comma separated) and 'interval' (seconds).
+    GET  /runs               saved runs from the run catalog; 'label', 'since', 'until', 'limit'
+    GET  /query              channels of a saved run: 'run' (data file path), 'channels',
+                             'start', 'end' (local datetimes) and 'max_points' per channel
+    Times in the responses are seconds since the UTC epoch, like the shared export.
+    Each stream is rate limited on the server: at most one update per
+    min_stream_interval_seconds, with at most max_points_per_update points per channel
+    (min/max decimated). A client that reads too slowly only delays its own stream.
+    Only the read-only GET endpoints allow cross-origin requests: a web page open on the
+    rig PC cannot send the token header without a CORS preflight, which is never granted.
+    Only the Python standard library is used, no web framework is needed on the rig PC."""
+    def __init__(self, app_runner, config):
+        api_config = config.get('api', {})
+        self.app_runner = app_runner
+        self.data_manager = app_runner.data_manager
+        self.enabled = api_config.get('enabled', False)
+        self.host = api_config.get('host', '127.0.0.1')
+        self.port = api_config.get('port', 8765)
+        self.allow_control = api_config.get('allow_control', False)
+        self.control_token = str(api_config.get('control_token') or '') # Required for /start and /stop
+        self.min_interval = api_config.get('min_stream_interval_seconds', 0.5)
+        self.max_points = api_config.get('max_points_per_update', 500)
+        self.max_clients = api_config.get('max_clients', 10)
+        self.max_query_points = api_config.get('max_points_per_query', 5000)
+        self.data_dir = os.path.realpath(api_config.get('data_dir', 'data')) # /query only reads runs under it
+        self.server = None
+        self.streams = set() # Tasks of the connected stream clients
+
+    async def start(self):
+        if not self.enabled:
+            return
+        try:
+            self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+            print(f"ApiServer: Listening on http://{self.host}:{self.port}")
+        except OSError as e:
+            print(f"ApiServer: Could not listen on {self.host}:{self.port}: {e}")
+
+    async def close(self):
+        if self.server is None:
+            return
+        self.server.close()
+        for task in list(self.streams):
+            task.cancel()
+        await asyncio.gather(*self.streams, return_exceptions=True)
+        await self.server.wait_closed()
+        self.server = None
+        print("ApiServer: Closed.")
+
+    ### Data for the endpoints
+    def status(self):
+        return {
+            'state': app_state.state,
+            'batch_current_run': app_state.batch_current_run,
+            'batch_total_runs': app_state.batch_total_runs,
+            'elapsed_seconds': self.app_runner.batch_elapsed() if app_state.is_running() else None,
+            'safety_halt_active': self.app_runner.safety_halt_active,
+            'stream_clients': len(self.streams),
+            'time': time.time(),
+        }
+
+    def latest(self):
+        table = {}
+        with self.data_manager.plot_lock:
+            for channel, history in self.data_manager.channel_histories.items():
+                item = history.latest()
+                if item is not None:
+                    table[channel] = {'time': float(item[0]), 'value': _finite(float(item[1]))}
+        return table
+
+    def _stream_update(self, channels, last_sent):
+        # New points per channel since the last update, copied under the plot lock
+        update = {}
+        with self.data_manager.plot_lock:
+            histories = self.data_manager.channel_histories
+            for channel in (channels or list(histories)):
+                history = histories.get(channel)
+                if history is None:
+                    continue
+                x, y = history.since(last_sent.get(channel), self.max_points)
+                if x.size:
+                    last_sent[channel] = float(x[-1])
+                    update[channel] = {'t': x.tolist(), 'v': [_finite(v) for v in y.tolist()]}
+        return update
+
+    ### HTTP
+    async def _handle_client(self, reader, writer):
+        try:
+            request_line = (await asyncio.wait_for(reader.readline(), 10)).decode('latin-1').strip()
+            headers = {}
+            while True:
+                line = (await asyncio.wait_for(reader.readline(), 10)).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if int(headers.get('content-length', 0) or 0):
+                await reader.readexactly(int(headers['content-length'])) # Request bodies are not used
+            parts = request_line.split()
+            if len(parts) < 2:
+                await self._send_json(writer, 400, {'error': "malformed request"})
+                return
+            method, target = parts[0].upper(), urlsplit(parts[1])
+            query = {key: values[-1] for key, values in parse_qs(target.query).items()}
+            await self._route(method, target.path.rstrip('/') or '/', query, headers, writer)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"ApiServer: Error handling request: {e}")
+        finally:
+            writer.close()
+
+    def _authorized(self, headers):
+        # A custom header cannot be sent cross-origin without a preflight, so a web page cannot forge it
+        token = headers.get('x-api-token')
+        return token is not None and bool(self.control_token) and hmac.compare_digest(token, self.control_token)
+
+    async def _route(self, method, path, query, headers, writer):
+        if path == '/status' and method == 'GET':
+            await self._send_json(writer, 200, self.status(), cors=True)
+        elif path == '/latest' and method == 'GET':
+            await self._send_json(writer, 200, self.latest(), cors=True)
+        elif path == '/bus' and method == 'GET':
+            await self._send_json(writer, 200, self.data_manager.bus.stats(), cors=True)
+        elif path in ('/start', '/stop'):
+            if method != 'POST':
+                await self._send_json(writer, 405, {'error': "use POST"})
+            elif not self.allow_control or not self.control_token:
+                await self._send_json(writer, 403, {'error': "remote control is disabled"})
+            elif not self._authorized(headers):
+                await self._send_json(writer, 401, {'error': "missing or wrong X-Api-Token header"})
+            elif path == '/start' and app_state.state != ARMED:
+                await self._send_json(writer, 409, {'error': f"cannot start in state '{app_state.state}'"})
+            elif path == '/stop' and app_state.state != RUNNING:
+                await self._send_json(writer, 409, {'error': f"cannot stop in state '{app_state.state}'"})
+            else:
+                print(f"ApiServer: Remote {path[1:]} requested.")
+                # Same path as the GUI button, so the front end shows the change too
+                self.app_runner.gui_manager.start_stop_action("Start" if path == '/start' else "Stop")
+                await self._send_json(writer, 200, self.status())
+        elif path == '/stream' and method == 'GET':
+            await self._stream(query, writer)
+        elif path == '/runs' and method == 'GET':
+            await self._runs(query, writer)
+        elif path == '/query' and method == 'GET':
+            await self._query(query, writer)
+        else:
+            await self._send_json(writer, 404, {'error': f"unknown endpoint {method} {path}"})
+
+    async def _runs(self, query, writer):
+        catalog = self.app_runner.run_catalog
+        try:
+            limit = int(query.get('limit', 100))
+            runs = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: catalog.find(query.get('label'), query.get('since'), query.get('until')))
+        except ValueError as e:
+            await self._send_json(writer, 400, {'error': str(e)})
+            return
+        await self._send_json(writer, 200, json.loads(runs.head(limit).to_json(orient='records')), cors=True) # NaN -> null
+
+    async def _query(self, query, writer):
+        run = query.get('run')
+        if not run:
+            await self._send_json(writer, 400, {'error': "'run' is required"})
+            return
+        if not os.path.realpath(run).startswith(self.data_dir + os.sep) or not os.path.exists(run):
+            await self._send_json(writer, 404, {'error': f"no saved run {run}"})
+            return
+        channels = [c for c in query.get('channels', '').split(',') if c] or None
+        try:
+            max_points = min(self.max_query_points, int(query.get('max_points', self.max_query_points)))
+            # File reads happen in the executor, acquisition keeps running
+            arrays = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: query_run(run, channels, query.get('start'), query.get('end'), output='arrays', max_points=max_points))
+        except ValueError as e:
+            await self._send_json(writer, 400, {'error': str(e)})
+            return
+        # Same time base as /latest and /stream: seconds since the UTC epoch
+        data = {channel: {'t': (times / 1e9).tolist(), 'v': [_finite(v) for v in values.tolist()]}
+                for channel, (times, values) in arrays.items()}
+        await self._send_json(writer, 200, {'run': run, 'data': data}, cors=True)
+
+    async def _send_json(self, writer, code, payload, cors=False):
+        # cors: read-only data that dashboards on other origins may fetch; never for control endpoints
+        body = json.dumps(payload).encode()
+        allow_origin = "Access-Control-Allow-Origin: *\r\n" if cors else ""
+        writer.write(f"HTTP/1.1 {code} {STATUS_TEXT.get(code, '')}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n{allow_origin}Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _stream(self, query, writer):
+        if len(self.streams) >= self.max_clients:
+            await self._send_json(writer, 503, {'error': "too many stream clients"})
+            return
+        channels = [c for c in query.get('channels', '').split(',') if c] or None
+        try:
+            interval = max(self.min_interval, float(query.get('interval', self.min_interval)))
+        except ValueError:
+            interval = self.min_interval
+        task = asyncio.current_task()
+        self.streams.add(task)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            last_sent = {} # channel -> time of the newest point this client has
+            last_plot_seq = None
+            while True:
+                started = time.monotonic()
+                plot_seq = self.data_manager.plot_seq
+                if plot_seq != last_plot_seq:
+                    last_plot_seq = plot_seq
+                    update = self._stream_update(channels, last_sent)
+                    if update:
+                        payload = json.dumps({'status': self.status(), 'data': update})
+                        writer.write(f"event: data\ndata: {payload}\n\n".encode())
+                else:
+                    writer.write(b": keep-alive\n\n")
+                # A slow client blocks here, not the acquisition loop
+                await writer.drain()
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except ConnectionError:
+            pass # Client went away
+        finally:
+            self.streams.discard(task)
@@ -1,23 +1,55 @@
 # In application_runner.py
 import asyncio
-from gui_manager import GUIManager 
 from equipment_manager import EquipmentManager 
-from data_manager import AsyncDataManager 
-from state import app_state 
-import dearpygui.dearpygui as dpg
+from data_manager import AsyncDataManager, write_data_file
+from data_bus import DROP_OLDEST
+from burst_stats import summary_path_for
+from persistence import PersistenceWorker
+from run_catalog import RunCatalog
+from checkpoint import CheckpointManager
+from api_server import ApiServer
+from shared_export import SharedDataExporter
+from state import app_state, IDLE, ARMED, RUNNING, HALTED
 from collections import deque
+import math
+import threading
+import time
 from pandas import Timestamp # Ensure this is imported if used, e.g. by DataManager or DAQ classes
 
 class ApplicationRunner:
-    def __init__(self, config, loop_instance):
+    def __init__(self, config, loop_instance, resume=False, headless=False):
         self.config = config
         self.loop = loop_instance
-        self.data_manager = AsyncDataManager()
+        self.data_manager = AsyncDataManager(self.config)
         self.eqpt_manager = EquipmentManager(self.config, self.data_manager)
-        self.gui_manager = GUIManager(self.eqpt_manager, self.data_manager, self)
+        # Front end: the DearPyGui window, or logs and a status file on unattended machines.
+        # Both offer the same methods, the runner never calls DearPyGui itself.
+        if headless:
+            from headless import HeadlessFrontend
+            self.gui_manager = HeadlessFrontend(self.eqpt_manager, self.data_manager, self)
+        else:
+            from gui_manager import GUIManager
+            self.gui_manager = GUIManager(self.eqpt_manager, self.data_manager, self)
         self.safety_halt_active = False
         self.safety_persistence_history = {} # For safety rule persistence
+
+        # Finished batches are written in the background while the next one runs
+        self.run_catalog = RunCatalog(self.config) # Index of saved batches, for finding runs without opening them
+        self.persistence_worker = PersistenceWorker(write_data_file, on_result=self.save_finished,
+                                                    catalog=self.run_catalog)
+        self.checkpoint_manager = CheckpointManager(self.config)
+        # data file -> (checkpoint to write once it is saved, None to clear; checkpoint generation when queued)
+        self.checkpoints_after_save = {}
+        self.api_server = ApiServer(self, self.config) # Remote status, control and data streams
+        self.shared_exporter = SharedDataExporter(self.config, self.data_manager) # Live data for local analysis processes
+        # Checkpoint of an interrupted batch to continue from, only loaded in resume mode
+        self.resume_checkpoint = self.checkpoint_manager.load() if resume else None
+        self.batch_elapsed_offset = 0.0 # Seconds of the current batch already done before a resume
+        self.batch_start_time = None
+        self.batch_completed = False # Set when the schedules or the time limit end the batch
         
+        self.gui_closed = None # asyncio.Event set when the window is closed, created on the acquisition loop
+        self.acquisition_thread = None
         self.orchestrator_task = None
         self.idle_monitoring_task = None # Global task, started once
         self.safety_monitoring_task = None # Global task, started once
@@ -29,8 +61,129 @@ class ApplicationRunner:
     def get_loop(self):
         return self.loop
 
-    async def run(self):
+    def call_in_loop(self, func, *args):
+        # Hand a call from the GUI thread over to the acquisition loop
+        if self.loop.is_running() and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(func, *args)
+        else:
+            func(*args)
+
+    def batch_elapsed(self):
+        if self.batch_start_time is None:
+            return self.batch_elapsed_offset
+        return time.time() - self.batch_start_time
+
+    def build_checkpoint(self):
+        schedules = {}
+        for eqpt in self.eqpt_manager.equipment_list:
+            schedule = getattr(eqpt, 'schedule', None)
+            state = schedule.checkpoint_state() if schedule else None
+            if state is not None:
+                schedules[eqpt.name] = state
+        return {
+            'batch_current_run': app_state.batch_current_run,
+            'batch_total_runs': app_state.batch_total_runs,
+            'elapsed_seconds': self.batch_elapsed(),
+            'data_file': self.data_manager.batch_file_path,
+            'partial_data_file': self.data_manager.partial_file_path(),
+            'schedules': schedules,
+        }
+
+    async def prepare_resumed_batch(self, checkpoint):
+        # Reload the interrupted batch's data and position every schedule where it stopped
+        self.batch_elapsed_offset = float(checkpoint.get('elapsed_seconds', 0.0))
+        if checkpoint.get('data_file'):
+            await self.data_manager.load_partial(checkpoint['data_file'])
+        schedule_states = checkpoint.get('schedules', {})
+        for eqpt in self.eqpt_manager.equipment_list:
+            schedule = getattr(eqpt, 'schedule', None)
+            state = schedule_states.get(eqpt.name)
+            if schedule and state:
+                schedule.resume_from(float(state.get('elapsed', self.batch_elapsed_offset)))
+        print(f"ApplicationRunner: Batch {app_state.batch_current_run} will resume at {self.batch_elapsed_offset:.1f}s.")
+
+    async def save_copy_in_background(self):
+        # Save button: copy of the current data, written without pausing the running batch
+        frame = await self.data_manager.snapshot_copy()
+        file_path = self.data_manager.new_file_path()
+        summary = self.data_manager.burst_stats.table()
+        if self.persistence_worker.submit(frame, file_path, metadata=self.run_catalog.metadata(None, summary)):
+            self.gui_manager.show_save_status("Saving data copy in background...")
+            if not summary.empty:
+                self.persistence_worker.submit(summary, summary_path_for(file_path))
+
+    def save_finished(self, result):
+        # PersistenceWorker callback, in the acquisition loop
+        self.gui_manager.show_save_result(result)
+        if result.file_path not in self.checkpoints_after_save:
+            return
+        next_checkpoint, generation = self.checkpoints_after_save.pop(result.file_path)
+        if result.error is not None:
+            print(f"ApplicationRunner: Batch {result.batch_num} was not saved, its checkpoint is kept for a resume.")
+        elif generation != self.checkpoint_manager.generation:
+            pass # The next batch has already written its own, newer checkpoint
+        elif next_checkpoint is not None:
+            self.checkpoint_manager.save(next_checkpoint)
+        else:
+            self.checkpoint_manager.clear()
+
+    def run(self):
+        # Front end on the calling (main) thread; acquisition, schedules and safety on their own loop
+        # in a background thread, so slow frames and blocking driver calls cannot stall each other.
         self.gui_manager.setup()
+        self.acquisition_thread = threading.Thread(target=self._acquisition_thread_main, name="acquisition", daemon=True)
+        self.acquisition_thread.start()
+        try:
+            self.gui_manager.render_loop()
+            print("ApplicationRunner: Front end loop exited.")
+        except Exception as e:
+            print(f"ApplicationRunner: Exception in front end loop: {e}")
+            import traceback
+            traceback.print_exc()
+            raise
+        finally:
+            print("ApplicationRunner: Front end loop exited or error occurred. Signalling acquisition thread...")
+            self.gui_manager.mark_closed()
+            if not self.loop.is_closed():
+                try:
+                    self.loop.call_soon_threadsafe(self._signal_gui_closed)
+                except RuntimeError: # Loop already closed by the acquisition thread
+                    pass
+            self.acquisition_thread.join()
+            self.gui_manager.teardown()
+
+            print("ApplicationRunner: Run method finished and cleanup sequence completed.")
+
+    def _signal_gui_closed(self):
+        # Runs in the acquisition loop, so gui_closed exists by then
+        self.gui_closed.set()
+
+    def _acquisition_thread_main(self):
+        asyncio.set_event_loop(self.loop)
+        # Before Python 3.10 asyncio primitives bind to the current loop when created: make them here
+        self.gui_closed = asyncio.Event()
+        try:
+            self.loop.run_until_complete(self.run_acquisition())
+        except Exception as e:
+            print(f"ApplicationRunner: Unexpected error in acquisition loop: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            # Gather all remaining tasks so they can process their cancellation
+            tasks = [t for t in asyncio.all_tasks(loop=self.loop) if not t.done()]
+            if tasks:
+                print(f"ApplicationRunner: Cancelling {len(tasks)} outstanding tasks...")
+                for task in tasks:
+                    task.cancel()
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+            print("ApplicationRunner: Acquisition loop closed.")
+
+    async def run_acquisition(self):
+        self.persistence_worker.start(self.loop)
+        self.data_manager.start(self.loop)
+        self.shared_exporter.start(self.loop)
+        await self.api_server.start()
 
         try:
             print("ApplicationRunner: Initializing all equipment at startup...")
@@ -38,11 +191,10 @@ class ApplicationRunner:
             print("ApplicationRunner: All equipment initialized.")
         except Exception as e_init_all:
             print(f"ApplicationRunner: CRITICAL ERROR initializing equipment at startup: {e_init_all}")
-            if dpg.is_dearpygui_running():
-                if dpg.does_item_exist("info_text"): dpg.set_value("info_text", "CRITICAL: Equipment Init Failed!")
-                if dpg.does_item_exist("safety_alert_text"): dpg.set_value("safety_alert_text", "Equipment Init Failed! System may be unstable.")
+            self.gui_manager.set_info("CRITICAL: Equipment Init Failed!")
+            self.gui_manager.show_safety_alert("Equipment Init Failed! System may be unstable.")
             # Depending on severity, you might want to halt further execution:
-            # if dpg.is_dearpygui_running(): dpg.stop_dearpygui()
+            # self.gui_manager.mark_closed()
             # return
 
         # Start only the batch orchestrator initially.
@@ -50,22 +202,14 @@ class ApplicationRunner:
         self.orchestrator_task = self.loop.create_task(self.batch_orchestrator())
 
         try:
-            while dpg.is_dearpygui_running():
-                dpg.render_dearpygui_frame()
-                await asyncio.sleep(0.016) # Yield to the event loop
-            print("ApplicationRunner: DPG render loop exited because is_dearpygui_running() returned False")
-        except Exception as e:
-            print(f"ApplicationRunner: Exception in DPG render loop: {e}")
-            import traceback
-            traceback.print_exc()
-            raise
+            await self.gui_closed.wait()
         finally:
-            print("ApplicationRunner: DPG render loop exited or error occurred. Initiating cleanup...")
+            print("ApplicationRunner: GUI closed. Initiating acquisition cleanup...")
 
             if app_state.is_running(): # If a batch was active
                  print("ApplicationRunner: App was running. Signaling app_state.stop().")
                  app_state.stop()
-                 await asyncio.sleep(0.2) # Give task_monitor a moment to react
+                 await app_state.wait_for(IDLE, HALTED, timeout=1.0) # Give task_monitor a moment to clean up
 
             tasks_to_cancel_explicitly = []
             if self.orchestrator_task and not self.orchestrator_task.done():
@@ -87,6 +231,11 @@ class ApplicationRunner:
                 except Exception as e_gather: # Should not happen with return_exceptions=True
                     print(f"ApplicationRunner: Error during gather of main tasks: {e_gather}")
 
+            await self.api_server.close()
+            await self.shared_exporter.close()
+            await self.data_manager.close()
+            await self.persistence_worker.close() # Finish writing batches still in the save queue
+
             if not self.safety_halt_active:
                 print("ApplicationRunner: Attempting to stop all equipment as part of final cleanup...")
                 try:
@@ -97,17 +246,6 @@ class ApplicationRunner:
             else:
                 print("ApplicationRunner: Equipment stop was presumably handled by the safety system.")
 
-            if dpg.get_dearpygui_version(): 
-                try:
-                    if dpg.is_dearpygui_running(): 
-                        dpg.stop_dearpygui()
-                    dpg.destroy_context()
-                    print("ApplicationRunner: DearPyGui context destroyed.")
-                except Exception as e_dpg:
-                    print(f"ApplicationRunner: Error destroying DPG context: {e_dpg} (Context might already be destroyed or invalid)")
-            
-            print("ApplicationRunner: Run method finished and cleanup sequence completed.")
-
     async def idle_monitoring_loop(self):
         try:
             idle_config = self.config.get('idle_monitoring', {})
@@ -152,7 +290,7 @@ class ApplicationRunner:
             print(f"Idle monitoring started for {eq_name_idle}. Main interval: {interval}s, Pause check: {pause_check_interval}s.")
             
             while True: # Main loop for idle monitoring
-                if self.safety_halt_active or not dpg.is_dearpygui_running():
+                if self.safety_halt_active or not self.gui_manager.gui_running():
                     # If safety halt or GUI closed, stop idle monitoring.
                     print("Idle_monitor: Safety halt or DPG not running. Stopping.")
                     break
@@ -195,6 +333,7 @@ class ApplicationRunner:
             print("Idle monitoring loop stopped.")
 
     async def safety_monitoring_loop(self):
+        subscription = None
         try:
             safety_config = self.config.get('safety_rules', {})
             if not safety_config.get('enabled', False):
@@ -209,6 +348,9 @@ class ApplicationRunner:
             print(f"Safety monitoring starting. Initial ramp-up delay: {initial_delay_seconds}s before active checks.")
             await asyncio.sleep(initial_delay_seconds)
             print(f"Safety monitoring active. Checking {len(rules)} rules every {interval}s.")
+            # Own bus subscription: only the newest readings matter, so old blocks may be dropped
+            subscription = self.data_manager.bus.subscribe('safety', maxsize=1000, policy=DROP_OLDEST)
+            latest_values = {} # Last known value per channel, kept across checks
 
             # Initialize persistence history if it hasn't been (for continuous monitoring)
             if not self.safety_persistence_history and rules:
@@ -217,7 +359,7 @@ class ApplicationRunner:
                         self.safety_persistence_history[rule_cfg['name']] = deque(maxlen=rule_cfg['persistence_readings'])
             
             while True:
-                if not dpg.is_dearpygui_running() or self.safety_halt_active:
+                if not self.gui_manager.gui_running() or self.safety_halt_active:
                     if self.safety_halt_active: print("Safety monitoring loop: System HALTED. Stopping safety checks.")
                     break # Exit loop if DPG closes or safety halt is active
 
@@ -226,12 +368,9 @@ class ApplicationRunner:
                     await asyncio.sleep(interval)
                     continue
                 # Safety checks run continuously once started and past initial delay
-                current_plot_deque_snapshot = list(self.data_manager.plot_deque)
-                latest_values = {}
-                for _ts, _name, ch_id, val in reversed(current_plot_deque_snapshot):
-                    if ch_id not in latest_values:
-                        try: latest_values[ch_id] = float(val)
-                        except (ValueError, TypeError): latest_values[ch_id] = None
+                for block in subscription.drain():
+                    for ch_id, val in zip(block.channels, block.values):
+                        latest_values[ch_id] = None if math.isnan(val) else float(val)
 
                 for rule in rules: # Iterate through configured safety rules
                     if not rule.get('enabled', False) or self.safety_halt_active: continue
@@ -262,103 +401,124 @@ class ApplicationRunner:
                         if final_condition_met:
                             alert_message = f"SAFETY RULE '{rule['name']}' VIOLATED for {ch_id_to_check}: Value {current_value} {cond.replace('_',' ')} {thresh}. {rule.get('message', '')}"
                             print(alert_message)
-                            if dpg.is_dearpygui_running():
-                                if dpg.does_item_exist("safety_alert_text"): dpg.set_value("safety_alert_text", alert_message)
-                                if dpg.does_item_exist("safety_alert_window"): dpg.show_item("safety_alert_window")
+                            self.gui_manager.show_safety_alert(alert_message)
 
                             if rule.get('action') == "shutdown":
                                 print("SAFETY ACTION: Initiating system shutdown due to rule violation.")
                                 self.safety_halt_active = True # Critical: set flag first
-                                
-                                if app_state.is_running(): # If a batch is running, signal it to stop
-                                    app_state.stop() 
-                                    await asyncio.sleep(0.2) # Allow task_monitor to react
+                                # HALTED wakes task_monitor and every schedule immediately
+                                app_state.halt(f"safety rule '{rule['name']}'")
                                 
                                 await self.eqpt_manager.stop_equipment() # Stop all equipment
                                 print("SAFETY ACTION: Equipment stop commands sent.")
                                 
-                                if dpg.is_dearpygui_running(): # Update GUI to reflect HALT
-                                    if dpg.does_item_exist("start_stop_button"): dpg.configure_item("start_stop_button", label="HALTED", enabled=False)
-                                    if dpg.does_item_exist("info_text"): dpg.set_value("info_text", f"SYSTEM HALTED BY SAFETY: {rule['name']}")
-                                    if dpg.does_item_exist("batch_info_text"): dpg.set_value("batch_info_text", "SAFETY SHUTDOWN")
+                                # Update GUI to reflect HALT
+                                self.gui_manager.set_start_button(label="HALTED", enabled=False)
+                                self.gui_manager.set_info(f"SYSTEM HALTED BY SAFETY: {rule['name']}")
+                                self.gui_manager.set_batch_info("SAFETY SHUTDOWN")
                                 # Safety halt active, so break from inner rule loop and outer while loop
                     if self.safety_halt_active: break 
                 await asyncio.sleep(interval) # Interval for checking safety rules
         except asyncio.CancelledError:
             print("Safety monitoring loop was cancelled.")
         finally:
+            if subscription is not None:
+                self.data_manager.bus.unsubscribe(subscription)
             print("Safety monitoring loop stopped.")
 
     async def batch_orchestrator(self):
         try:
             print(f"BatchOrchestrator: Starting. auto_start_next_batch={app_state.auto_start_next_batch}, delay={app_state.auto_start_delay_s}s, total_runs={app_state.batch_total_runs}")
-            for i in range(app_state.batch_total_runs):
+            first_batch_index = 0
+            if self.resume_checkpoint:
+                first_batch_index = max(0, int(self.resume_checkpoint.get('batch_current_run', 1)) - 1)
+                print(f"BatchOrchestrator: Resume mode, continuing from batch {first_batch_index + 1}.")
+            for i in range(first_batch_index, app_state.batch_total_runs):
                 print(f"BatchOrchestrator: Loop iteration {i}, batch_current_run will be {i+1}")
                 app_state.set_system_stable(False)
                 app_state.batch_current_run = i + 1
                 
                 if self.safety_halt_active:
                     print("Batch orchestrator: System is HALTED due to safety. Cannot start new batch.")
-                    if dpg.is_dearpygui_running():
-                        if dpg.does_item_exist("info_text"): dpg.set_value("info_text", "SYSTEM HALTED. Restart required.")
-                        if dpg.does_item_exist("start_stop_button"): dpg.configure_item("start_stop_button", label="HALTED", enabled=False)
+                    self.gui_manager.set_info("SYSTEM HALTED. Restart required.")
+                    self.gui_manager.set_start_button(label="HALTED", enabled=False)
                     break
 
-                is_first_batch = (app_state.batch_current_run == 1)
+                is_first_batch = (i == first_batch_index)
 
                 if app_state.is_running(): # Ensure previous batch state is cleared
                     # app_state.stop()
                     self.gui_manager.start_stop_action("Stop")
-                    await asyncio.sleep(0.5) # Give task_monitor time to clean up previous batch
+                    await app_state.wait_for(IDLE, HALTED, timeout=5.0) # Give task_monitor time to clean up previous batch
 
                 print(f"Preparing Batch {app_state.batch_current_run} of {app_state.batch_total_runs}")
-                if dpg.is_dearpygui_running():
-                    self.gui_manager.update_batch_display()
-                    self.gui_manager.prepare_for_new_run() 
-                    dpg.set_value("info_text", f"Batch {app_state.batch_current_run} ready. Press Start.")
+                if self.gui_manager.gui_running():
+                    self.gui_manager.prepare_batch_display()
+                    self.gui_manager.set_info(f"Batch {app_state.batch_current_run} ready. Press Start.")
                 else:
                     print("BatchOrchestrator: DPG not running while preparing batch. Exiting.") 
                     break # DPG not running, exit orchestrator
 
                 self.data_manager.reset_data()
-
-                should_auto_start_this_batch = app_state.auto_start_next_batch and not is_first_batch
-                if not should_auto_start_this_batch:
-                    print(f"Batch {app_state.batch_current_run}: Manual start required.")
-                    if dpg.is_dearpygui_running():
-                        dpg.set_value("info_text", f"Batch {app_state.batch_current_run} ready. Press Start.")
-                        if dpg.does_item_exist("start_stop_button"):
-                            dpg.configure_item("start_stop_button", label="Start", enabled=True)
-                    # Wait for Start button press
-                    while not app_state.is_running() and dpg.is_dearpygui_running() and not self.safety_halt_active:
-                        await asyncio.sleep(0.1)
-                else: # Auto-start this batch
-                    print(f"Batch {app_state.batch_current_run}: Auto-starting in {app_state.auto_start_delay_s}s...")
-                    if dpg.is_dearpygui_running():
-                        dpg.set_value("info_text", f"Auto-starting Batch {app_state.batch_current_run} in {app_state.auto_start_delay_s}s...")
-                        if dpg.does_item_exist("start_stop_button"): # Optionally disable during countdown
-                            dpg.configure_item("start_stop_button", enabled=False)
-                    
-                    await asyncio.sleep(app_state.auto_start_delay_s)
-
-                    if self.safety_halt_active or not dpg.is_dearpygui_running():
-                        print(f"Batch {app_state.batch_current_run} auto-start aborted (safety/DPG closed during delay).")
-                        if app_state.is_running(): self.gui_manager.start_stop_action("Stop")
-                        break # Exit orchestrator loop
-                    
-                    print(f"Batch {app_state.batch_current_run}: Auto-starting now via GUI action.")
-                    self.gui_manager.start_stop_action("Start") # Programmatically "press" start
-                    # Wait briefly for app_state to reflect the start
-                    for _ in range(10): # Max 1 second wait
-                        if app_state.is_running(): break
-                        await asyncio.sleep(0.1)
+                self.batch_elapsed_offset = 0.0
+                self.batch_start_time = None
+                self.batch_completed = False
+                resume_checkpoint = self.resume_checkpoint if is_first_batch else None
+                if resume_checkpoint and int(resume_checkpoint.get('batch_current_run', 0)) == app_state.batch_current_run:
+                    await self.prepare_resumed_batch(resume_checkpoint)
+                else:
+                    self.data_manager.begin_batch_file()
+
+                app_state.arm()
+                # Without an operator (headless) every batch starts on its own, the first one included
+                should_auto_start_this_batch = self.gui_manager.auto_start or (app_state.auto_start_next_batch and not is_first_batch)
+                start_aborted = False
+                while True:
+                    if not should_auto_start_this_batch:
+                        print(f"Batch {app_state.batch_current_run}: Manual start required.")
+                        if self.batch_elapsed_offset > 0:
+                            self.gui_manager.set_info(f"Batch {app_state.batch_current_run} will resume at {self.batch_elapsed_offset:.0f}s. Press Start.")
+                        else:
+                            self.gui_manager.set_info(f"Batch {app_state.batch_current_run} ready. Press Start.")
+                        self.gui_manager.set_start_button(label="Start", enabled=True)
+                        # Wait for Start button press (or a halt/disarm); no polling
+                        await app_state.wait_for(RUNNING, HALTED, IDLE)
+                    else: # Auto-start this batch
+                        print(f"Batch {app_state.batch_current_run}: Auto-starting in {app_state.auto_start_delay_s}s...")
+                        self.gui_manager.set_info(f"Auto-starting Batch {app_state.batch_current_run} in {app_state.auto_start_delay_s}s...")
+                        self.gui_manager.set_start_button(enabled=False) # Optionally disable during countdown
+
+                        # Aborts the countdown on a halt or a Stop (disarm); a remote Start (API) ends it early
+                        await app_state.wait_for(RUNNING, HALTED, IDLE, timeout=app_state.auto_start_delay_s)
+
+                        if self.safety_halt_active or not self.gui_manager.gui_running():
+                            print(f"Batch {app_state.batch_current_run} auto-start aborted (safety/DPG closed during delay).")
+                            if app_state.is_running(): self.gui_manager.start_stop_action("Stop")
+                            start_aborted = True
+                            break # Exit orchestrator loop
+
+                        if app_state.state == ARMED:
+                            print(f"Batch {app_state.batch_current_run}: Auto-starting now via GUI action.")
+                            self.gui_manager.start_stop_action("Start") # Programmatically "press" start
+                            # Wait briefly for app_state to reflect the start
+                            await app_state.wait_for(RUNNING, HALTED, timeout=1.0)
+
+                    if app_state.state == IDLE and not self.safety_halt_active and self.gui_manager.gui_running():
+                        # Stopped before it started: the same batch waits for the operator again
+                        print(f"Batch {app_state.batch_current_run}: Start cancelled, waiting for a manual start.")
+                        app_state.arm()
+                        should_auto_start_this_batch = False
+                        continue
+                    break
+                if start_aborted:
+                    break
 
                 # Check conditions after waiting for start
                 if self.safety_halt_active:
                     print(f"Batch {app_state.batch_current_run} start aborted by safety system post-attempt.")
                     if app_state.is_running(): self.gui_manager.start_stop_action("Stop")
                     break
-                if not dpg.is_dearpygui_running():
+                if not self.gui_manager.gui_running():
                     print(f"Batch {app_state.batch_current_run} start aborted (DPG closed post-attempt).")
                     if app_state.is_running(): self.gui_manager.start_stop_action("Stop")
                     break
@@ -378,8 +538,7 @@ class ApplicationRunner:
                         self._safety_monitor_started_globally = True
 
                 print(f"Start signal processed for Batch {app_state.batch_current_run}. Starting batch tasks via task_monitor...")
-                if dpg.is_dearpygui_running():
-                    dpg.set_value("info_text", f"Running Batch {app_state.batch_current_run}...")
+                self.gui_manager.set_info(f"Running Batch {app_state.batch_current_run}...")
                 
                 monitor_task_for_this_batch = None
                 try:
@@ -397,14 +556,45 @@ class ApplicationRunner:
                 print(f"Batch {app_state.batch_current_run} processing via task_monitor concluded. app_state.is_running(): {app_state.is_running()}")
                 app_state.set_system_stable(False) # Unstable during save and transition
 
+                if self.checkpoint_manager.enabled:
+                    # Keep the position for a later resume: an interrupted batch continues from it, a completed
+                    # one is only reloaded (and saved again) if its background save does not finish
+                    await self.data_manager.flush_partial()
+                    self.checkpoint_manager.save(self.build_checkpoint())
+
+                queued = False
                 if not self.safety_halt_active:
-                    print(f"BATCH_ORCH: Saving data for batch {app_state.batch_current_run}.")
-                    await self.data_manager.save_data()
+                    # Hand the batch over to the background writer; the next batch does not wait for it
+                    print(f"BATCH_ORCH: Queuing data of batch {app_state.batch_current_run} for saving.")
+                    frozen_df, file_path = await self.data_manager.snapshot_batch()
+                    summary = self.data_manager.take_burst_summary() # Mean/std per burst and channel, next to the raw data
+                    metadata = self.run_catalog.metadata(app_state.batch_current_run, summary)
+                    queued = self.persistence_worker.submit(frozen_df, file_path, app_state.batch_current_run, metadata)
+                    if queued:
+                        self.gui_manager.show_save_status(f"Saving batch {app_state.batch_current_run} in background...")
+                        if not summary.empty:
+                            self.persistence_worker.submit(summary, summary_path_for(file_path), app_state.batch_current_run)
                 else:
                     print(f"Data for batch {app_state.batch_current_run} not saved due to safety halt.")
 
-                # print(f"DEBUG: Post-save. DPG running: {dpg.is_dearpygui_running()}, Safety halt: {self.safety_halt_active}")
-                if not dpg.is_dearpygui_running():
+                if self.checkpoint_manager.enabled and self.batch_completed:
+                    next_checkpoint = None # Last batch: the checkpoint is cleared
+                    if app_state.batch_current_run < app_state.batch_total_runs:
+                        # Nothing of the next batch has run yet, a resume simply starts it
+                        next_checkpoint = {'batch_current_run': app_state.batch_current_run + 1,
+                                           'batch_total_runs': app_state.batch_total_runs,
+                                           'elapsed_seconds': 0.0, 'data_file': None, 'schedules': {}}
+                    if queued:
+                        # Only once the file is written: until then the checkpoint of this batch (and its
+                        # partial file) stays the way to recover it
+                        self.checkpoints_after_save[file_path] = (next_checkpoint, self.checkpoint_manager.generation)
+                    elif next_checkpoint is not None:
+                        self.checkpoint_manager.save(next_checkpoint)
+                    else:
+                        self.checkpoint_manager.clear()
+
+                # print(f"DEBUG: Post-save. DPG running: {self.gui_manager.gui_running()}, Safety halt: {self.safety_halt_active}")
+                if not self.gui_manager.gui_running():
                     # print("DEBUG: GUI stopped after batch completion! Breaking orchestrator loop.")
                     break
                 if self.safety_halt_active:
@@ -418,15 +608,8 @@ class ApplicationRunner:
                         print(f"Batch {app_state.batch_current_run} finished. Next batch ({app_state.batch_current_run + 1}) will auto-start after delay (handled at top of next loop).")
                     else: # Manual start for next batch
                         print(f"Batch {app_state.batch_current_run} finished. Next batch ({app_state.batch_current_run + 1}) requires 'Start' press.")
-                        if dpg.is_dearpygui_running():
-                            try:
-                                if dpg.does_item_exist("info_text"):
-                                    dpg.set_value("info_text", f"Batch {app_state.batch_current_run} done. Press Start for batch {app_state.batch_current_run + 1}.")
-                                if dpg.does_item_exist("start_stop_button"):
-                                    dpg.configure_item("start_stop_button", label="Start", enabled=True)
-                            except Exception as e_dpg_ui:
-                                print(f"BATCH_ORCH_DEBUG: Error updating DPG for manual next batch: {e_dpg_ui}")
-                                # Potentially break or handle this error
+                        self.gui_manager.set_info(f"Batch {app_state.batch_current_run} done. Press Start for batch {app_state.batch_current_run + 1}.")
+                        self.gui_manager.set_start_button(label="Start", enabled=True)
                     await asyncio.sleep(0.1) # Small pause before looping for clarity in logs or UI updates
                 else: # This was the last batch
                     print(f"All {app_state.batch_total_runs} batches have been processed.")
@@ -447,9 +630,11 @@ class ApplicationRunner:
             if not self.safety_halt_active:
                 await self.eqpt_manager.stop_equipment()
             print("Batch orchestrator loop has fully stopped.")
+            self.gui_manager.batches_finished() # Headless runs end here; the GUI window stays open
 
     async def task_monitor(self):
         tasks_for_current_batch = []
+        equipment_op_tasks = []
         all_batch_tasks_started = False
         essential_tasks_completed_naturally = False # New flag
 
@@ -461,21 +646,23 @@ class ApplicationRunner:
                 if self.safety_halt_active:
                     app_state.set_system_stable(False)
                     print(f"TaskMonitor for Batch {app_state.batch_current_run}: Safety halt detected.")
-                    if app_state.is_running(): app_state.stop()
+                    app_state.halt()
                     # The 'else' block below will handle cleanup and return.
 
                 if app_state.is_running():
                     if not all_batch_tasks_started:
                         print(f"TaskMonitor: Starting tasks for Batch {app_state.batch_current_run}")
-                        self.gui_manager.reset_progress_marker_start_time()
-                        # Create tasks for equipment, GUI updates, data manager, time limit
+                        self.batch_start_time = time.time() - self.batch_elapsed_offset
+                        self.gui_manager.reset_progress_marker_start_time(self.batch_elapsed_offset)
+                        # Create tasks for equipment, data manager, time limit; the GUI thread draws on its own
                         equipment_op_tasks = [self.loop.create_task(eqpt.start()) for eqpt in self.eqpt_manager.equipment_list]
                         # Store all tasks that define the batch's activity
                         tasks_for_current_batch.extend(equipment_op_tasks)
-                        tasks_for_current_batch.append(self.loop.create_task(self.gui_manager.live_plot_updater()))
-                        tasks_for_current_batch.append(self.loop.create_task(self.gui_manager.update_progress_marker()))
                         tasks_for_current_batch.append(self.loop.create_task(self.data_manager.periodically_update_dataframe()))
                         tasks_for_current_batch.append(self.loop.create_task(self.overall_time_limit_reached()))
+                        if self.checkpoint_manager.enabled:
+                            tasks_for_current_batch.append(self.loop.create_task(
+                                self.checkpoint_manager.periodically_save(self.build_checkpoint, self.data_manager)))
                         all_batch_tasks_started = True
                         app_state.set_system_stable(True)
                         essential_tasks_completed_naturally = False # Reset for current batch
@@ -498,11 +685,13 @@ class ApplicationRunner:
                             if all_essential_done:
                                 print(f"TaskMonitor: All essential equipment tasks for Batch {app_state.batch_current_run} completed naturally.")
                                 essential_tasks_completed_naturally = True
+                                self.batch_completed = True
                                 if app_state.is_running(): # If batch was still considered running
                                     print(f"TaskMonitor: Signaling natural end of Batch {app_state.batch_current_run} by calling app_state.stop().")
                                     app_state.stop() # This is the key change!
                                 # Now, in the next iteration, app_state.is_running() will be false,
                                 # leading to the 'else' block for cleanup and return.
+                                continue # Straight there: waiting below would wait for a change that already happened
                 else: # app_state is not running (batch ended by natural completion, user stop, time limit, or safety)
                     app_state.set_system_stable(False)
                     print(f"TaskMonitor: app_state is NOT running for Batch {app_state.batch_current_run}. Proceeding to cleanup.")
@@ -528,11 +717,18 @@ class ApplicationRunner:
                         except Exception as e_cleanup:
                             print(f"TaskMonitor: Error during task cleanup for Batch {app_state.batch_current_run}: {e_cleanup}")
                     
+                    app_state.finish_stop() # STOPPING -> IDLE, HALTED stays HALTED
                     # CRITICAL: task_monitor must exit now that this batch's lifecycle is complete.
                     print(f"TaskMonitor for Batch {app_state.batch_current_run} is returning (exiting its execution).")
                     return # This allows `await monitor_task_for_this_batch` in orchestrator to complete.
 
-                await asyncio.sleep(0.2) # Polling interval
+                # Sleep until the state changes or an equipment task ends, instead of polling
+                pending = [task for task in equipment_op_tasks if not task.done()] if all_batch_tasks_started else []
+                state_change = self.loop.create_task(app_state.wait_for_change())
+                try:
+                    await asyncio.wait(pending + [state_change], return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    state_change.cancel()
         except asyncio.CancelledError:
             app_state.set_system_stable(False)
             print(f"Task monitor for Batch {app_state.batch_current_run} was CANCELLED externally.")
@@ -556,6 +752,7 @@ class ApplicationRunner:
                 except Exception as e_final_cleanup:
                     print(f"TaskMonitor (finally): Error during final cleanup for batch {app_state.batch_current_run}: {e_final_cleanup}")
             tasks_for_current_batch.clear() # Ensure it's cleared
+            app_state.finish_stop()
             all_batch_tasks_started = False # Reset for any potential (though unlikely) re-entry
             essential_tasks_completed_naturally = False
             print(f"Task monitor for batch {app_state.batch_current_run} has finished execution and cleaned up.")
@@ -567,9 +764,11 @@ class ApplicationRunner:
             # If it's from a nested dict: time_limit = time_limit_config.get('value', 86400)
             time_limit = int(time_limit_config)
             
-            await asyncio.sleep(time_limit) 
+            # A resumed batch has already used part of its time budget
+            await app_state.sleep(max(0, time_limit - self.batch_elapsed_offset)) 
             if app_state.is_running() and not self.safety_halt_active: # Check if batch is still relevant
                 print(f"Overall time limit for Batch {app_state.batch_current_run} reached. Stopping batch...")
+                self.batch_completed = True
                 self.gui_manager.start_stop_action("Stop") # This will set app_state.is_running() to False
         except asyncio.CancelledError:
             print(f"Overall time limit task for Batch {app_state.batch_current_run} cancelled.")
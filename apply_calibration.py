@@ -22,6 +22,10 @@ for channel in channels_to_calibrate:
     channel_key = f'Channel_{channel}'
     
     if channel_key in calibration_data:
+        if 'poly' in calibration_data[channel_key]:
+            # The DAQ scaling is gain and offset only
+            raise ValueError(f"{channel_key} has a polynomial calibration, which cannot be set in the DAQ. "
+                             "Use the live calibration stage (config 'calibration:') instead.")
         m = calibration_data[channel_key]['m']  # slope (gain)
         b = calibration_data[channel_key]['b']  # intercept (offset)
         
@@ -0,0 +1,113 @@
+# In burst_stats.py
+import os
+import numpy as np
+import pandas as pd
+from clock import clock
+
+class _Burst:
+    # Running statistics of one recording burst: Welford mean/M2 per channel, nan readings skipped
+    def __init__(self, index, name, setpoints, start_ns):
+        self.index = index
+        self.name = name
+        self.setpoints = dict(setpoints)
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.channels = {} # channel -> position in the arrays
+        self._positions = {} # channels tuple of a block -> index array, blocks repeat the same tuple
+        self.count = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.vmin = np.zeros(0)
+        self.vmax = np.zeros(0)
+        self.last_ns = start_ns
+
+    def _positions_for(self, channels):
+        positions = self._positions.get(channels)
+        if positions is None:
+            new = [channel for channel in channels if channel not in self.channels]
+            for channel in new:
+                self.channels[channel] = len(self.channels)
+            if new:
+                grow = len(new)
+                self.count = np.append(self.count, np.zeros(grow))
+                self.mean = np.append(self.mean, np.zeros(grow))
+                self.m2 = np.append(self.m2, np.zeros(grow))
+                self.vmin = np.append(self.vmin, np.full(grow, np.inf))
+                self.vmax = np.append(self.vmax, np.full(grow, -np.inf))
+            positions = self._positions[channels] = np.array([self.channels[c] for c in channels])
+        return positions
+
+    def add(self, block):
+        positions = self._positions_for(block.channels)
+        values = block.values
+        valid = ~np.isnan(values)
+        positions, values = positions[valid], values[valid]
+        # Channels appear once per block, so the fancy-indexed updates below do not collide
+        self.count[positions] += 1
+        delta = values - self.mean[positions]
+        self.mean[positions] += delta / self.count[positions]
+        self.m2[positions] += delta * (values - self.mean[positions])
+        self.vmin[positions] = np.minimum(self.vmin[positions], values)
+        self.vmax[positions] = np.maximum(self.vmax[positions], values)
+        self.last_ns = block.timestamp
+
+    def rows(self):
+        end_ns = self.end_ns if self.end_ns is not None else self.last_ns
+        for channel, position in self.channels.items():
+            count = int(self.count[position])
+            row = {'Burst': self.index, 'Name': self.name, 'Channel': channel,
+                   'Start': self.start_ns, 'End': end_ns, 'Count': count,
+                   'Mean': self.mean[position] if count else np.nan,
+                   'Std': np.sqrt(self.m2[position] / (count - 1)) if count > 1 else np.nan, # Sample std, as pandas
+                   'Min': self.vmin[position] if count else np.nan,
+                   'Max': self.vmax[position] if count else np.nan}
+            row.update({f"Setpoint_{name}": value for name, value in self.setpoints.items()})
+            yield row
+
+class BurstStatistics:
+    """Per-burst, per-channel statistics maintained while the data is recorded.
+
+    A DAQ driver calls begin(name) and end(name) around each read_channels burst; every
+    recorded block of that instrument in between updates the running mean, std, min
+    and max. Each burst is tagged with the setpoints active when it started, so the
+    summary replaces the steady-state pass over the raw CSV."""
+    def __init__(self, setpoint_source=None):
+        self.setpoint_source = setpoint_source # Callable returning {equipment name: current setpoint}
+        self.bursts = []
+        self.active = {} # instrument name -> open _Burst
+
+    def begin(self, name):
+        self.end(name) # A burst that was never closed (cancelled read) ends where the next begins
+        setpoints = self.setpoint_source() if self.setpoint_source else {}
+        burst = _Burst(len(self.bursts), name, setpoints, clock.now_ns())
+        self.bursts.append(burst)
+        self.active[name] = burst
+
+    def end(self, name):
+        burst = self.active.pop(name, None)
+        if burst is not None:
+            burst.end_ns = burst.last_ns
+
+    def add(self, blocks):
+        for block in blocks:
+            burst = self.active.get(block.name)
+            if burst is not None and block.record:
+                burst.add(block)
+
+    def clear(self):
+        self.bursts = []
+        self.active = {}
+
+    def table(self):
+        # One row per burst and channel, times as local datetimes like the raw CSV
+        rows = [row for burst in self.bursts for row in burst.rows()]
+        if not rows:
+            return pd.DataFrame()
+        frame = pd.DataFrame(rows)
+        frame['Start'] = clock.to_datetime(frame['Start']).astype('datetime64[us]')
+        frame['End'] = clock.to_datetime(frame['End']).astype('datetime64[us]')
+        return frame.set_index('Burst')
+
+def summary_path_for(file_path):
+    root, ext = os.path.splitext(file_path)
+    return f"{root}_summary{ext}"
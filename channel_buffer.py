@@ -0,0 +1,40 @@
+# In channel_buffer.py
+import numpy as np
+
+class ChannelRingBuffer:
+    """Fixed-size ring of (x, y) samples for one channel, preallocated once.
+
+    Every sample is written twice (at i and i + capacity) so the newest 'capacity'
+    samples are always one contiguous slice: view() returns it without copying.
+    'seq' counts appended samples and tells readers whether anything changed."""
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self._x = np.zeros(2 * capacity)
+        self._y = np.zeros(2 * capacity)
+        self._next = 0 # Slot of the next write, in [0, capacity)
+        self.count = 0
+        self.seq = 0
+
+    def append(self, x, y):
+        i = self._next
+        self._x[i] = self._x[i + self.capacity] = x
+        self._y[i] = self._y[i + self.capacity] = y
+        self._next = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.seq += 1
+
+    def view(self):
+        # Oldest to newest, contiguous (zero-copy) slices of the preallocated arrays
+        start = self._next + self.capacity - self.count
+        return self._x[start:start + self.count], self._y[start:start + self.count]
+
+    def latest(self):
+        if not self.count:
+            return None
+        i = (self._next - 1) % self.capacity
+        return self._x[i], self._y[i]
+
+    def clear(self):
+        self._next = 0
+        self.count = 0
+        self.seq += 1
@@ -0,0 +1,49 @@
+# In channel_groups.py
+from equipment.equipment import expand_ranges
+
+OTHER_GROUP_NAME = "Other"
+
+def channel_names(spec):
+    """Channel names from a config entry: "101:105, 108" -> ["Channel_101", ..., "Channel_108"].
+
+    Entries that are not DAQ channel numbers (e.g. "Power") are used as given."""
+    items = spec if isinstance(spec, list) else [spec]
+    names = []
+    for item in items:
+        try:
+            names.extend(f"Channel_{number}" for number in expand_ranges(str(item)))
+        except ValueError:
+            names.append(str(item).strip())
+    return names
+
+class ChannelGroup:
+    # Channels sharing a unit, drawn together in one subplot of the live plot
+    def __init__(self, index, name, channels=None, y_label=None, visible=True):
+        self.index = index
+        self.name = name
+        self.channels = set(channels) if channels is not None else None # None: every channel not in another group
+        self.y_label = y_label or name
+        self.visible = visible
+        self.plot_tag = f"live_plot_{index}"
+        self.x_axis_tag = f"live_x_axis_{index}"
+        self.y_axis_tag = f"live_y_axis_{index}"
+        self.toggle_tag = f"live_group_toggle_{index}"
+
+def load_channel_groups(config):
+    """Groups from the 'live_plot: groups:' config section, plus a catch-all group.
+
+    Without configured groups, every channel goes into a single plot as before."""
+    groups = []
+    for group_cfg in config.get('live_plot', {}).get('groups', []) or []:
+        groups.append(ChannelGroup(len(groups), group_cfg.get('name', f"Group {len(groups) + 1}"),
+                                   channel_names(group_cfg.get('channels', [])),
+                                   group_cfg.get('y_label'), group_cfg.get('visible', True)))
+    groups.append(ChannelGroup(len(groups), OTHER_GROUP_NAME if groups else "Data"))
+    return groups
+
+def display_channels(config):
+    # Channels the idle monitor shows between batches; None means all of them
+    channel_ids = config.get('idle_monitoring', {}).get('display_channel_ids')
+    if not channel_ids:
+        return None
+    return set(channel_names([str(channel_id) for channel_id in channel_ids]))
@@ -0,0 +1,151 @@
+# In channel_history.py
+import numpy as np
+from channel_buffer import ChannelRingBuffer
+
+class EnvelopeLevel:
+    """Min/max envelope of a channel at one resolution: one bucket per 'span' raw samples.
+
+    Arrays grow by doubling, so appending is amortised O(1) and the whole run stays
+    available at this resolution."""
+    def __init__(self, span, initial_capacity=256):
+        self.span = span
+        self.t = np.empty(initial_capacity) # Bucket start time
+        self.vmin = np.empty(initial_capacity)
+        self.vmax = np.empty(initial_capacity)
+        self.size = 0
+
+    def append(self, t, vmin, vmax):
+        if self.size == self.t.size:
+            for name in ('t', 'vmin', 'vmax'):
+                grown = np.empty(self.size * 2)
+                grown[:self.size] = getattr(self, name)
+                setattr(self, name, grown)
+        self.t[self.size] = t
+        self.vmin[self.size] = vmin
+        self.vmax[self.size] = vmax
+        self.size += 1
+
+class _PendingBucket:
+    # Bucket of a level that is still being filled
+    __slots__ = ('t', 'vmin', 'vmax', 'count')
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, t, vmin, vmax):
+        if self.count == 0:
+            self.t, self.vmin, self.vmax = t, vmin, vmax
+        else:
+            # nan readings must not poison the envelope
+            self.vmin = np.fmin(self.vmin, vmin)
+            self.vmax = np.fmax(self.vmax, vmax)
+        self.count += 1
+
+class ChannelHistory:
+    """Full-run history of one channel, maintained incrementally at several resolutions.
+
+    Level 0 is the raw recent window (a ring buffer); level k >= 1 keeps the min/max
+    envelope of factor**k consecutive samples for the whole run. query() picks the
+    finest level that fits the requested pixel budget, so rendering cost stays
+    constant however long the run gets."""
+    def __init__(self, raw_capacity=2048, factor=8, levels=5):
+        self.raw = ChannelRingBuffer(raw_capacity)
+        self.factor = factor
+        self.levels = [EnvelopeLevel(factor ** k) for k in range(1, levels + 1)]
+        self._pending = [_PendingBucket() for _ in self.levels]
+        self.first_t = None
+        self.seq = 0
+
+    def append(self, t, value):
+        if self.first_t is None:
+            self.first_t = t
+        self.raw.append(t, value)
+        self.seq += 1
+        bucket_t, vmin, vmax = t, value, value
+        # Carry completed buckets up the levels
+        for level, pending in zip(self.levels, self._pending):
+            pending.add(bucket_t, vmin, vmax)
+            if pending.count < self.factor:
+                break
+            level.append(pending.t, pending.vmin, pending.vmax)
+            bucket_t, vmin, vmax = pending.t, pending.vmin, pending.vmax
+            pending.count = 0
+
+    def latest(self):
+        return self.raw.latest()
+
+    def nbytes(self):
+        # Allocated array memory: raw window plus envelopes (reported in the memory stats)
+        return self.raw._x.nbytes + self.raw._y.nbytes + sum(level.t.nbytes * 3 for level in self.levels)
+
+    def clear(self):
+        self.__init__(self.raw.capacity, self.factor, len(self.levels))
+
+    def _raw_covers(self, x_min):
+        if self.raw.count < self.raw.capacity:
+            return True # Nothing has been dropped from the raw window yet
+        x, _ = self.raw.view()
+        return x_min is not None and x[0] <= x_min
+
+    def _tail(self, index):
+        # Newest samples not yet in a completed bucket of level 'index': the pending buckets of that
+        # level and of every finer one. They follow each other and hold less than one bucket span
+        # together, so they are merged into one bucket starting at the oldest of them.
+        buckets = [pending for pending in self._pending[:index + 1] if pending.count]
+        if not buckets:
+            return None
+        return (buckets[-1].t, np.fmin.reduce([bucket.vmin for bucket in buckets]),
+                np.fmax.reduce([bucket.vmax for bucket in buckets]))
+
+    def query(self, x_min=None, x_max=None, max_points=2000):
+        """(x, y, level) for the range [x_min, x_max] with at most about max_points points.
+
+        level 0 returns raw samples; higher levels return the envelope as alternating
+        min/max points per bucket."""
+        x, y = self.raw.view()
+        if self._raw_covers(x_min):
+            lo = 0 if x_min is None else int(np.searchsorted(x, x_min, side='left'))
+            hi = x.size if x_max is None else int(np.searchsorted(x, x_max, side='right'))
+            if hi - lo <= max_points:
+                return x[lo:hi], y[lo:hi], 0
+
+        for index, level in enumerate(self.levels):
+            t = level.t[:level.size]
+            lo = 0 if x_min is None else max(0, int(np.searchsorted(t, x_min, side='right')) - 1)
+            hi = level.size if x_max is None else int(np.searchsorted(t, x_max, side='right'))
+            if 2 * (hi - lo + 1) <= max_points or index == len(self.levels) - 1:
+                bt, bmin, bmax = t[lo:hi], level.vmin[lo:hi], level.vmax[lo:hi]
+                tail = self._tail(index)
+                if tail is not None and (x_max is None or tail[0] <= x_max):
+                    # Include the samples still being collected so the newest data is visible
+                    bt = np.append(bt, tail[0])
+                    bmin = np.append(bmin, tail[1])
+                    bmax = np.append(bmax, tail[2])
+                ex = np.repeat(bt, 2)
+                ey = np.column_stack((bmin, bmax)).ravel()
+                return ex, ey, index + 1
+        return np.empty(0), np.empty(0), 0
+
+    def since(self, t_after=None, max_points=500):
+        """(x, y) of the samples newer than t_after, for incremental streaming.
+
+        More than max_points samples are reduced to min/max pairs per bucket; a reader
+        that fell behind the raw window gets the envelope instead."""
+        x, y = self.raw.view()
+        if not self._raw_covers(t_after):
+            ex, ey, _ = self.query(t_after, None, max_points)
+            if t_after is None:
+                return ex, ey # A new reader starts with the whole run
+            # A bucket counts as new if it ends after t_after, not only if it starts after it: the one
+            # that straddles t_after is kept, stamped just after t_after so the reader's position advances
+            starts = ex[::2]
+            newer = np.repeat(np.append(starts[1:], np.inf) > t_after, 2)
+            return np.maximum(ex[newer], np.nextafter(t_after, np.inf)), ey[newer]
+        lo = 0 if t_after is None else int(np.searchsorted(x, t_after, side='right'))
+        x, y = x[lo:], y[lo:]
+        if x.size <= max_points:
+            return x, y
+        starts = np.linspace(0, x.size, max(1, max_points // 2), endpoint=False).astype(int)
+        ex = np.repeat(x[starts], 2)
+        ey = np.column_stack((np.fmin.reduceat(y, starts), np.fmax.reduceat(y, starts))).ravel()
+        return ex, ey
@@ -0,0 +1,61 @@
+# In checkpoint.py
+import asyncio
+import json
+import os
+from datetime import datetime
+from state import app_state
+
+class CheckpointManager:
+    """Periodically persists the position of the running batch so it can be resumed."""
+    def __init__(self, config):
+        checkpoint_config = config.get('checkpoint', {})
+        self.enabled = checkpoint_config.get('enabled', False)
+        self.path = checkpoint_config.get('path', os.path.join('data', 'checkpoint.json'))
+        self.interval = checkpoint_config.get('interval_seconds', 60)
+        self.generation = 0 # Incremented on every save or clear, tells a deferred update whether it is stale
+
+    def save(self, checkpoint):
+        self.generation += 1
+        checkpoint = dict(checkpoint, saved_at=datetime.now().isoformat())
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(checkpoint, f, indent=2)
+            os.replace(tmp_path, self.path) # Atomic, a crash never leaves a half-written checkpoint
+        except Exception as e:
+            print(f"Checkpoint: Error writing {self.path}: {e}")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            print(f"Checkpoint: No checkpoint found at {self.path}.")
+            return None
+        try:
+            with open(self.path, 'r') as f:
+                checkpoint = json.load(f)
+        except Exception as e:
+            print(f"Checkpoint: Error reading {self.path}: {e}")
+            return None
+        print(f"Checkpoint: Loaded checkpoint of batch {checkpoint.get('batch_current_run')} saved at {checkpoint.get('saved_at')}.")
+        return checkpoint
+
+    def clear(self):
+        self.generation += 1
+        if os.path.exists(self.path):
+            os.remove(self.path)
+            print(f"Checkpoint: {self.path} cleared.")
+
+    async def periodically_save(self, build_checkpoint, data_manager):
+        # build_checkpoint is a callable returning the checkpoint dict of the running batch
+        try:
+            while app_state.is_running():
+                if not await app_state.sleep(self.interval): break
+                await data_manager.flush_partial()
+                self.save(build_checkpoint())
+        except asyncio.CancelledError:
+            print("Periodic checkpoint cancelled.")
+            raise
+        finally:
+            print("Periodic checkpoint finished.")
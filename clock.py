@@ -0,0 +1,78 @@
+# In clock.py
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+UTC_OFFSET_ATTR = 'utc_offset_ns' # attrs entry of a frozen batch frame: the UTC offset of its batch
+
+class SampleClock:
+    """Sample timestamps as int64 nanoseconds since the UTC epoch, from a monotonic clock.
+
+    The monotonic clock is anchored to wall time once per batch (anchor()), so NTP or
+    manual clock changes during a batch cannot make timestamps jump or go backwards.
+    Everything in the program, including the API, the plot histories and the shared
+    export, uses UTC time. Only the CSV files have local datetimes, converted with the
+    UTC offset taken at the anchor, so it stays fixed for the whole batch. The plots show
+    local time through their axes (use_local_time)."""
+    def __init__(self):
+        self.anchor()
+
+    def anchor(self):
+        self.wall_ns = time.time_ns()
+        self.monotonic_ns = time.monotonic_ns()
+        self.utc_offset_ns = int(datetime.now().astimezone().utcoffset().total_seconds()) * 1_000_000_000
+
+    def now_ns(self):
+        return self.wall_ns + (time.monotonic_ns() - self.monotonic_ns)
+
+    def to_datetime(self, ns, utc_offset_ns=None):
+        # int64 ns (scalar, array or Series) -> naive local datetime64, as written to the CSV files.
+        # utc_offset_ns: the offset of the batch the data belongs to (default: the current batch)
+        offset = self.utc_offset_ns if utc_offset_ns is None else utc_offset_ns
+        if isinstance(ns, pd.Series):
+            return pd.to_datetime(ns.to_numpy(dtype=np.int64) + offset, unit='ns')
+        return pd.to_datetime(np.asarray(ns, dtype=np.int64) + offset, unit='ns')
+
+    def from_datetime(self, values):
+        # Naive local datetimes (or strings, e.g. read back from a CSV) -> int64 ns
+        values = pd.to_datetime(values)
+        if isinstance(values, pd.Timestamp):
+            return values.value - self.utc_offset_ns
+        return np.asarray(values, dtype='datetime64[ns]').astype(np.int64) - self.utc_offset_ns
+
+def freeze_offset(frame):
+    # Record the current batch's UTC offset on a frame written later (background save),
+    # when the clock may already be anchored for the next batch
+    frame.attrs[UTC_OFFSET_ATTR] = clock.utc_offset_ns
+    return frame
+
+def utc_offset_of(frame):
+    # Offset recorded on a frozen frame (or SpilledBatch), else the current batch's
+    offset = getattr(frame, UTC_OFFSET_ATTR, None)
+    if offset is None:
+        offset = getattr(frame, 'attrs', {}).get(UTC_OFFSET_ATTR)
+    return clock.utc_offset_ns if offset is None else offset
+
+def with_datetimes(frame, column='Timestamp', utc_offset_ns=None):
+    # Copy of an export-bound frame with its int64 ns column converted to local datetimes
+    if column not in frame.columns or not pd.api.types.is_integer_dtype(frame[column]):
+        return frame
+    offset = utc_offset_of(frame) if utc_offset_ns is None else utc_offset_ns
+    # Microseconds, the resolution the CSV files have always had
+    return frame.assign(**{column: clock.to_datetime(frame[column], offset).to_numpy().astype('datetime64[us]')})
+
+def local_to_epoch_ns(values):
+    """Naive local datetimes of saved files (any batch, any date) -> int64 ns since the UTC epoch.
+
+    Uses the time zone rules in force at each time (daylight saving), not the offset of the
+    current batch. Slow per value: convert decimated data, not whole runs."""
+    index = pd.DatetimeIndex(pd.to_datetime(values)).as_unit('ns')
+    try:
+        aware = index.tz_localize(tzlocal(), ambiguous='infer', nonexistent='shift_forward')
+    except ValueError: # Repeated hour at the end of daylight saving that cannot be inferred: take the first
+        aware = index.tz_localize(tzlocal(), ambiguous=np.ones(len(index), dtype=bool), nonexistent='shift_forward')
+    return aware.asi8
+
+clock = SampleClock()
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+## Cached, parallel batch processing of a data folder for the results_process*.py scripts.
+## Each input file is processed in a worker process. Its outputs are reused as long as the
+## input file, the calibration file and the processing code are unchanged, so re-running a
+## folder only processes new or changed files.
+
+CACHE_FILE = '.batch_cache.json'
+SKIPPED_SUFFIXES = ('_summary.csv', '.partial.csv') # Burst summaries and unfinished batches, not runs
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def combined_hash(paths):
+    # One hash for several files (calibration JSON, processing code); missing files count as empty
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        digest.update(file_hash(path).encode() if path and os.path.exists(path) else b'-')
+    return digest.hexdigest()
+
+def load_cache(output_folder):
+    try:
+        with open(os.path.join(output_folder, CACHE_FILE), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_cache(output_folder, cache):
+    path = os.path.join(output_folder, CACHE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=4)
+    os.replace(tmp_path, path)
+
+def input_hash(path, entry):
+    # Hashing a multi-hundred-MB file takes a while: reuse the stored hash if size and mtime match
+    stat = os.stat(path)
+    if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        return entry['input_hash'], stat
+    return file_hash(path), stat
+
+def _run_one(process_file, file_path, calibration_path, output_folder):
+    calibration_coeffs = {}
+    if calibration_path and os.path.exists(calibration_path):
+        with open(calibration_path, 'r') as f:
+            calibration_coeffs = json.load(f)
+    return process_file(file_path, calibration_coeffs, output_folder)
+
+def find_collisions(filenames, output_name):
+    # {output name: [input files]} for outputs that more than one input would write
+    writers = {}
+    for filename in filenames:
+        writers.setdefault(output_name(filename), []).append(filename)
+    return {name: inputs for name, inputs in writers.items() if len(inputs) > 1}
+
+def run_folder(process_file, input_folder, output_folder, calibration_path=None, code_files=(),
+               extension='.csv', workers=None, force=False, output_name=None):
+    """Run process_file(file_path, calibration_coeffs, output_folder) -> [output paths] on every
+    file of input_folder that is new or changed since the last run.
+
+    process_file must be a module-level function (it is sent to the worker processes).
+    code_files are the source files whose changes invalidate all cached outputs, e.g. the
+    calling script and steady_states.py. output_name(file name) gives the output file name
+    when it is known up front: inputs that would write the same output are reported and
+    skipped, instead of overwriting each other from parallel workers.
+    Returns {file name: [output paths]} for all files."""
+    os.makedirs(output_folder, exist_ok=True)
+    cache = {} if force else load_cache(output_folder)
+    shared_key = combined_hash([calibration_path] if calibration_path else []) + \
+        combined_hash(list(code_files) + [os.path.abspath(__file__)])
+
+    filenames = [name for name in sorted(os.listdir(input_folder))
+                 if name.endswith(extension) and not name.endswith(SKIPPED_SUFFIXES)]
+    if output_name is not None:
+        for name, inputs in find_collisions(filenames, output_name).items():
+            print(f"Error: {', '.join(inputs)} all write {name}; skipped, rename them so each has its own output.")
+            filenames = [filename for filename in filenames if filename not in inputs]
+
+    outputs, pending = {}, {}
+    for filename in filenames:
+        file_path = os.path.join(input_folder, filename)
+        entry = cache.get(filename)
+        digest, stat = input_hash(file_path, entry)
+        if entry and entry.get('input_hash') == digest and entry.get('shared_key') == shared_key \
+                and all(os.path.exists(path) for path in entry.get('outputs', [])):
+            outputs[filename] = entry['outputs']
+            cache[filename].update(size=stat.st_size, mtime_ns=stat.st_mtime_ns) # e.g. touched, same content
+            continue
+        pending[filename] = (file_path, digest, stat)
+
+    print(f"{len(outputs)} files unchanged, {len(pending)} to process.")
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_run_one, process_file, file_path, calibration_path, output_folder): filename
+                       for filename, (file_path, _, _) in pending.items()}
+            for future in as_completed(futures):
+                filename = futures[future]
+                _, digest, stat = pending[filename]
+                try:
+                    outputs[filename] = list(future.result())
+                except Exception as e:
+                    print(f"Error processing {filename}: {e}")
+                    cache.pop(filename, None)
+                    continue
+                cache[filename] = {'input_hash': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                   'shared_key': shared_key, 'outputs': outputs[filename]}
+                save_cache(output_folder, cache) # After every file, so an interrupted run keeps its progress
+                print(f"Finished processing {filename}")
+
+    # Files that were removed from the input folder are forgotten
+    for filename in set(cache) - set(outputs):
+        del cache[filename]
+    save_cache(output_folder, cache)
+    return outputs
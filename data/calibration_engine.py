@@ -0,0 +1,178 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from steady_states import segment_ids
+from run_files import load_run
+
+## Calibration engine shared by calibration.py and calibration2.py:
+## plateau detection, batched least-squares fits for all channels, plots in a process pool,
+## and an atomic merge into calibration_coefficients.json.
+
+def scan_matrix(df, channels=None):
+    # One row per scan (timestamp), one column per channel
+    if channels is not None:
+        df = df[df['Channel'].isin(channels)]
+    wide = df.pivot_table(index='Timestamp', columns='Channel', values='Data', aggfunc='mean', sort=True)
+    return wide[[c for c in channels if c in wide.columns]] if channels is not None else wide
+
+def find_plateaus(wide, n_plateaus, gap_seconds=10, window=5, tolerance=0.1, min_scans=5):
+    """Row ranges [start, stop) of the n_plateaus reference plateaus, in time order.
+
+    If the DAQ recorded only at the plateaus (gaps between bursts), the gaps are used.
+    Otherwise a plateau is a run of scans where the median over the channels changes by
+    less than 'tolerance' within 'window' scans; the n_plateaus longest runs are kept."""
+    times = wide.index.to_numpy()
+    segments = segment_ids(times, gap_seconds)
+    if segments.size and segments[-1] + 1 == n_plateaus:
+        bounds = np.flatnonzero(np.diff(segments)) + 1
+        starts = np.concatenate(([0], bounds))
+        stops = np.concatenate((bounds, [len(times)]))
+        return list(zip(starts, stops))
+
+    level = pd.Series(np.nanmedian(wide.to_numpy(), axis=1))
+    spread = level.rolling(window, center=True, min_periods=1).max() - level.rolling(window, center=True, min_periods=1).min()
+    stable = (spread <= tolerance).to_numpy()
+    # Runs of stable scans: boundaries where the mask flips
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], stable, [False])).astype(np.int8)))
+    runs = [(start, stop) for start, stop in zip(edges[::2], edges[1::2]) if stop - start >= min_scans]
+    if len(runs) < n_plateaus:
+        raise ValueError(f"Found {len(runs)} stable plateaus, expected {n_plateaus}. "
+                         f"Try a larger tolerance ({tolerance}) or a smaller min_scans ({min_scans}).")
+    longest = sorted(runs, key=lambda run: run[1] - run[0], reverse=True)[:n_plateaus]
+    return sorted(longest)
+
+def plateau_means(wide, plateaus, trim=0.1):
+    # Mean of every channel on every plateau, skipping the first and last 'trim' of each (settling)
+    means = []
+    for start, stop in plateaus:
+        skip = int((stop - start) * trim)
+        means.append(np.nanmean(wide.to_numpy()[start + skip:stop - skip], axis=0))
+    return pd.DataFrame(means, columns=wide.columns)
+
+def fit_channels(measured, references, degree=1):
+    """Least-squares fit reference = poly(measured) for all channels at once.
+
+    measured: DataFrame (plateaus x channels). Returns {channel: coefficients and residual stats}.
+    Channels with a nan plateau mean (failed readings) get nan coefficients, the others are
+    fitted as usual."""
+    x = measured.to_numpy(dtype=np.float64).T # channels x plateaus
+    y = np.asarray(references, dtype=np.float64)
+    finite = np.isfinite(x).all(axis=1)
+    for channel in measured.columns[~finite]:
+        print(f"Warning: {channel} has no reading on some reference points, it is not calibrated.")
+    coefficients = np.full((len(x), degree + 1), np.nan)
+    residuals = np.full(x.shape, np.nan)
+    if finite.any():
+        vander = x[finite, :, None] ** np.arange(degree + 1) # channels x plateaus x (degree + 1), ascending powers
+        coefficients[finite] = (np.linalg.pinv(vander) @ y[:, None])[:, :, 0] # One batched solve for every channel
+        residuals[finite] = y - (vander @ coefficients[finite, :, None])[:, :, 0]
+    ss_res = np.sum(residuals ** 2, axis=1)
+    ss_tot = np.sum((y - y.mean()) ** 2)
+    results = {}
+    for index, channel in enumerate(measured.columns):
+        entry = {"m": coefficients[index, 1], "b": coefficients[index, 0]} if degree == 1 \
+            else {"poly": coefficients[index].tolist()}
+        entry.update({"R2": 1 - ss_res[index] / ss_tot if ss_tot else np.nan,
+                      "RMSE": np.sqrt(ss_res[index] / len(y)),
+                      "max_residual": np.max(np.abs(residuals[index]))})
+        results[channel] = {key: (float(value) if not isinstance(value, list) else value) for key, value in entry.items()}
+    return results
+
+def plot_calibration(channel, measured, references, coefficients, output_dir):
+    # Runs in a worker process
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    poly = coefficients['poly'] if 'poly' in coefficients else [coefficients['b'], coefficients['m']]
+    x_line = np.linspace(min(measured), max(measured), 100)
+    y_line = np.polynomial.polynomial.polyval(x_line, poly)
+
+    plt.figure(figsize=(10, 6))
+    plt.scatter(measured, references, color='blue', label='Calibration Points')
+    plt.plot(x_line, y_line, color='red', label='Fitted Line')
+    plt.xlabel('Measured Value')
+    plt.ylabel('Reference Value')
+    plt.title(f'Calibration Plot for {channel}')
+    plt.legend(loc="lower right")
+    plt.grid(True)
+    if 'poly' in coefficients:
+        equation = 'y = ' + ' + '.join(f'{c:.4g}x^{i}' for i, c in enumerate(poly))
+    else:
+        equation = f"y = {coefficients['m']:.4f}x + {coefficients['b']:.4f}"
+    plt.text(0.05, 0.95, f"{equation}\nR² = {coefficients['R2']:.4f}, RMSE = {coefficients['RMSE']:.4g}",
+             transform=plt.gca().transAxes, verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+    path = os.path.join(output_dir, f'calibration_plot_{channel}.png')
+    plt.savefig(path)
+    plt.close()
+    return path
+
+def plot_all(measured, references, results, output_dir='.', workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    channels = list(results)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(plot_calibration, channels, [measured[c].tolist() for c in channels],
+                             [list(references)] * len(channels), [results[c] for c in channels],
+                             [output_dir] * len(channels)))
+
+def merge_coefficients(json_file, new_coefficients):
+    # Existing entries of other channels are kept; written to a temporary file and swapped in.
+    # Failed fits (nan coefficients) are left out, so they do not replace a previous calibration.
+    coefficients = {}
+    if os.path.exists(json_file):
+        with open(json_file, 'r') as f:
+            coefficients = json.load(f)
+    coefficients.update({channel: entry for channel, entry in new_coefficients.items()
+                         if np.all(np.isfinite(entry['poly'] if 'poly' in entry else [entry['m'], entry['b']]))})
+    tmp_path = f"{json_file}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(coefficients, f, indent=4)
+    os.replace(tmp_path, json_file) # The live calibration stage never sees a half-written file
+    return coefficients
+
+def calibrate_file(file_path, references, channels=None, degree=1, **plateau_options):
+    # All reference points in one file, in the order they were applied
+    wide = scan_matrix(load_run(file_path, channels), channels)
+    measured = plateau_means(wide, find_plateaus(wide, len(references), **plateau_options))
+    return measured, fit_channels(measured, references, degree)
+
+def calibrate_files(file_paths, channels=None, degree=1):
+    # One reference point per file, the value is the last '_' part of the file name (..._20.csv)
+    references, rows = [], []
+    for file_path in sorted(file_paths):
+        references.append(float(os.path.splitext(os.path.basename(file_path))[0].split('_')[-1]))
+        rows.append(scan_matrix(load_run(file_path, channels), channels).mean())
+    measured = pd.DataFrame(rows).reset_index(drop=True)
+    return references, measured, fit_channels(measured, references, degree)
+
+def print_coefficients(results):
+    print("\nFinal Calibration Coefficients and residuals:")
+    for channel, coeff in results.items():
+        fit = f"m = {coeff['m']:.6f}, b = {coeff['b']:.6f}" if 'm' in coeff else f"poly = {coeff['poly']}"
+        print(f"{channel}: {fit}, R² = {coeff['R2']:.6f}, RMSE = {coeff['RMSE']:.4g}, max residual = {coeff['max_residual']:.4g}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit calibration coefficients for all channels at once.")
+    parser.add_argument('files', nargs='+', help="Calibration CSV file(s) written by the acquisition.")
+    parser.add_argument('--references', type=float, nargs='+',
+                        help="Reference values in the order they were applied (one file). Without it, one file per reference point.")
+    parser.add_argument('--channels', nargs='+', help="Channels to calibrate (default: all in the file).")
+    parser.add_argument('--degree', type=int, default=1, help="1 for m*x + b, higher for a polynomial.")
+    parser.add_argument('--json', default=os.path.join('data', 'calibration_coefficients.json'))
+    parser.add_argument('--plots', default='.', help="Directory for the calibration plots.")
+    parser.add_argument('--workers', type=int, default=None, help="Plot processes (default: one per CPU).")
+    args = parser.parse_args()
+
+    if args.references:
+        references = args.references
+        measured, results = calibrate_file(args.files[0], references, args.channels, args.degree)
+    else:
+        references, measured, results = calibrate_files(args.files, args.channels, args.degree)
+    merge_coefficients(args.json, results)
+    print(f"Calibration coefficients have been saved to '{args.json}'")
+    print_coefficients(results)
+    plot_all(measured, references, results, args.plots, args.workers)
+    print(f"\nCalibration plots have been saved in '{args.plots}'")
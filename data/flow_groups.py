@@ -0,0 +1,78 @@
+import numpy as np
+
+## Exact grouping of 1-D setpoint data (flow rates, powers) for the plotting scripts.
+## Measured values scatter around a few nominal setpoints; the groups are found either from
+## the gaps in the sorted values or by optimal 1-D k-means (dynamic programming, the same
+## result on every run), and values are assigned to the nearest center with searchsorted.
+
+def split_by_gaps(values, k=None, min_gap=None):
+    """Group centers from the gaps of the sorted values.
+
+    k: split at the k - 1 largest gaps; min_gap: split at every gap larger than it.
+    Exact whenever the groups do not overlap, which is the case for setpoints."""
+    x = np.sort(np.asarray(values, dtype=np.float64))
+    x = x[~np.isnan(x)]
+    if x.size == 0:
+        return np.empty(0)
+    gaps = np.diff(x)
+    if k is not None:
+        cuts = np.sort(np.argsort(gaps)[::-1][:max(0, min(k, x.size) - 1)]) + 1
+    else:
+        cuts = np.flatnonzero(gaps > (min_gap or 0)) + 1
+    starts = np.r_[0, cuts]
+    return np.add.reduceat(x, starts) / np.diff(np.r_[starts, x.size])
+
+def kmeans_1d(values, k):
+    """Optimal 1-D k-means centers (minimum within-group sum of squares), sorted.
+
+    Dynamic programming over the sorted values with prefix sums: O(k n²) work done as
+    O(k n) vector operations, no random initialisation."""
+    x = np.sort(np.asarray(values, dtype=np.float64))
+    x = x[~np.isnan(x)]
+    n = x.size
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0)
+    s1 = np.r_[0.0, np.cumsum(x)]
+    s2 = np.r_[0.0, np.cumsum(x * x)]
+
+    def sse(first, last):
+        # Within-group sum of squares of x[first..last] (inclusive), first may be an array
+        count = last - first + 1
+        total = s1[last + 1] - s1[first]
+        return s2[last + 1] - s2[first] - total * total / count
+
+    cost = sse(np.zeros(n, dtype=int), np.arange(n)) # One group: x[0..i]
+    starts = np.zeros((k, n), dtype=int) # First index of the last group, for backtracking
+    for group in range(1, k):
+        new_cost = np.full(n, np.inf)
+        for last in range(group, n):
+            first = np.arange(group, last + 1) # The last group is x[first..last]
+            candidates = cost[first - 1] + sse(first, last)
+            best = int(np.argmin(candidates))
+            new_cost[last] = candidates[best]
+            starts[group, last] = first[best]
+        cost = new_cost
+
+    centers = np.empty(k)
+    last = n - 1
+    for group in range(k - 1, -1, -1):
+        first = starts[group, last] if group else 0
+        centers[group] = (s1[last + 1] - s1[first]) / (last - first + 1)
+        last = first - 1
+    return centers
+
+def assign_groups(values, centers, tolerance=None):
+    """Nearest center of every value (NaN if farther than tolerance), vectorised.
+
+    The midpoints between sorted centers are the group boundaries, so one searchsorted
+    assigns all values."""
+    values = np.asarray(values, dtype=np.float64)
+    centers = np.sort(np.asarray(centers, dtype=np.float64))
+    if centers.size == 0:
+        return np.full(values.shape, np.nan)
+    index = np.searchsorted((centers[1:] + centers[:-1]) / 2, values)
+    nearest = centers[index]
+    if tolerance is not None:
+        nearest = np.where(np.abs(values - nearest) <= tolerance, nearest, np.nan)
+    return np.where(np.isnan(values), np.nan, nearest)
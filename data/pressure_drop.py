@@ -0,0 +1,219 @@
+import os
+import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from flow_groups import split_by_gaps, assign_groups
+
+## Pressure-drop and friction-factor engine for the cold plate tests, shared by results_plot_pipe4.py.
+## Inlet and outlet pressure are fitted against flow rate (quadratic) for the pipe test and for
+## every cold plate configuration in one batched least-squares solve; the pressure drops and
+## friction factors of all configurations are then evaluated on one flow grid as arrays.
+## Figures are rendered headless in a process pool.
+
+COLD_PLATE_COLUMNS = ('Actual_Flow_Rate', 'Channel_106_mean', 'Channel_107_mean') # flow, inlet, outlet
+PIPE_COLUMNS = ('flow_rate_mean', 'p1_mean', 'p2_mean')
+
+# Friction factor geometry and fluid (water at 25°C), the values results_plot_pipe4.py used
+LENGTH = 0.1 # m
+DIAMETER = 0.005 # m
+RHO = 997 # kg/m^3
+MU = 0.000891 # Pa·s
+
+def config_name(file_path):
+    # calibrated_cc5.csv -> cc5 (files written by results_process3.py)
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    match = re.match(r'calibrated_(.+)', name)
+    return match.group(1) if match else name
+
+def highest_power_points(df, min_gap=0.2):
+    # One point per nominal flow rate: the highest heater power (settled outlet temperature).
+    # Without a Nominal_Flow_Rate column the setpoints are grouped from the measured flow rates,
+    # split where consecutive sorted rates are more than min_gap L/min apart (flow_groups.py)
+    if 'Power' not in df.columns:
+        return df
+    if 'Nominal_Flow_Rate' in df.columns:
+        groups = df['Nominal_Flow_Rate']
+    else:
+        flow = df[COLD_PLATE_COLUMNS[0]]
+        groups = pd.Series(assign_groups(flow, split_by_gaps(flow, min_gap=min_gap)), index=df.index)
+    return df.loc[df['Power'].groupby(groups).idxmax()]
+
+def fit_quadratics(x_sets, y_sets):
+    """Least-squares y = a x² + b x + c for many curves at once.
+
+    x_sets, y_sets: lists of 1-D arrays (curves may have different numbers of points).
+    Returns (coefficients [a, b, c] per curve, R² per curve). Curves are padded to the same
+    length with zero weights and solved together through their normal equations; a
+    quadratic is linear in its parameters, so this is the fit curve_fit finds. Curves with
+    fewer than 3 distinct valid flow rates have no unique fit: nan for them."""
+    size = max(len(x) for x in x_sets)
+    x = np.zeros((len(x_sets), size))
+    y = np.zeros((len(x_sets), size))
+    weight = np.zeros((len(x_sets), size))
+    for row, (xs, ys) in enumerate(zip(x_sets, y_sets)):
+        xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+        valid = ~(np.isnan(xs) | np.isnan(ys))
+        count = valid.sum()
+        x[row, :count], y[row, :count], weight[row, :count] = xs[valid], ys[valid], 1.0
+    distinct = np.array([np.unique(x[row, weight[row] > 0]).size for row in range(len(x_sets))])
+    solvable = distinct >= 3
+    vander = x[:, :, None] ** np.array([2, 1, 0]) # curves x points x 3
+    weighted = vander * weight[:, :, None]
+    coefficients = np.full((len(x_sets), 3), np.nan)
+    if solvable.any():
+        coefficients[solvable] = np.linalg.solve(weighted[solvable].transpose(0, 2, 1) @ vander[solvable],
+                                                 (weighted[solvable].transpose(0, 2, 1) @ y[solvable, :, None]))[:, :, 0]
+    fitted = (vander @ coefficients[:, :, None])[:, :, 0]
+    count = weight.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (y * weight).sum(axis=1) / count
+        ss_res = (((y - fitted) ** 2) * weight).sum(axis=1)
+        ss_tot = (((y - mean[:, None]) ** 2) * weight).sum(axis=1)
+        return coefficients, 1 - ss_res / ss_tot
+
+def evaluate(coefficients, flow):
+    # Every curve on the same flow grid: curves x flows
+    return coefficients @ (np.asarray(flow, dtype=np.float64)[None, :] ** np.array([[2], [1], [0]]))
+
+def friction_factor(flow, pressure_drop, length=LENGTH, diameter=DIAMETER, rho=RHO, mu=MU):
+    # flow in L/min, pressure drop in Pa (any matching array shapes) -> Reynolds number, Darcy friction factor
+    area = np.pi * (diameter / 2) ** 2
+    velocity = (np.asarray(flow, dtype=np.float64) / 60000) / area
+    reynolds = rho * velocity * diameter / mu
+    with np.errstate(divide='ignore', invalid='ignore'):
+        friction = np.where(velocity < 1e-6, np.nan, pressure_drop * 2 * diameter / (length * rho * velocity ** 2))
+    return reynolds, friction
+
+def analyze(cold_plate_files, pipe_file, flow=None, **geometry):
+    """Fits and tables for every cold plate configuration, with the pipe test subtracted.
+
+    Returns (fits, table, points): fits has one row per curve (Config, Curve inlet/outlet,
+    a, b, c, R2), table one row per configuration and flow rate with the pipe, total and
+    cold plate pressure drops and the cold plate Reynolds number and friction factor,
+    points the measured points of every configuration ('pipe' first) for plot_all()."""
+    flow = np.linspace(0.5, 2.5, 100) if flow is None else np.asarray(flow, dtype=np.float64)
+    pipe = pd.read_csv(pipe_file)
+    points = {'pipe': (pipe, PIPE_COLUMNS)}
+    for file_path in sorted(cold_plate_files):
+        points[config_name(file_path)] = (highest_power_points(pd.read_csv(file_path)), COLD_PLATE_COLUMNS)
+
+    # Inlet and outlet of every configuration (and of the pipe test) in one solve
+    x_sets, y_sets, labels = [], [], []
+    for config, (df, (flow_col, p1_col, p2_col)) in points.items():
+        for curve, column in (('inlet', p1_col), ('outlet', p2_col)):
+            x_sets.append(df[flow_col].to_numpy())
+            y_sets.append(df[column].to_numpy())
+            labels.append((config, curve))
+    coefficients, r2 = fit_quadratics(x_sets, y_sets)
+    for (config, curve), fitted in zip(labels, ~np.isnan(coefficients[:, 0])):
+        if not fitted:
+            print(f"Warning: {config} {curve} pressure has fewer than 3 distinct flow rates, no fit.")
+    fits = pd.DataFrame(coefficients, columns=['a', 'b', 'c'])
+    fits.insert(0, 'Curve', [curve for _, curve in labels])
+    fits.insert(0, 'Config', [config for config, _ in labels])
+    fits['R2'] = r2
+
+    pressures = evaluate(coefficients, flow) # curves x flows
+    drops = pressures[0::2] - pressures[1::2] # inlet - outlet, configurations x flows (pipe first)
+    pipe_drop, total_drop = drops[0], drops[1:]
+    cold_plate_drop = total_drop - pipe_drop
+    reynolds, friction = friction_factor(flow[None, :], cold_plate_drop, **geometry)
+    configs = list(points)[1:]
+    table = pd.DataFrame({
+        'Config': np.repeat(configs, flow.size),
+        'Flow_Rate': np.tile(flow, len(configs)),
+        'Pipe_Pressure_Drop': np.tile(pipe_drop, len(configs)),
+        'Total_Pressure_Drop': total_drop.ravel(),
+        'Cold_Plate_Pressure_Drop': cold_plate_drop.ravel(),
+        'Reynolds': np.broadcast_to(reynolds, cold_plate_drop.shape).ravel(),
+        'Friction_Factor': friction.ravel(),
+    })
+    return fits, table, points
+
+def nominal_table(table):
+    # Flow rates rounded to 2 decimals (nominal), pressure drops averaged, per configuration
+    return table.assign(Nominal_Flow_Rate=table['Flow_Rate'].round(2)) \
+        .groupby(['Config', 'Nominal_Flow_Rate'], sort=False)[['Pipe_Pressure_Drop', 'Total_Pressure_Drop', 'Cold_Plate_Pressure_Drop']] \
+        .mean().reset_index()
+
+def plot_config(config, measured, fit, table, output_dir):
+    # Runs in a worker process: pressure fits, pressure drops and friction factor of one configuration
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    x, p1, p2 = measured
+    x_fit = np.linspace(np.nanmin(x), np.nanmax(x), 100)
+    fig, axes = plt.subplots(1, 3, figsize=(20, 6))
+    ax = axes[0]
+    ax.scatter(x, p1, label='Inlet Pressure')
+    ax.scatter(x, p2, label='Outlet Pressure')
+    ax.plot(x_fit, evaluate(np.array([fit['inlet'][:3]]), x_fit)[0], 'r-', label='Inlet Fit')
+    ax.plot(x_fit, evaluate(np.array([fit['outlet'][:3]]), x_fit)[0], 'b-', label='Outlet Fit')
+    ax.set_xlabel('Flow Rate (L/min)')
+    ax.set_ylabel('Pressure (Pa)')
+    ax.set_title(f"{config}: Pressure vs Flow Rate\nInlet R² = {fit['inlet'][3]:.4f}, Outlet R² = {fit['outlet'][3]:.4f}")
+    ax.set_xlim(0, 2.75)
+    ax.legend()
+    ax.grid(True)
+
+    ax = axes[1]
+    for column, label in (('Pipe_Pressure_Drop', 'Pipe'), ('Total_Pressure_Drop', 'Cold Plate + Pipes'),
+                          ('Cold_Plate_Pressure_Drop', 'Cold Plate Alone')):
+        ax.plot(table['Flow_Rate'], table[column], label=label)
+    ax.set_xlabel('Flow Rate (L/min)')
+    ax.set_ylabel('Pressure Drop (Pa)')
+    ax.set_title(f'{config}: Flow Rate vs Pressure Drop')
+    ax.legend()
+    ax.grid(True)
+
+    ax = axes[2]
+    valid = table['Friction_Factor'].notna() & (table['Friction_Factor'] > 0)
+    ax.scatter(table.loc[valid, 'Reynolds'], table.loc[valid, 'Friction_Factor'])
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('Reynolds Number')
+    ax.set_ylabel('Friction Factor')
+    ax.set_title(f'{config}: Friction Factor vs Reynolds Number')
+    ax.grid(True)
+
+    path = os.path.join(output_dir, f'pressure_drop_{config}.png')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+def plot_all(fits, table, points, output_dir='.', workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for config, (df, (flow_col, p1_col, p2_col)) in points.items():
+        if config == 'pipe':
+            continue
+        curves = fits[fits['Config'] == config].set_index('Curve')
+        fit = {curve: curves.loc[curve, ['a', 'b', 'c', 'R2']].tolist() for curve in ('inlet', 'outlet')}
+        measured = (df[flow_col].to_numpy(), df[p1_col].to_numpy(), df[p2_col].to_numpy())
+        jobs.append((config, measured, fit, table[table['Config'] == config]))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(plot_config, *zip(*jobs), [output_dir] * len(jobs))) if jobs else []
+
+def print_fits(fits):
+    for row in fits.itertuples():
+        print(f"{row.Config} {row.Curve} fit: P = {row.a:.2f}x² + {row.b:.2f}x + {row.c:.2f} (R² = {row.R2:.4f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pressure drop and friction factor of cold plate configurations.")
+    parser.add_argument('files', nargs='+', help="calibrated_<config>.csv files from results_process3.py.")
+    parser.add_argument('--pipe', required=True, help="Processed pipe test file (results_process_pipe.py).")
+    parser.add_argument('--output', default=os.path.join('data', 'processed'), help="Folder for the tables and figures.")
+    parser.add_argument('--workers', type=int, default=None, help="Plot processes (default: one per CPU).")
+    args = parser.parse_args()
+
+    fits, table, points = analyze(args.files, args.pipe)
+    print_fits(fits)
+    os.makedirs(args.output, exist_ok=True)
+    table.to_csv(os.path.join(args.output, 'pressure_drop_table.csv'), index=False)
+    fits.to_csv(os.path.join(args.output, 'pressure_fits.csv'), index=False)
+    plot_all(fits, table, points, args.output, args.workers)
+    print(f"Tables and figures saved in '{args.output}'")
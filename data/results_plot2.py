@@ -5,7 +5,7 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 from itertools import cycle
-from sklearn.cluster import KMeans
+from flow_groups import kmeans_1d, assign_groups
 
 # Constants and configurations
 DATA_FOLDER = 'data'
@@ -34,36 +34,13 @@ MARKERS = ['o', 's', 'D', '^', 'v', '<', '>', 'p', '*', 'h', 'H', '+', 'x', 'd',
 #     else:
 #         return None  # or handle as needed for flows that do not fit any group
 
-def find_nominal_rates(flow_data, n_clusters):
-    # Reshape flow data for clustering (sklearn expects a 2D array)
-    flow_data_reshaped = np.array(flow_data).reshape(-1, 1)
-    
-    # Apply k-means clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=0).fit(flow_data_reshaped)
-    
-    # Get the cluster centers (nominal rates)
-    nominal_rates = kmeans.cluster_centers_.flatten()
-    
-    return sorted(nominal_rates)
-
-def assign_flow_group(flow, nominal_rates):
-    # Find the closest nominal rate
-    closest_nominal = min(nominal_rates, key=lambda x: abs(x - flow))
-    
-    # Define a tolerance within which flow rate is considered part of the nominal group
-    tolerance = 0.1
-    
-    if abs(flow - closest_nominal) <= tolerance:
-        return closest_nominal
-    else:
-        return None
-
 def process_csv(file_path):
     df = pd.read_csv(file_path)
-    nominal_rates = find_nominal_rates(df['Actual_Flow_Rate'], n_clusters=5)  # Adjust n_clusters based on expected number of nominal rates
+    nominal_rates = kmeans_1d(df['Actual_Flow_Rate'], 5)  # Adjust k based on expected number of nominal rates
 
     # df['Flow_Group'] = df['Channel_108_mean'].apply(assign_flow_group)
-    df['Flow_Group'] = df['Actual_Flow_Rate'].apply(lambda x: assign_flow_group(x, nominal_rates))
+    # Nearest nominal rate within ±0.1 L/min, NaN otherwise (see flow_groups.py)
+    df['Flow_Group'] = assign_groups(df['Actual_Flow_Rate'], nominal_rates, tolerance=0.1)
     config = os.path.basename(file_path).split('_')[1].split('.')[0]
     highest_power_data = df.iloc[8::9]
     
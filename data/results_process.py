@@ -51,6 +51,10 @@ calibrated_results = {channel: {'mean': [], 'std': []} for channel in channels}
 
 for channel, values in results.items():
     if channel in calibration_coeffs:
+        if 'poly' in calibration_coeffs[channel]:
+            # Means and stds cannot be mapped through a polynomial; results_process2.py/3.py calibrate the readings
+            raise ValueError(f"{channel} has a polynomial calibration, which this script does not support. "
+                             "Use results_process3.py.")
         m = calibration_coeffs[channel]['m']
         b = calibration_coeffs[channel]['b']
         calibrated_means = [m * value + b for value in values['mean']]
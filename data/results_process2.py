@@ -2,75 +2,23 @@ import pandas as pd
 import numpy as np
 import json
 from scipy import stats
+from steady_states import steady_state_stats, steady_state_table
+from run_files import load_run
 
 # Read the CSV file
-df = pd.read_csv('data\\uniform\\data_2024-07-26_09-37-45_c1.csv')
-
-# Convert Timestamp to datetime
-df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+# Read the run (from its columnar copy once converted), Timestamp already datetime
+df = load_run('data\\uniform\\data_2024-07-26_09-37-45_c1.csv')
 
 # Load calibration coefficients
 with open('data\\calibration_coefficients.json', 'r') as f:
     calibration_coeffs = json.load(f)
 
-# Group data by Timestamp
-grouped = df.groupby('Timestamp')
-
-# Function to identify steady states
-def identify_steady_states(grouped, time_threshold=3):
-    steady_states = []
-    current_state = []
-    prev_time = None
-    
-    for time, group in grouped:
-        if prev_time is not None:
-            time_diff = (time - prev_time).total_seconds()
-            if time_diff > time_threshold:
-                if current_state:
-                    steady_states.append(current_state)
-                current_state = [group]
-            else:
-                current_state.append(group)
-        else:
-            current_state.append(group)
-        prev_time = time
-    
-    if current_state:
-        steady_states.append(current_state)
-    
-    return steady_states
-
-# Identify steady states
-steady_states = identify_steady_states(grouped)
-
-# Calculate statistics for each channel in each steady state
+# Identify steady states and calculate calibrated statistics for each channel in each steady state
 channels = df['Channel'].unique()
-results = {channel: {'mean': [], 'std': []} for channel in channels}
-
-for state in steady_states:
-    state_data = pd.concat(state)
-    for channel in channels:
-        channel_data = state_data[state_data['Channel'] == channel]['Data']
-        if not channel_data.empty:
-            mean_value = channel_data.mean()
-            std_value = channel_data.std()
-            results[channel]['mean'].append(mean_value)
-            results[channel]['std'].append(std_value)
-
-# Apply calibration and create final results
-calibrated_results = {channel: {'mean': [], 'std': []} for channel in channels}
-
-for channel, values in results.items():
-    if channel in calibration_coeffs:
-        m = calibration_coeffs[channel]['m']
-        b = calibration_coeffs[channel]['b']
-        calibrated_means = [m * value + b for value in values['mean']]
-        calibrated_stds = [m * value for value in values['std']]  # Standard deviation is scaled by m
-        calibrated_results[channel]['mean'] = calibrated_means
-        calibrated_results[channel]['std'] = calibrated_stds
-    else:
-        print(f"Warning: No calibration coefficient found for {channel}. Using raw values.")
-        calibrated_results[channel] = values
+steady_state_results = steady_state_stats(df, gap_seconds=3, calibration_coeffs=calibration_coeffs)
+result_df = steady_state_table(steady_state_results, channels)
+calibrated_results = {channel: steady_state_results.xs(channel, level='Channel')[['mean', 'std']].to_dict('list')
+                      for channel in channels}
 
 # Print results
 print("Calibrated Results:")
@@ -81,8 +29,6 @@ for channel, values in calibrated_results.items():
     print()
 
 # Save results to a CSV file
-result_df = pd.DataFrame({f"{channel}_mean": values['mean'] for channel, values in calibrated_results.items()})
-result_df = result_df.join(pd.DataFrame({f"{channel}_std": values['std'] for channel, values in calibrated_results.items()}))
 result_df.to_csv('calibrated_steady_state_results.csv', index=False, mode='w')
 print("Calibrated results saved to 'calibrated_steady_state_results.csv'")
 
@@ -3,6 +3,8 @@ import pandas as pd
 import numpy as np
 import os
 from glob import glob
+from run_files import load_run
+from steady_states import calibrate
 
 # Load calibration coefficients
 with open('data/calibration_coefficients.json', 'r') as f:
@@ -10,17 +12,16 @@ with open('data/calibration_coefficients.json', 'r') as f:
 
 # Function to apply calibration
 def apply_calibration(value, channel):
-    m = calibration_coeffs[channel]['m']
-    b = calibration_coeffs[channel]['b']
-    return m * value + b
+    # Linear (m, b) or polynomial ('poly') entry, applied to the raw readings
+    return calibrate(value, calibration_coeffs[channel])
 
 # Function to process data for a single file
 def process_file(file_path):
-    # Read CSV file
-    df = pd.read_csv(file_path)
-    
     # Extract relevant channels
     channels = ['Channel_106', 'Channel_107', 'Channel_108']
+
+    # Read only these channels (from the columnar copy once converted)
+    df = load_run(file_path, channels=channels)
     data = {channel: df[df['Channel'] == channel]['Data'].values for channel in channels}
     
     # Apply calibration
@@ -0,0 +1,42 @@
+import os
+import sys
+import argparse
+
+## Columnar copies of the long Timestamp/Name/Channel/Data run CSVs, for the data/ scripts.
+## The format and the loaders live in run_store.py at the top of the repository (the GUI and
+## the API query saved runs with it too); this module makes them importable from data/:
+##     from run_files import load_run, query_run
+## load_run() uses the columnar copy next to the CSV when it is up to date, and writes it
+## on the first load otherwise, so only the first analysis of a run pays for the CSV parse.
+## query_run() reads only a time range and a set of channels of a run.
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from run_store import (FORMATS, columnar_path_for, read_run_csv, to_wide, to_long, write_columnar,
+                       read_columnar, convert_run, load_run, query_run, run_channels)
+
+__all__ = ['FORMATS', 'columnar_path_for', 'read_run_csv', 'to_wide', 'to_long', 'write_columnar',
+           'read_columnar', 'convert_run', 'load_run', 'query_run', 'run_channels']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert run CSV files (or folders of them) to a columnar format.")
+    parser.add_argument('paths', nargs='+', help="CSV files or folders; folders are searched recursively.")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='parquet')
+    parser.add_argument('--force', action='store_true', help="Convert even if the columnar file is up to date.")
+    args = parser.parse_args()
+
+    csv_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            csv_paths += [os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                          if name.startswith('data_') and name.endswith('.csv')
+                          and not name.endswith(('_summary.csv', '.partial.csv'))]
+        else:
+            csv_paths.append(path)
+
+    for csv_path in sorted(csv_paths):
+        try:
+            columnar = convert_run(csv_path, args.format, args.force)
+        except Exception as e:
+            print(f"Error converting {csv_path}: {e}")
+            continue
+        print(f"{csv_path} -> {columnar} ({os.path.getsize(csv_path) / 1e6:.1f} MB -> {os.path.getsize(columnar) / 1e6:.1f} MB)")
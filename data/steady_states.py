@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+# Shared steady-state segmentation for the results_process*.py scripts.
+# A steady state is a run of scans without a pause longer than gap_seconds between
+# consecutive timestamps (the DAQ only records during the settled part of each step).
+# Everything is done on whole columns, so a multi-day file is handled in one pass.
+
+def segment_ids(timestamps, gap_seconds=10):
+    """Steady-state number (0, 1, ...) of every row, from the gaps between distinct timestamps."""
+    times = pd.to_datetime(timestamps).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    unique_times, row_to_time = np.unique(times, return_inverse=True) # Sorted, like groupby('Timestamp')
+    new_segment = np.diff(unique_times) > gap_seconds * 1e9
+    time_to_segment = np.concatenate(([0], np.cumsum(new_segment)))
+    return time_to_segment[row_to_time]
+
+def calibrate(values, coefficients):
+    """Values calibrated with one channel's entry of calibration_coefficients.json:
+    {'m': .., 'b': ..} or {'poly': [c0, c1, ...]} (ascending powers, see calibration_engine.py)."""
+    values = np.asarray(values, dtype=np.float64)
+    if 'poly' in coefficients:
+        return np.polynomial.polynomial.polyval(values, coefficients['poly'])
+    return coefficients['m'] * values + coefficients['b']
+
+def steady_state_stats(df, gap_seconds=10, calibration_coeffs=None, ddof=1):
+    """Per steady state and channel: start, end, count, mean and std of 'Data'.
+
+    calibration_coeffs ({channel: {'m': .., 'b': ..}}) is applied to the statistics:
+    mean -> m * mean + b, std -> |m| * std, the same as calibrating every value first.
+    Polynomial entries ({'poly': [...]}) cannot be mapped that way, their channels are
+    calibrated value by value before the statistics.
+    ddof=0 gives np.std, ddof=1 the pandas default."""
+    data = df['Data'].to_numpy(dtype=np.float64, copy=True)
+    polynomials = {c: e for c, e in (calibration_coeffs or {}).items() if 'poly' in e}
+    if polynomials:
+        channel_names = df['Channel'].astype(str).to_numpy()
+        for channel, coefficients in polynomials.items():
+            rows = channel_names == channel
+            data[rows] = calibrate(data[rows], coefficients)
+    frame = pd.DataFrame({
+        'Segment': segment_ids(df['Timestamp'], gap_seconds),
+        'Timestamp': pd.to_datetime(df['Timestamp']),
+        'Channel': df['Channel'],
+        'Data': data,
+    })
+    stats = frame.groupby(['Segment', 'Channel'], sort=False).agg(
+        start=('Timestamp', 'min'), end=('Timestamp', 'max'), count=('Data', 'count'),
+        mean=('Data', 'mean'), std=('Data', 'std'))
+    stats = stats.sort_index(level='Segment', sort_remaining=False)
+    if ddof != 1:
+        # Rescale the sample std (ddof=1) instead of a per-group Python call
+        n = stats['count']
+        stats['std'] = (stats['std'] * np.sqrt((n - 1) / (n - ddof))).where(n > ddof)
+        if ddof == 0:
+            stats.loc[n == 1, 'std'] = 0.0 # Sample std is undefined for one value, np.std gives 0
+    if calibration_coeffs:
+        channels = stats.index.get_level_values('Channel')
+        # Polynomial channels are already calibrated: no 'm'/'b', so gain 1 and offset 0
+        m = np.array([calibration_coeffs.get(c, {}).get('m', 1.0) for c in channels])
+        b = np.array([calibration_coeffs.get(c, {}).get('b', 0.0) for c in channels])
+        missing = sorted(set(channels) - set(calibration_coeffs))
+        for channel in missing:
+            print(f"Warning: No calibration coefficient found for {channel}. Using raw values.")
+        stats['mean'] = m * stats['mean'] + b
+        stats['std'] = np.abs(m) * stats['std']
+    return stats
+
+def steady_state_table(stats, channels=None):
+    """One row per steady state with <channel>_mean columns followed by <channel>_std columns."""
+    if channels is None:
+        channels = list(dict.fromkeys(stats.index.get_level_values('Channel')))
+    wide = stats[['mean', 'std']].unstack('Channel')
+    columns = {f"{channel}_{value}": wide[(value, channel)] for value in ('mean', 'std') for channel in channels
+               if (value, channel) in wide.columns}
+    return pd.DataFrame(columns).reset_index(drop=True)
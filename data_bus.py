@@ -0,0 +1,157 @@
+# In data_bus.py
+import asyncio
+import time
+from collections import deque, namedtuple
+import numpy as np
+from clock import clock
+
+# One reading of several channels of one instrument at one time.
+# timestamp: int64 ns since the UTC epoch (clock.now_ns()).
+# values: float64 array aligned with channels (nan for a failed reading).
+# record: False for data that is only shown, never stored (idle monitoring).
+# raw: uncalibrated values when the calibration stage changed 'values', else None.
+SampleBlock = namedtuple('SampleBlock', ['timestamp', 'name', 'channels', 'values', 'record', 'published_at', 'raw'],
+                         defaults=(None,))
+
+# What a full subscriber queue does with the next block
+DROP_OLDEST = 'drop_oldest' # Keep the newest data (plots, safety)
+DROP_NEWEST = 'drop_newest' # Keep what is queued, discard the new block
+BLOCK = 'block'             # Backpressure: the producer waits for space (storage, nothing may be lost)
+
+def make_blocks(data_tuples, record=True):
+    """SampleBlocks from producer tuples (timestamp, name, channel, value), one per (timestamp, name)."""
+    groups = {}
+    for timestamp, name, channel, value in data_tuples:
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            value = float('nan')
+        channels, values = groups.setdefault((timestamp, name), ([], []))
+        channels.append(channel)
+        values.append(value)
+    now = time.time()
+    return [SampleBlock(_as_ns(timestamp), name, tuple(channels), np.array(values, dtype=np.float64), record, now)
+            for (timestamp, name), (channels, values) in groups.items()]
+
+def _as_ns(timestamp):
+    # Drivers stamp with clock.now_ns(); datetimes from older drivers are converted once per block
+    return timestamp if isinstance(timestamp, (int, np.integer)) else int(clock.from_datetime(timestamp))
+
+class Subscription:
+    """Bounded queue of SampleBlocks for one consumer, with its own drop policy and lag metrics."""
+    def __init__(self, name, maxsize=1000, policy=DROP_OLDEST, record_only=False):
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.record_only = record_only # Only blocks that are stored (no idle-monitoring data)
+        self.queue = deque()
+        # asyncio.Events created by the first waiter, in the running loop: before Python 3.10 an Event
+        # binds to the loop current at creation, and subscriptions are made on the main thread
+        self._not_empty = None
+        self._not_full = None
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def wants(self, block):
+        return block.record or not self.record_only
+
+    def _put(self, block):
+        if len(self.queue) >= self.maxsize:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return
+            self.queue.popleft() # DROP_OLDEST
+            self.dropped += 1
+        self.queue.append(block)
+        self.received += 1
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._update_events()
+
+    def _update_events(self):
+        if self._not_empty is None:
+            return
+        if self.queue:
+            self._not_empty.set()
+        else:
+            self._not_empty.clear()
+        if len(self.queue) < self.maxsize:
+            self._not_full.set()
+        else:
+            self._not_full.clear()
+
+    def _create_events(self):
+        if self._not_empty is None:
+            self._not_empty = asyncio.Event()
+            self._not_full = asyncio.Event()
+            self._update_events()
+
+    async def put(self, block):
+        if self.policy == BLOCK:
+            while len(self.queue) >= self.maxsize:
+                self._create_events()
+                await self._not_full.wait()
+        self._put(block)
+
+    def _taken(self, count):
+        self.delivered += count
+        self._update_events()
+
+    async def get(self):
+        while not self.queue:
+            self._create_events()
+            await self._not_empty.wait()
+        block = self.queue.popleft()
+        self._taken(1)
+        return block
+
+    def drain(self):
+        # Everything queued, oldest first, without waiting
+        blocks = list(self.queue)
+        self.queue.clear()
+        self._taken(len(blocks))
+        return blocks
+
+    def clear(self):
+        self.dropped += len(self.queue)
+        self.queue.clear()
+        self._taken(0)
+
+    def lag_seconds(self):
+        # Age of the oldest block still waiting for this consumer
+        return time.time() - self.queue[0].published_at if self.queue else 0.0
+
+    def stats(self):
+        return {'policy': self.policy, 'depth': len(self.queue), 'max_depth': self.max_depth, 'maxsize': self.maxsize,
+                'received': self.received, 'delivered': self.delivered, 'dropped': self.dropped,
+                'lag_seconds': self.lag_seconds()}
+
+class DataBus:
+    """Fans sample blocks out from producers to independent consumers.
+
+    Each consumer has its own bounded queue, so a slow consumer only affects itself:
+    with DROP_OLDEST/DROP_NEWEST it loses blocks (counted in 'dropped'), with BLOCK the
+    producers wait for it. Runs entirely in the acquisition loop, no lock is needed."""
+    def __init__(self):
+        self.subscriptions = []
+        self.published = 0
+
+    def subscribe(self, name, maxsize=1000, policy=DROP_OLDEST, record_only=False):
+        subscription = Subscription(name, maxsize, policy, record_only)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    async def publish(self, blocks):
+        for block in blocks:
+            self.published += 1
+            for subscription in self.subscriptions:
+                if subscription.wants(block):
+                    await subscription.put(block)
+
+    def stats(self):
+        return {'published': self.published, 'subscribers': {s.name: s.stats() for s in self.subscriptions}}
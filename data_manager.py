@@ -1,68 +1,305 @@
 # In data_manager.py
 import asyncio
-from collections import deque
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from state import app_state
+from channel_history import ChannelHistory
+from data_bus import DataBus, make_blocks, BLOCK, DROP_OLDEST
+from spill_store import SpillStore, SpilledBatch
+from clock import clock, with_datetimes, freeze_offset
+from burst_stats import BurstStatistics
+from live_calibration import CalibrationStage
+from channel_groups import display_channels
 import os
+import threading
+import time
+
+def partial_path_for(file_path):
+    root, ext = os.path.splitext(file_path)
+    return f"{root}.partial{ext}"
+
+def _mb(num_bytes):
+    return num_bytes / 1024 ** 2
+
+def write_data_file(frame, file_path):
+    # Blocking write of a finished batch; runs in an executor thread, off the event loop
+    # If index was set with drop=False, it might be duplicated in CSV.
+    # Decide if index should be written. If 'Timestamp' and 'Name' are columns, don't write index.
+    if isinstance(frame, SpilledBatch):
+        try:
+            frame.to_csv(file_path, index=False) # Streams the spilled chunks, converts timestamps per chunk
+        except Exception:
+            if not frame.owned:
+                frame.discard() # A failed copy must not keep the store on disk; a failed batch keeps its chunks
+            raise
+    elif 'Timestamp' in frame.columns and 'Name' in frame.columns:
+        with_datetimes(frame).to_csv(file_path, index=False) # int64 ns -> local datetimes only here
+    else: # If Timestamp and Name are only in index
+        frame.to_csv(file_path, index=True)
+    print(f"Data successfully saved to {file_path}.")
+    if isinstance(frame, SpilledBatch):
+        frame.discard() # Spilled chunks of a finished batch are no longer needed
+    partial_path = partial_path_for(file_path)
+    if os.path.exists(partial_path):
+        os.remove(partial_path) # The complete file supersedes the partial one
 
 class AsyncDataManager:
-    def __init__(self):
-        self.lock = asyncio.Lock()
-        self.plot_deque = deque(maxlen=100) # Max length of data points for live plotting
+    """Entry point for acquired data, and owner of the batch DataFrame and the plot histories.
+
+    Producers publish sample blocks on the data bus and return; storage and the plot
+    histories are separate bus consumers. Storage uses backpressure (nothing may be lost),
+    the plot drops its oldest blocks if it ever falls behind.
+
+    Batch rows beyond the memory budget ('storage' in the config) are spilled to disk
+    oldest first; query(), the partial file and saving read them back transparently."""
+    def __init__(self, config=None):
+        storage_config = (config or {}).get('storage', {})
+        self.memory_budget_bytes = storage_config.get('memory_budget_mb', 512) * 1024 ** 2
+        self.spill_keep_fraction = storage_config.get('spill_keep_fraction', 0.25) # Newest share of the rows kept in memory after a spill
+        self.spill_dir = storage_config.get('spill_dir', os.path.join('data', 'spill'))
+        self.memory_log_interval = storage_config.get('memory_log_interval_seconds', 300)
+        self.spill_store = None # SpillStore of the current batch, created on the first spill
+        self.categories = {'Name': [], 'Channel': []} # Shared category order, so concatenated frames stay categorical
+        self.memory_usage = {} # Replaced as a whole on each update; read by the GUI thread
+        self.burst_stats = BurstStatistics() # Per-burst summary; EquipmentManager sets its setpoint_source
+        self.calibration = CalibrationStage(config) # Applied before anything sees the data
+        self.lock = None # asyncio.Lock guarding data_df between the coroutines that rebuild, flush and snapshot it, see start()
+        self.bus = DataBus()
+        self.storage_subscription = self.bus.subscribe('storage', maxsize=100000, policy=BLOCK, record_only=True)
+        self.plot_subscription = self.bus.subscribe('plot', maxsize=10000, policy=DROP_OLDEST)
+        self.plot_consumer_task = None
+        self.plot_buffer_size = 2048 # Raw points per channel; older data is kept as min/max envelopes
+        self.channel_histories = {} # channel -> ChannelHistory of (UTC epoch seconds, value) for the whole run
+        self.plot_seq = 0 # Incremented on every plotted sample, lets the renderer skip idle frames
+        # Idle-monitoring channels shown between batches (None: all); safety still gets the whole scan
+        self.idle_display_channels = display_channels(config or {})
+        # The GUI thread reads the channel histories while the acquisition loop appends to them
+        self.plot_lock = threading.Lock()
         self.data_df = pd.DataFrame()
-        self.data_accumulator = []
+        self.batch_file_path = None # Output file of the current batch, fixed when the batch starts
+        self._partial_rows_written = 0 # Rows of data_df already flushed to the partial file
 
     def reset_data(self):
         # Called before each batch run
-        self.plot_deque.clear()
-        self.data_accumulator.clear()
+        self.plot_subscription.clear()
+        with self.plot_lock:
+            self.channel_histories.clear()
+            self.plot_seq += 1
+        self.storage_subscription.clear()
+        clock.anchor() # Each batch gets its own wall-clock anchor
+        self.burst_stats.clear()
         self.data_df = pd.DataFrame() 
+        if self.spill_store is not None:
+            self.spill_store.clear() # Not handed over by snapshot_batch (e.g. safety halt): discarded like data_df
+            self.spill_store = None
+        self.batch_file_path = None
+        self._partial_rows_written = 0
         print("Data manager reset for new batch/run.")
 
-    async def add_data(self, timestamp, name, channel, new_data):
+    def new_file_path(self, batch_num=None):
+        current_time_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        data_dir = "data"
+        os.makedirs(data_dir, exist_ok=True)
+
+        filename_parts = ["data", current_time_str]
+        if batch_num is not None:
+            filename_parts.append(f"batch_{batch_num}")
+        return os.path.join(data_dir, f"{'_'.join(filename_parts)}.csv")
+
+    def begin_batch_file(self, batch_num=None, file_path=None):
+        # Fix the batch output file up front so checkpoints can refer to it
+        self.batch_file_path = file_path or self.new_file_path(batch_num)
+        self._partial_rows_written = 0
+        return self.batch_file_path
+
+    def partial_file_path(self, file_path=None):
+        file_path = file_path or self.batch_file_path
+        if not file_path:
+            return None
+        return partial_path_for(file_path)
+
+    async def flush_partial(self):
+        # Append rows collected since the last flush to the batch's partial file.
+        # The partial file is what a resumed batch reloads after an interruption.
+        partial_path = self.partial_file_path()
+        if not partial_path:
+            return None
+        await self.update_dataframe()
         async with self.lock:
-            self.plot_deque.append((timestamp, name, channel, new_data))
-            self.data_accumulator.append({'Timestamp': timestamp, 'Name':name, 'Channel': channel, 'Data': new_data})
+            first_flush = self._partial_rows_written == 0 or not os.path.exists(partial_path)
+            new_rows = self._rows_from(0 if first_flush else self._partial_rows_written)
+            if new_rows.empty:
+                return partial_path
+            try:
+                with_datetimes(new_rows).to_csv(partial_path, mode='w' if first_flush else 'a', header=first_flush, index=False)
+                self._partial_rows_written = self.total_rows()
+            except Exception as e:
+                print(f"Error writing partial data to {partial_path}: {e}")
+        return partial_path
 
-    async def add_data_batch(self, data_tuples):
+    async def load_partial(self, file_path):
+        # Reload the data of an interrupted batch so saving continues in the same file
+        self.begin_batch_file(file_path=file_path)
+        # A stopped batch was saved in full, an interrupted one only has its partial file
+        partial_path = next((path for path in (self.partial_file_path(), file_path) if os.path.exists(path)), None)
+        if partial_path is None:
+            print(f"No saved data found for {file_path}. Resumed batch starts with empty data.")
+            return 0
+        try:
+            partial_df = pd.read_csv(partial_path)
+        except Exception as e:
+            print(f"Error loading partial data from {partial_path}: {e}")
+            return 0
         async with self.lock:
-            for timestamp, name, channel, new_data in data_tuples:
-                self.plot_deque.append((timestamp, name, channel, new_data))
-                self.data_accumulator.append({'Timestamp': timestamp, 'Name':name, 'Channel': channel, 'Data': new_data})
+            self._append_frame(partial_df)
+        await self.update_dataframe()
+        # Rows reloaded from the full file are not in a partial file yet, so the next flush rewrites them
+        self._partial_rows_written = self.total_rows() if partial_path != file_path else 0
+        print(f"Loaded {len(partial_df)} rows of saved data from {partial_path}.")
+        return len(partial_df)
 
-    async def add_realtime_plot_data(self, data_tuples):
+    def total_rows(self):
+        return (self.spill_store.rows if self.spill_store else 0) + len(self.data_df)
+
+    def _rows_from(self, first_row):
+        # Batch rows from position first_row on, including spilled ones; caller holds self.lock
+        spilled = self.spill_store.rows if self.spill_store else 0
+        if first_row >= spilled:
+            return self.data_df.iloc[first_row - spilled:]
+        return pd.concat([self.spill_store.read_rows(first_row), self.data_df], ignore_index=True)
+
+    async def query(self, start=None, end=None, channels=None):
+        # Rows of the current batch in [start, end] (local datetimes), wherever they are stored
+        start_ns = None if start is None else clock.from_datetime(start)
+        end_ns = None if end is None else clock.from_datetime(end)
+        await self.update_dataframe()
         async with self.lock:
-            for timestamp, name, channel, new_data in data_tuples:
-                self.plot_deque.append((timestamp, name, channel, new_data))
+            frame = self.data_df
+            if not frame.empty:
+                if start_ns is not None:
+                    frame = frame[frame['Timestamp'] >= start_ns]
+                if end_ns is not None:
+                    frame = frame[frame['Timestamp'] <= end_ns]
+                if channels is not None:
+                    frame = frame[frame['Channel'].isin(channels)]
+            if self.spill_store is not None and self.spill_store.rows:
+                frame = pd.concat([self.spill_store.read(start_ns, end_ns, channels), frame], ignore_index=True)
+            return with_datetimes(frame.copy())
+
+    def start(self, loop):
+        # Called in the acquisition loop, which the lock must belong to (Python < 3.10 binds it on creation)
+        self.lock = asyncio.Lock()
+        # Plot consumer runs for the whole session, independent of batches
+        self.plot_consumer_task = loop.create_task(self.consume_plot_blocks())
+
+    async def close(self):
+        if self.plot_consumer_task:
+            self.plot_consumer_task.cancel()
+            await asyncio.gather(self.plot_consumer_task, return_exceptions=True)
+            self.plot_consumer_task = None
+
+    async def consume_plot_blocks(self):
+        # Feeds the per-channel plot histories that the GUI thread and the API read
+        try:
+            while True:
+                blocks = [await self.plot_subscription.get()] + self.plot_subscription.drain()
+                with self.plot_lock:
+                    for block in blocks:
+                        t = block.timestamp / 1e9 # UTC epoch seconds; the plot axes show them as local time
+                        shown = None if block.record else self.idle_display_channels
+                        for channel, value in zip(block.channels, block.values):
+                            if shown is not None and channel not in shown:
+                                continue
+                            history = self.channel_histories.get(channel)
+                            if history is None:
+                                history = self.channel_histories[channel] = ChannelHistory(self.plot_buffer_size)
+                            history.append(t, value)
+                        self.plot_seq += len(block.channels)
+        except asyncio.CancelledError:
+            print("Plot consumer cancelled.")
+            raise
+
+    async def add_data(self, timestamp, name, channel, new_data):
+        await self.add_data_batch([(timestamp, name, channel, new_data)])
+
+    async def add_data_batch(self, data_tuples):
+        # Producers (DAQ drivers) only publish; they wait only if storage falls far behind
+        blocks = self.calibration.apply(make_blocks(data_tuples))
+        self.burst_stats.add(blocks) # Here, in producer order, so burst boundaries are exact
+        await self.bus.publish(blocks)
+
+    def begin_burst(self, name):
+        # Called by a DAQ driver when a read_channels burst starts
+        self.burst_stats.begin(name)
+
+    def end_burst(self, name):
+        self.burst_stats.end(name)
+
+    def take_burst_summary(self):
+        # Summary of the finished batch, detached like snapshot_batch detaches the data
+        summary = self.burst_stats.table()
+        self.burst_stats.clear()
+        return summary
+
+    async def add_realtime_plot_data(self, data_tuples):
+        # Shown and checked by safety, never stored (idle monitoring)
+        await self.bus.publish(self.calibration.apply(make_blocks(data_tuples, record=False)))
+
+    def _categorize(self, new_df):
+        # Names and channels repeat on every row: stored as categories (codes) instead of strings.
+        # Categories are only ever appended, so existing codes stay valid.
+        for column, known in self.categories.items():
+            if column not in new_df.columns:
+                continue
+            values = new_df[column].astype(str)
+            known_set = set(known)
+            new_values = [value for value in pd.unique(values) if value not in known_set]
+            if new_values:
+                known.extend(new_values)
+                if column in self.data_df.columns:
+                    self.data_df[column] = self.data_df[column].cat.set_categories(known)
+            new_df[column] = pd.Categorical(values, categories=known)
+
+    def _append_frame(self, new_df):
+        # Caller holds self.lock
+        if new_df.empty:
+            return
+        if 'Timestamp' in new_df.columns and not pd.api.types.is_integer_dtype(new_df['Timestamp']):
+            new_df['Timestamp'] = clock.from_datetime(new_df['Timestamp']) # Datetimes read back from a partial file
+        self._categorize(new_df)
+        # If self.data_df is empty and has no columns, concat might behave unexpectedly.
+        # For now, direct concat and then set index.
+        self.data_df = pd.concat([self.data_df, new_df], ignore_index=True)
+
+    def _blocks_to_frame(self, blocks):
+        # Long format, one row per channel reading, built column-wise instead of row by row
+        counts = [len(block.channels) for block in blocks]
+        frame = pd.DataFrame({
+            'Timestamp': np.repeat(np.array([block.timestamp for block in blocks], dtype=np.int64), counts), # int64 ns until export
+            'Name': np.repeat([block.name for block in blocks], counts),
+            'Channel': [channel for block in blocks for channel in block.channels],
+            'Data': np.concatenate([block.values if block.raw is None else block.raw for block in blocks]),
+        })
+        if self.calibration.enabled:
+            # 'Data' stays the raw reading (what the results scripts calibrate), calibrated values sit next to it
+            frame['Calibrated'] = np.concatenate([block.values for block in blocks])
+        return frame
 
     async def update_dataframe(self):
         async with self.lock:
-            if self.data_accumulator:
-                new_df = pd.DataFrame(self.data_accumulator)
-                # It's generally better to set index after concatenation if structure is consistent
-                # new_df.set_index(['Timestamp', 'Name'], inplace=True) # This might cause issues if accumulator is empty or types change
-                
-                # Ensure Timestamp is datetime if not already
-                if 'Timestamp' in new_df.columns:
-                    new_df['Timestamp'] = pd.to_datetime(new_df['Timestamp'])
-
-                # Concatenate with existing DataFrame
-                if not new_df.empty:
-                    # If self.data_df is empty and has no columns, concat might behave unexpectedly.
-                    # Initialize self.data_df with columns if it's truly always the same structure.
-                    # For now, direct concat and then set index.
-                    self.data_df = pd.concat([self.data_df, new_df], ignore_index=True)
-                    
-                self.data_accumulator.clear()
+            # Storage consumer: everything recorded since the last update
+            blocks = self.storage_subscription.drain()
+            if blocks:
+                self._append_frame(self._blocks_to_frame(blocks))
 
             # Process the combined DataFrame (setting index, sorting, ffill) once after accumulation
             if not self.data_df.empty and 'Timestamp' in self.data_df.columns and 'Name' in self.data_df.columns:
                 # Drop rows where essential identifiers like Timestamp or Name might be missing before setting index
                 self.data_df.dropna(subset=['Timestamp', 'Name'], inplace=True)
                 if not self.data_df.empty: # Check again after dropna
-                    self.data_df.set_index(['Timestamp', 'Name'], inplace=True, drop=False) # keep Timestamp, Name as columns
-                    self.data_df.sort_index(inplace=True)
+                    # Sorted on the columns; a (Timestamp, Name) index would duplicate both in memory
+                    self.data_df = self.data_df.sort_values(['Timestamp', 'Name'], kind='stable', ignore_index=True)
                     # Forward fill, but be careful with groupby if channels should not cross-fill
                     # For simplicity, global ffill. If per-Name/Channel ffill is needed, it's more complex.
                     self.data_df = self.data_df.ffill() # Was: .fillna(method='ffill')
@@ -70,13 +307,63 @@ class AsyncDataManager:
                     self.data_df = pd.DataFrame() # Reset to empty DF with no index
             elif self.data_df.empty : # if it started empty and nothing was added
                  self.data_df = pd.DataFrame() # Ensure it's a clean empty DF
+            self._spill_if_over_budget()
+            self._update_memory_usage()
+
+    def _spill_if_over_budget(self):
+        # Caller holds self.lock. Oldest rows go to disk, the newest spill_keep_fraction stay.
+        if self.data_df.empty:
+            return
+        used = int(self.data_df.memory_usage(deep=True).sum())
+        if used <= self.memory_budget_bytes:
+            return
+        spill_rows = len(self.data_df) - int(len(self.data_df) * self.spill_keep_fraction)
+        if self.spill_store is None:
+            batch_name = os.path.splitext(os.path.basename(self.batch_file_path))[0] if self.batch_file_path \
+                else datetime.now().strftime("session_%Y-%m-%d_%H-%M-%S")
+            self.spill_store = SpillStore(os.path.join(self.spill_dir, batch_name))
+        try:
+            self.spill_store.append(self.data_df.iloc[:spill_rows])
+        except Exception as e:
+            print(f"Data manager: Error spilling to {self.spill_store.directory}, data stays in memory: {e}")
+            return
+        self.data_df = self.data_df.iloc[spill_rows:].reset_index(drop=True)
+        print(f"Data manager: {_mb(used):.1f} MB over the {_mb(self.memory_budget_bytes):.1f} MB budget, "
+              f"spilled {spill_rows} rows to {self.spill_store.directory} ({self.spill_store.rows} spilled in total).")
+
+    def _update_memory_usage(self):
+        # Caller holds self.lock
+        queued = list(self.storage_subscription.queue)
+        with self.plot_lock:
+            plot_bytes = sum(history.nbytes() for history in self.channel_histories.values())
+        self.memory_usage = {
+            'data_rows': len(self.data_df),
+            'data_bytes': int(self.data_df.memory_usage(deep=True).sum()) if not self.data_df.empty else 0,
+            'queue_blocks': len(queued),
+            'queue_bytes': sum(block.values.nbytes + 200 for block in queued), # 200: tuple and timestamp overhead, roughly
+            'plot_bytes': plot_bytes,
+            'spilled_rows': self.spill_store.rows if self.spill_store else 0,
+            'spilled_disk_bytes': self.spill_store.disk_bytes() if self.spill_store else 0,
+            'budget_bytes': self.memory_budget_bytes,
+        }
+
+    def memory_text(self):
+        usage = self.memory_usage
+        if not usage:
+            return "Memory: no data yet"
+        return (f"Memory: data {_mb(usage['data_bytes']):.1f} MB ({usage['data_rows']} rows) of {_mb(usage['budget_bytes']):.0f} MB budget, "
+                f"queue {_mb(usage['queue_bytes']):.1f} MB, plot {_mb(usage['plot_bytes']):.1f} MB, "
+                f"spilled {usage['spilled_rows']} rows ({_mb(usage['spilled_disk_bytes']):.1f} MB on disk)")
 
     async def periodically_update_dataframe(self, interval=5):
+        last_memory_log = time.time()
         try:
             while app_state.is_running(): # Controlled by app_state for current batch
-                await asyncio.sleep(interval)
-                if not app_state.is_running(): break # Check again after sleep
+                if not await app_state.sleep(interval): break # Wakes immediately when the batch stops
                 await self.update_dataframe()
+                if time.time() - last_memory_log >= self.memory_log_interval:
+                    print(self.memory_text())
+                    last_memory_log = time.time()
         except asyncio.CancelledError:
             print("Periodic dataframe update cancelled.")
             # Final update before exiting if cancelled
@@ -85,30 +372,38 @@ class AsyncDataManager:
         finally:
             print("Periodic dataframe update finished.")
 
-    async def save_data(self, batch_num=None):
-        await self.update_dataframe()  # Ensure the DataFrame is up to date
+    async def save_data(self, batch_num=None, file_path=None):
+        frame = await self.snapshot_copy()  # Up to date, and safe to write while acquisition continues
         
-        if self.data_df.empty:
+        if frame.empty:
             print("No data to save.")
             return
 
-        current_time_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        data_dir = "data"
-        os.makedirs(data_dir, exist_ok=True)
-        
-        filename_parts = ["data", current_time_str]
-        if batch_num is not None:
-            filename_parts.append(f"batch_{batch_num}")
-        
-        file_path = os.path.join(data_dir, f"{'_'.join(filename_parts)}.csv")
+        file_path = file_path or self.new_file_path(batch_num)
         
         try:
-            # If index was set with drop=False, it might be duplicated in CSV.
-            # Decide if index should be written. If 'Timestamp' and 'Name' are columns, don't write index.
-            if 'Timestamp' in self.data_df.columns and 'Name' in self.data_df.columns:
-                 self.data_df.to_csv(file_path, index=False)
-            else: # If Timestamp and Name are only in index
-                 self.data_df.to_csv(file_path, index=True)
-            print(f"Data successfully saved to {file_path}.")
+            await asyncio.get_running_loop().run_in_executor(None, write_data_file, frame, file_path)
         except Exception as e:
-            print(f"Error saving data: {e}")
\ No newline at end of file
+            print(f"Error saving data: {e}")
+
+    async def snapshot_batch(self):
+        # Hand the finished batch over as a frozen DataFrame and detach it from the manager,
+        # so the next batch can start while the snapshot is written in the background.
+        await self.update_dataframe()
+        async with self.lock:
+            # Written after reset_data() may have anchored the clock for the next batch: keep this batch's offset
+            frozen_df, file_path = freeze_offset(self.data_df), self.batch_file_path
+            if self.spill_store is not None:
+                frozen_df = SpilledBatch(self.spill_store, frozen_df) # The writer streams the chunks, then deletes them
+                self.spill_store = None
+            self.data_df = pd.DataFrame()
+            self._partial_rows_written = 0
+        return frozen_df, file_path
+
+    async def snapshot_copy(self):
+        # Copy of the current data that leaves the running batch untouched (Save button)
+        await self.update_dataframe()
+        async with self.lock:
+            if self.spill_store is not None:
+                return SpilledBatch(self.spill_store, self.data_df.copy(), owned=False)
+            return freeze_offset(self.data_df.copy())
\ No newline at end of file
@@ -0,0 +1,81 @@
+# In decimation.py
+import numpy as np
+
+def step_points(times, values, tail=None):
+    """Vectorised step-plot vertices: each value is held until the next time.
+
+    tail is how far the last step is drawn past its start; by default 10% of the
+    last step duration (1 s for a single-step schedule)."""
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if times.size == 0:
+        return np.empty(0), np.empty(0)
+    if tail is None:
+        tail = (times[-1] - times[-2]) * 0.1 if times.size > 1 else 1.0
+    x = np.empty(times.size * 2)
+    x[0::2] = times
+    x[1:-1:2] = times[1:]
+    x[-1] = times[-1] + tail
+    y = np.repeat(values, 2)
+    return x, y
+
+def visible_slice(times, x_min, x_max):
+    # Steps drawn inside [x_min, x_max], including the one already active at x_min
+    start = max(0, int(np.searchsorted(times, x_min, side='right')) - 1)
+    stop = int(np.searchsorted(times, x_max, side='right'))
+    return start, max(start + 1, stop)
+
+def decimate_step(times, values, x_min=None, x_max=None, max_steps=2048):
+    """Step-plot vertices for the visible range, reduced to at most ~max_steps buckets.
+
+    Steps are grouped into equal-time buckets; every bucket keeps its first, min, max
+    and last value, so spikes narrower than a pixel stay visible."""
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if times.size == 0:
+        return np.empty(0), np.empty(0)
+    full_tail = (times[-1] - times[-2]) * 0.1 if times.size > 1 else 1.0
+    x_min = times[0] if x_min is None else x_min
+    x_max = times[-1] + full_tail if x_max is None else x_max
+    start, stop = visible_slice(times, x_min, x_max)
+    t, v = times[start:stop], values[start:stop]
+    # Keep the step that extends past the view so the line reaches the right edge
+    tail = (times[stop] - t[-1]) if stop < times.size else full_tail
+    if t.size <= max_steps:
+        return step_points(t, v, tail)
+
+    edges = np.linspace(t[0], t[-1] + tail, max_steps + 1)
+    bucket = np.clip(np.searchsorted(edges, t, side='right') - 1, 0, max_steps - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], t.size] - 1
+    mins = np.minimum.reduceat(v, starts)
+    maxs = np.maximum.reduceat(v, starts)
+    x0 = t[starts]
+    x1 = np.r_[t[starts[1:]], t[-1] + tail]
+    x = np.column_stack((x0, x0, x0, x1)).ravel()
+    y = np.column_stack((v[starts], mins, maxs, v[ends])).ravel()
+    return x, y
+
+def decimate_minmax(times, values, max_points=2000):
+    """Line-plot points reduced to about max_points.
+
+    The samples are grouped into equal-time buckets and every bucket keeps its minimum and
+    maximum sample, in time order, so spikes survive the reduction."""
+    times = np.asarray(times)
+    values = np.asarray(values, dtype=float)
+    if times.size <= max_points:
+        return times, values
+    buckets = max(1, max_points // 2)
+    edges = np.linspace(float(times[0]), float(times[-1]), buckets + 1)
+    bucket = np.clip(np.searchsorted(edges, times.astype(float), side='right') - 1, 0, buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, times.size])
+    # First sample equal to its bucket's min (max): one vectorised pass instead of a per-bucket argmin
+    mins = np.repeat(np.minimum.reduceat(values, starts), counts)
+    maxs = np.repeat(np.maximum.reduceat(values, starts), counts)
+    min_index = np.flatnonzero(values == mins)
+    max_index = np.flatnonzero(values == maxs)
+    min_index = min_index[np.unique(bucket[min_index], return_index=True)[1]]
+    max_index = max_index[np.unique(bucket[max_index], return_index=True)[1]]
+    index = np.sort(np.column_stack((min_index, max_index)), axis=1).ravel()
+    return times[index], values[index]
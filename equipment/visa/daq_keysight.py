@@ -1,6 +1,6 @@
 from ..equipment import VisaEquipment, expand_ranges # Make sure this relative import is correct
 import asyncio
-from pandas import Timestamp
+from clock import clock
 
 class daq_keysight(VisaEquipment):
     def __init__(self, name, connection, settings=None, schedule=None, data_manager=None):
@@ -90,7 +90,7 @@ class daq_keysight(VisaEquipment):
                     print(f"{self.name}: Could not convert all readings to float: {ve}. Data: '{raw_reading_str}'")
                     format_values_float = [float('nan')] * len(self.scan_list)
 
-            current_timestamp = Timestamp.now()
+            current_timestamp = clock.now_ns() # int64 ns, monotonic within the batch
             data_tuples = []
             # self.scan_list contains the channel identifiers in the order they are scanned
             for i, channel_id_str in enumerate(self.scan_list):
@@ -103,7 +103,7 @@ class daq_keysight(VisaEquipment):
             return data_tuples
         except Exception as e: # Catch VISA communication errors
             print(f"{self.name}: Error during VISA read in read_full_scan_once: {e}")
-            current_timestamp = Timestamp.now()
+            current_timestamp = clock.now_ns() # int64 ns, monotonic within the batch
             return [(current_timestamp, self.name, f"Channel_{ch_id}", float('nan')) for ch_id in self.scan_list]
 
     async def read_channels(self, value=1): # 'value' from CSV is num_scans_to_acquire
@@ -113,6 +113,8 @@ class daq_keysight(VisaEquipment):
 
         # print(f"{self.name}: Starting active DAQ period to acquire {num_scans} scans.")
         self.is_actively_collecting = True
+        if self.data_manager:
+            self.data_manager.begin_burst(self.name) # Scans until end_burst are summarised as one steady state
         try:
             for i in range(num_scans):
                 # If this task is cancelled (e.g., batch stop), CancelledError will be raised
@@ -134,6 +136,8 @@ class daq_keysight(VisaEquipment):
             # Depending on severity, you might want to re-raise or just log
         finally:
             self.is_actively_collecting = False
+            if self.data_manager:
+                self.data_manager.end_burst(self.name)
             # print(f"{self.name}: is_actively_collecting set to False.")
 
     async def start(self): # Effective start method
@@ -2,7 +2,7 @@
 from ..equipment import VisaEquipment, expand_ranges
 from random import random
 import asyncio
-from pandas import Timestamp
+from clock import clock
 # import time
 
 class daq_simu(VisaEquipment):
@@ -31,16 +31,22 @@ class daq_simu(VisaEquipment):
     async def read_channels(self, value=1):
         # # Simulate reading voltage (dummy values)
         # print({channel: random() for channel in channels})
-        for _ in range(round(value)): ## if csv schedule, can record "value" points of data
-            random_floats = [str(random()) for _ in self.scan_list]
-            # print(random_floats)
-            # Join the float numbers into a string separated by commas
-            random_floats_string = ",".join(random_floats)
-            format_values = [float(val) for val in random_floats_string.split(",")]
-            timestamp = Timestamp.now()
-            data_tuples = [(timestamp, self.name, f"Channel_{channel}", voltage) for channel, voltage in zip(self.scan_list, format_values)]
+        if self.data_manager:
+            self.data_manager.begin_burst(self.name) # Scans until end_burst are summarised as one steady state
+        try:
+            for _ in range(round(value)): ## if csv schedule, can record "value" points of data
+                random_floats = [str(random()) for _ in self.scan_list]
+                # print(random_floats)
+                # Join the float numbers into a string separated by commas
+                random_floats_string = ",".join(random_floats)
+                format_values = [float(val) for val in random_floats_string.split(",")]
+                timestamp = clock.now_ns() # int64 ns, monotonic within the batch
+                data_tuples = [(timestamp, self.name, f"Channel_{channel}", voltage) for channel, voltage in zip(self.scan_list, format_values)]
+                if self.data_manager:
+                    await self.data_manager.add_data_batch(data_tuples)
+        finally:
             if self.data_manager:
-                await self.data_manager.add_data_batch(data_tuples)
+                self.data_manager.end_burst(self.name)
             # """Simulates reading voltage values from the channels."""
             # for channel in self.channels:
             #     voltage = random()  # Simulate a voltage reading
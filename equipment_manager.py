@@ -7,8 +7,11 @@ class EquipmentManager:
     def __init__(self, config, data_manager):
         self.config = config
         self.equipment_list = []
+        self.equipment_types = {} # name -> 'DAQ', 'PowerSupply', ... from the config
         self.data_manager = data_manager
         self.load_equipment()
+        # Bursts in the acquisition summary are tagged with the setpoints active when they start
+        self.data_manager.burst_stats.setpoint_source = self.active_setpoints
 
     def load_equipment(self):
         for eq_config in self.config['equipment']:
@@ -17,6 +20,8 @@ class EquipmentManager:
                 schedule = ConstantIntervalSchedule(eq_config['schedule']['sample_interval'])
             elif 'schedule_csv' in eq_config['schedule']:
                 schedule = CsvSchedule(eq_config['schedule']['schedule_csv'])
+                # A DAQ step is a recording burst, not a setpoint, so it is not replayed on resume
+                schedule.fast_forward = eq_config['schedule'].get('resume_fast_forward', eq_config.get('type') != 'DAQ')
             else:
                 schedule = None
 
@@ -26,6 +31,7 @@ class EquipmentManager:
             class_ = getattr(module, eq_config['class'])
             equipment_instance = class_(name=eq_config['name'], connection=eq_config['connection'], settings=eq_config['settings'], schedule=schedule, data_manager=self.data_manager)
             self.equipment_list.append(equipment_instance)
+            self.equipment_types[eq_config['name']] = eq_config.get('type')
     
     async def initialize_equipment(self):
         try:
@@ -43,6 +49,11 @@ class EquipmentManager:
             print(f"Error stopping equipment: {e}")
         print("Everything has been stopped.")
 
+    def active_setpoints(self):
+        # Last value each non-DAQ CSV schedule applied (None before its first step)
+        return {eq.name: getattr(eq.schedule, 'current_value', None) for eq in self.equipment_list
+                if self.equipment_types.get(eq.name) != 'DAQ' and isinstance(getattr(eq, 'schedule', None), CsvSchedule)}
+
     def is_main_daq_busy(self):
         for eq in self.equipment_list:
             # This assumes that any equipment that *can* be busy will have this flag.
@@ -0,0 +1,45 @@
+# In frame_pacer.py
+import time
+import dearpygui.dearpygui as dpg
+
+class FramePacer:
+    """Chooses how long the GUI thread waits before rendering the next frame.
+
+    Frames run at 'active_fps' while the operator interacts or new data is drawn,
+    drop to 'idle_fps' after 'idle_after_seconds' without either, and to
+    'minimized_fps' while the viewport is minimized."""
+    def __init__(self, config=None):
+        gui_config = (config or {}).get('gui', {})
+        self.active_interval = 1 / gui_config.get('active_fps', 60)
+        self.idle_interval = 1 / gui_config.get('idle_fps', 10)
+        self.minimized_interval = 1 / gui_config.get('minimized_fps', 2)
+        self.idle_after = gui_config.get('idle_after_seconds', 2.0)
+        self._last_activity = time.monotonic()
+        self._last_mouse = None
+        self.mode = "active"
+
+    def _input_activity(self):
+        mouse = dpg.get_mouse_pos(local=False)
+        moved = mouse != self._last_mouse
+        self._last_mouse = mouse
+        return moved or any(dpg.is_mouse_button_down(button) for button in (dpg.mvMouseButton_Left, dpg.mvMouseButton_Right))
+
+    def next_interval(self, drew_data=False):
+        """Seconds to wait after the frame just rendered. drew_data: the frame showed new data."""
+        now = time.monotonic()
+        if dpg.get_viewport_client_width() == 0 or dpg.get_viewport_client_height() == 0:
+            self.mode = "minimized"
+            return self.minimized_interval
+        if drew_data or self._input_activity():
+            self._last_activity = now
+        if now - self._last_activity < self.idle_after:
+            self.mode = "active"
+            return self.active_interval
+        self.mode = "idle"
+        return self.idle_interval
+
+    def wait(self, frame_start, interval):
+        # Sleep for what is left of the frame budget; a slow frame is not made up for
+        remaining = interval - (time.perf_counter() - frame_start)
+        if remaining > 0:
+            time.sleep(remaining)
@@ -2,17 +2,115 @@
 import dearpygui.dearpygui as dpg
 from state import app_state
 from schedule import ConstantIntervalSchedule, CsvSchedule
+from decimation import decimate_step
+from live_plot import LivePlotRenderer
+from frame_pacer import FramePacer
+from run_store import query_run
 import asyncio
+import queue
+import threading
 import time
 
+def _if_exists(func, tag, *args, **kwargs):
+    # Items may be gone by the time a queued update reaches the GUI thread
+    if dpg.does_item_exist(tag):
+        func(tag, *args, **kwargs)
+
 class GUIManager:
     def __init__(self, eqpt_manager, data_manager, app_runner_instance):
         self.eqpt_manager = eqpt_manager
         self.data_manager = data_manager
         self.app_runner = app_runner_instance
         self.progress_marker_start_time = 0 # For progress plot
+        self.live_plot = LivePlotRenderer(self.data_manager, config=self.app_runner.config)
+        self.progress_series = {} # series tag -> CsvSchedule drawn in the progress plot
+        self._progress_view = None # (x_min, x_max, width) the progress series were last decimated for
+        # DearPyGui is only touched from the GUI (main) thread. The acquisition loop runs in its
+        # own thread and hands GUI updates over through this queue, drained once per frame.
+        self.ui_queue = queue.SimpleQueue()
+        self.gui_alive = threading.Event() # Set from setup() until the render loop ends, readable from any thread
+        self.gui_thread_id = None
+        self.frame_pacer = FramePacer(self.app_runner.config)
+        self._last_stats_update = 0
+        self.auto_start = False # The operator presses Start for the first batch
+
+    ### GUI thread <-> acquisition thread
+    def call_in_gui(self, func, *args, **kwargs):
+        # Run func on the GUI thread: directly when already there, otherwise at the next frame
+        if threading.get_ident() == self.gui_thread_id:
+            func(*args, **kwargs)
+        else:
+            self.ui_queue.put((func, args, kwargs))
+
+    def post(self, func, tag, *args, **kwargs):
+        # Queue a DearPyGui item update, e.g. post(dpg.set_value, "info_text", "...")
+        self.call_in_gui(_if_exists, func, tag, *args, **kwargs)
+
+    def gui_running(self):
+        return self.gui_alive.is_set()
+
+    def mark_closed(self):
+        self.gui_alive.clear()
+
+    def batches_finished(self):
+        pass # The operator closes the window
+
+    def teardown(self):
+        if dpg.get_dearpygui_version(): 
+            try:
+                if dpg.is_dearpygui_running(): 
+                    dpg.stop_dearpygui()
+                dpg.destroy_context()
+                print("GUIManager: DearPyGui context destroyed.")
+            except Exception as e_dpg:
+                print(f"GUIManager: Error destroying DPG context: {e_dpg} (Context might already be destroyed or invalid)")
+
+    ### Status shown to the operator, callable from the acquisition thread
+    def set_info(self, message):
+        self.post(dpg.set_value, "info_text", message)
+
+    def set_batch_info(self, message):
+        self.post(dpg.set_value, "batch_info_text", message)
+
+    def set_start_button(self, **kwargs):
+        # label=..., enabled=...
+        self.post(dpg.configure_item, "start_stop_button", **kwargs)
+
+    def show_safety_alert(self, message):
+        self.post(dpg.set_value, "safety_alert_text", message)
+        self.post(dpg.show_item, "safety_alert_window")
+
+    def process_ui_queue(self):
+        processed = 0
+        while True:
+            try:
+                func, args, kwargs = self.ui_queue.get_nowait()
+            except queue.Empty:
+                return processed
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"GUI: Error applying queued update {getattr(func, '__name__', func)}: {e}")
+            processed += 1
+
+    def render_loop(self):
+        # Runs on the main thread until the window is closed; never waits on acquisition
+        self.gui_thread_id = threading.get_ident()
+        try:
+            while dpg.is_dearpygui_running():
+                frame_start = time.perf_counter()
+                updates = self.process_ui_queue()
+                self.refresh_progress_plot()
+                self.refresh_progress_marker()
+                drew_data = self.refresh_live_plot()
+                dpg.render_dearpygui_frame()
+                self.frame_pacer.wait(frame_start, self.frame_pacer.next_interval(drew_data or updates > 0))
+        finally:
+            self.gui_alive.clear()
+            self.process_ui_queue() # Apply what is left, e.g. for a final log of state
 
     def setup(self):
+        self.gui_thread_id = threading.get_ident()
         dpg.create_context()
         with dpg.theme() as disabled_theme:
             with dpg.theme_component(dpg.mvButton, enabled_state=False):
@@ -27,6 +125,8 @@ class GUIManager:
                 dpg.add_button(label="Save", width=75, callback=self.save_handler, tag="save_button", enabled=False) 
             # Batch info text will be updated by update_batch_display
             dpg.add_text("", tag="batch_info_text", pos=(dpg.get_item_pos("save_button")[0] + 85, dpg.get_item_pos("save_button")[1]))
+            # Progress and errors of background saves
+            dpg.add_text("", tag="save_status_text")
             
             with dpg.window(label="SYSTEM STATUS", modal=False, show=False, tag="safety_alert_window", pos=(0, 700), width=1000, height=100, no_close=True, no_move=True, no_resize=True):
                 dpg.add_text("System OK", tag="safety_alert_text", color=(0, 255, 0), wrap=980) # Green for OK
@@ -37,11 +137,14 @@ class GUIManager:
             with dpg.group(horizontal=False):
                 self.setup_progress_plot()
 
+            self.setup_history_view()
+
         dpg.set_exit_callback(self.on_attempt_to_close)
         dpg.create_viewport(title='Monitoring Dashboard', width=1024, height=850, disable_close=True)
         dpg.setup_dearpygui()
         dpg.show_viewport()
         dpg.set_primary_window("main_window", True)
+        self.gui_alive.set() # From here on the acquisition thread may queue GUI updates
         # Initialize batch display if in batch mode
         if app_state.batch_mode_active :
             self.update_batch_display() # Show "Batch: 1/N" or similar initial state
@@ -71,22 +174,22 @@ class GUIManager:
         elif dpg.does_item_exist("info_text"):
              dpg.set_value("info_text", "Ready. Press Start.")
 
+    def prepare_batch_display(self):
+        # Called from the acquisition thread before each batch
+        self.call_in_gui(self.update_batch_display)
+        self.call_in_gui(self.prepare_for_new_run)
+
     def clear_live_plot_series(self):
-        if dpg.does_item_exist("y_axis"):
-            # Slot 1 for series in y_axis
-            children_dict = dpg.get_item_info("y_axis")["children"]
-            if 1 in children_dict:
-                for series_tag in list(children_dict[1]): # Iterate over a copy
-                    if dpg.does_item_exist(series_tag):
-                        dpg.delete_item(series_tag)
-        # The plot_deque in data_manager is cleared by data_manager.reset_data()
+        self.live_plot.reset()
+        # The channel buffers in data_manager are cleared by data_manager.reset_data()
 
     def reset_progress_marker_display(self):
         if dpg.does_item_exist("progress_marker"):
             dpg.configure_item("progress_marker", x=[0.0])
 
-    def reset_progress_marker_start_time(self):
-        self.progress_marker_start_time = time.time()
+    def reset_progress_marker_start_time(self, elapsed_offset=0.0):
+        # elapsed_offset > 0 when a batch is resumed part-way through its schedules
+        self.progress_marker_start_time = time.time() - elapsed_offset
 
     def prepare_for_new_run(self):
         self.clear_live_plot_series()
@@ -101,89 +204,64 @@ class GUIManager:
 
 
     ## GUI---realtime plot
-    def update_live_plot(self):
-        if not self.data_manager.plot_deque: # If deque is empty, nothing to plot
-            # Consider if old series should be explicitly removed if data source becomes empty
-            # self.clear_live_plot_series() # This might be too aggressive here
-            return
-
-        channels = {channel for _, _, channel, _ in self.data_manager.plot_deque}
-        
-        # Remove series for channels no longer in the deque (optional, good for dynamic channels)
-        if dpg.does_item_exist("y_axis"):
-            children_dict = dpg.get_item_info("y_axis")["children"]
-            if 1 in children_dict:
-                existing_series_tags = list(children_dict[1])
-                for series_tag in existing_series_tags:
-                    label = dpg.get_item_configuration(series_tag)["label"]
-                    if label not in channels and dpg.does_item_exist(series_tag): # Check if series still exists
-                        dpg.delete_item(series_tag)
-
-        for channel in channels:
-            # Filter data for the current channel
-            channel_data = [(dt.timestamp(), data) for dt, _, sid, data in self.data_manager.plot_deque if sid == channel]
-            if not channel_data: continue # Skip if no data for this channel (e.g., after filtering)
-            
-            data_x, data_y = zip(*channel_data)
-            series_tag = f"line_{channel}"
-
-            if not dpg.does_item_exist(series_tag):
-                if dpg.does_item_exist("y_axis"): # Ensure axis exists
-                    dpg.add_line_series(list(data_x), list(data_y), parent="y_axis", label=channel, tag=series_tag)
-            else:
-                dpg.configure_item(series_tag, x=list(data_x), y=list(data_y))
-        
-        if dpg.does_item_exist("y_axis"): dpg.fit_axis_data("y_axis")
-        if dpg.does_item_exist("x_axis"): dpg.fit_axis_data("x_axis")
-
-
-    async def live_plot_updater(self):
-        try:
-            while app_state.is_running(): # Controlled by app_state for the current batch
-                if not dpg.is_dearpygui_running(): break
-                self.update_live_plot()
-                # dpg.render_dearpygui_frame() # Render call is in ApplicationRunner.run
-                await asyncio.sleep(1/30)  # Update at roughly 30 FPS
-        except asyncio.CancelledError:
-            print("Live plot updater cancelled.")
-            raise
-        finally:
-            print("Live plot updater finished.")
-
-
-    async def update_progress_marker(self):
+    def refresh_live_plot(self):
+        # Called every frame on the GUI thread. Incremental: only channels with new samples
+        # are pushed and idle frames are skipped; after a batch the history stays browsable.
+        drew = self.live_plot.render()
+        now = time.time()
+        if now - self._last_stats_update >= 1 and dpg.does_item_exist("render_stats_text"):
+            dpg.set_value("render_stats_text", f"{self.live_plot.stats_text()}, GUI {self.frame_pacer.mode}")
+            _if_exists(dpg.set_value, "memory_stats_text", self.data_manager.memory_text())
+            self._last_stats_update = now
+        return drew
+
+    def refresh_progress_marker(self):
         # self.progress_marker_start_time is set by reset_progress_marker_start_time()
-        try:
-            while app_state.is_running(): # Controlled by app_state for the current batch
-                if not dpg.is_dearpygui_running(): break
-                current_time_elapsed = time.time() - self.progress_marker_start_time
-                if dpg.does_item_exist("progress_marker"):
-                    dpg.configure_item("progress_marker", x=[current_time_elapsed])
-                else:
-                    # This might happen if plot is not fully set up yet
-                    # print("Progress marker does not exist yet.")
-                    pass
-                await asyncio.sleep(1)
-        except asyncio.CancelledError:
-            print("Progress marker updater cancelled.")
-            raise
-        finally:
-            print("Progress marker updater finished.")
+        if app_state.is_running() and dpg.does_item_exist("progress_marker"):
+            dpg.configure_item("progress_marker", x=[time.time() - self.progress_marker_start_time])
 
 
     ### GUI---run live plot
     def setup_live_plot(self):
-        with dpg.plot(label="Sensor Data", width=1024, height=600, tag="sensor_plot"):
-            dpg.add_plot_legend()
-            dpg.add_plot_axis(dpg.mvXAxis, label="Time", time=True, tag="x_axis")
-            dpg.add_plot_axis(dpg.mvYAxis, label="Data", tag="y_axis")
+        groups = self.live_plot.groups
+        with dpg.group(horizontal=True):
+            dpg.add_checkbox(label="Follow live data (uncheck to zoom/pan through the run)", default_value=True, tag="live_follow_checkbox",
+                             callback=lambda sender, app_data: self.live_plot.set_follow(app_data))
+            if len(groups) > 1:
+                for group in groups:
+                    # user_data carries the group, a lambda default would bind the last one
+                    dpg.add_checkbox(label=group.name, default_value=group.visible, tag=group.toggle_tag, user_data=group,
+                                     callback=lambda sender, app_data, user_data: self.live_plot.set_group_visible(user_data, app_data))
+        # One plot (and y-axis) per channel group, sharing the 600 px the single plot used to take
+        plot_height = max(200, 600 // max(1, len(groups) - 1))
+        for group in groups:
+            # Histories hold UTC epoch seconds; only the axis shows them as local clock time
+            with dpg.plot(label=group.name, width=1024, height=plot_height, tag=group.plot_tag, use_local_time=True,
+                          show=group.visible and self.live_plot.group_has_channels(group)):
+                dpg.add_plot_legend()
+                dpg.add_plot_axis(dpg.mvXAxis, label="Time", time=True, tag=group.x_axis_tag)
+                dpg.add_plot_axis(dpg.mvYAxis, label=group.y_label, tag=group.y_axis_tag)
+        dpg.add_text("", tag="render_stats_text", color=(160, 160, 160)) # Per-frame CPU cost of the live plot
+        dpg.add_text("", tag="memory_stats_text", color=(160, 160, 160)) # Data manager memory use and spilled rows
     
+    def show_save_status(self, message, error=False):
+        self.post(dpg.set_value, "save_status_text", message)
+        self.post(dpg.configure_item, "save_status_text", color=(255, 80, 80) if error else (160, 160, 160))
+
+    def show_save_result(self, result):
+        # Called by the PersistenceWorker when a background save finishes
+        what = f"Batch {result.batch_num}" if result.batch_num is not None else "Data copy"
+        if result.error:
+            self.show_save_status(f"{what} NOT saved: {result.error}", error=True)
+        else:
+            self.show_save_status(f"{what} saved to {result.file_path} ({result.rows} rows, {result.duration_s:.1f}s).")
+
     ### GUI---Save button
     def save_handler(self, sender, app_data, user_data):
         loop = self.app_runner.get_loop() # Get the loop from ApplicationRunner
         if loop and not loop.is_closed() and loop.is_running():
-            print("GUI: Save button pressed. Creating save task on the explicitly managed loop.")
-            loop.create_task(self.data_manager.save_data()) # save_data takes no args here
+            print("GUI: Save button pressed. Queuing a background save on the acquisition loop.")
+            asyncio.run_coroutine_threadsafe(self.app_runner.save_copy_in_background(), loop)
         else:
             print("GUI ERROR: Event loop not available, closed, or not running when trying to save.")
             if loop:
@@ -196,7 +274,7 @@ class GUIManager:
     ## GUI---Exit button
     def exit_handler(self):
         print("GUI Exit handler: Attempting to stop application.")
-        app_state.stop() # Signal ongoing batch (if any) to stop
+        self.app_runner.call_in_loop(app_state.stop) # Signal ongoing batch (if any) to stop
 
         # The DPG window closing is handled by ApplicationRunner.run's finally block
         # or its main while loop exiting.
@@ -229,31 +307,30 @@ class GUIManager:
 
 
     ### GUI---run progress plot---only for step plot
-    def transform_for_step_plot(self, schedule_data):
-        step_data = []
-        if not schedule_data: return [] # Handle empty schedule data
-        for i, (time_val, value) in enumerate(schedule_data):
-            if i < len(schedule_data) - 1:
-                next_time = schedule_data[i + 1][0]
-                step_data.append((time_val, value))
-                step_data.append((next_time, value))
-            else:
-                step_data.append((time_val, value))
-                 # Optionally extend the last step for a short duration for visibility
-                if len(schedule_data) > 1: # if there's more than one point
-                    last_duration_extension = schedule_data[-1][0] - schedule_data[-2][0] if len(schedule_data) > 1 else 1.0 # extend by last step duration or 1s
-                    step_data.append((time_val + last_duration_extension * 0.1 , value)) # extend by 10% of last step
-                else: # single point schedule
-                    step_data.append((time_val + 1.0, value)) # extend by 1s
-
-        return step_data
+    def update_progress_series(self, x_min=None, x_max=None, width=1024):
+        # Only the visible part of each schedule is drawn, decimated to about one step per pixel
+        for series_tag, schedule in self.progress_series.items():
+            if dpg.does_item_exist(series_tag):
+                x, y = decimate_step(schedule.times, schedule.values, x_min, x_max, max_steps=max(64, int(width)))
+                dpg.configure_item(series_tag, x=x.tolist(), y=y.tolist())
+
+    def refresh_progress_plot(self):
+        # Re-decimate when the progress plot is zoomed, panned or resized
+        if not self.progress_series or not dpg.does_item_exist("progress_x_axis"):
+            return
+        x_min, x_max = dpg.get_axis_limits("progress_x_axis")
+        width = dpg.get_item_rect_size("pro_plot")[0] or 1024
+        view = (round(x_min, 3), round(x_max, 3), width)
+        if view != self._progress_view:
+            self._progress_view = view
+            self.update_progress_series(x_min, x_max, width)
 
     ### GUI---run progress plot
     def setup_progress_plot(self):
         try:
             with dpg.plot(label="Progress", width=1024, height=200, tag="pro_plot"):
                 dpg.add_plot_legend()
-                x_axis = dpg.add_plot_axis(dpg.mvXAxis, label="Overall Time (s)")
+                x_axis = dpg.add_plot_axis(dpg.mvXAxis, label="Overall Time (s)", tag="progress_x_axis")
                 y_axis_p = dpg.add_plot_axis(dpg.mvYAxis, label="Value")
                 dpg.add_vline_series([0.0], parent=x_axis, label="Current Progress", tag="progress_marker") # Ensure x is float
                 
@@ -261,35 +338,103 @@ class GUIManager:
                 # For now, assuming schedules are fixed.
                 for equipment in self.eqpt_manager.equipment_list:
                     if hasattr(equipment, 'schedule') and equipment.schedule and \
-                       isinstance(equipment.schedule, CsvSchedule) and equipment.schedule.schedule_data:
-                        step_data = self.transform_for_step_plot(equipment.schedule.schedule_data)
-                        if step_data: # Ensure step_data is not empty
-                            times, values = zip(*step_data)
-                            dpg.add_line_series(list(times), list(values), parent=y_axis_p, label=equipment.name)
+                       isinstance(equipment.schedule, CsvSchedule) and len(equipment.schedule):
+                        series_tag = f"progress_{equipment.name}"
+                        dpg.add_line_series([], [], parent=y_axis_p, label=equipment.name, tag=series_tag)
+                        self.progress_series[series_tag] = equipment.schedule
+                self.update_progress_series()
         except Exception as e:
             print(f"Error while creating progress plot: {e}")
 
+    ### GUI---stored runs: a time range of saved channels, read with run_store.query_run
+    def setup_history_view(self):
+        with dpg.collapsing_header(label="Stored runs", default_open=False):
+            with dpg.group(horizontal=True):
+                dpg.add_combo([], label="Run", width=420, tag="history_run_combo")
+                dpg.add_button(label="Refresh", width=75, callback=lambda: self._in_loop(self.list_stored_runs()))
+            with dpg.group(horizontal=True):
+                dpg.add_input_text(label="Channels", hint="Channel_101,Channel_108 (empty: all)", width=300, tag="history_channels_input")
+                dpg.add_input_text(label="From", hint="2024-08-01 10:00", width=150, tag="history_start_input")
+                dpg.add_input_text(label="To", hint="2024-08-01 10:10", width=150, tag="history_end_input")
+                dpg.add_button(label="Load", width=75, callback=lambda: self.load_history_view())
+            dpg.add_text("", tag="history_status_text", color=(160, 160, 160))
+            with dpg.plot(label="Stored run", width=1024, height=300, tag="history_plot", use_local_time=True):
+                dpg.add_plot_legend()
+                dpg.add_plot_axis(dpg.mvXAxis, label="Time", time=True, tag="history_x_axis")
+                dpg.add_plot_axis(dpg.mvYAxis, label="Value", tag="history_y_axis")
+
+    def _in_loop(self, coroutine):
+        # Catalog and file reads run in the acquisition loop's executor, never on the GUI thread
+        loop = self.app_runner.get_loop()
+        if loop and not loop.is_closed() and loop.is_running():
+            asyncio.run_coroutine_threadsafe(coroutine, loop)
+        else:
+            coroutine.close()
+            dpg.set_value("history_status_text", "Event loop not running.")
+
+    async def list_stored_runs(self):
+        try:
+            runs = await asyncio.get_running_loop().run_in_executor(None, self.app_runner.run_catalog.find)
+        except Exception as e:
+            self.post(dpg.set_value, "history_status_text", f"Could not read the run catalog: {e}")
+            return
+        self.post(dpg.configure_item, "history_run_combo", items=runs['file_path'].tolist())
+        self.post(dpg.set_value, "history_status_text", f"{len(runs)} runs in the catalog.")
+
+    def load_history_view(self):
+        run = dpg.get_value("history_run_combo")
+        if not run:
+            dpg.set_value("history_status_text", "Select a run first (Refresh lists the saved runs).")
+            return
+        channels = [c.strip() for c in dpg.get_value("history_channels_input").split(',') if c.strip()] or None
+        start = dpg.get_value("history_start_input").strip() or None
+        end = dpg.get_value("history_end_input").strip() or None
+        dpg.set_value("history_status_text", f"Loading {run}...")
+        self._in_loop(self.query_stored_run(run, channels, start, end))
+
+    async def query_stored_run(self, run, channels, start, end):
+        width = 1024
+        try:
+            arrays = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: query_run(run, channels, start, end, output='arrays', max_points=2 * width))
+        except Exception as e:
+            self.post(dpg.set_value, "history_status_text", f"Could not load {run}: {e}")
+            return
+        self.call_in_gui(self._draw_history, run, arrays)
+
+    def _draw_history(self, run, arrays):
+        if not dpg.does_item_exist("history_y_axis"):
+            return
+        dpg.delete_item("history_y_axis", children_only=True)
+        points = 0
+        for channel, (times, values) in arrays.items():
+            # UTC timestamps, shown as local clock time by the axis like the live plot
+            dpg.add_line_series((times / 1e9).tolist(), values.tolist(), label=channel, parent="history_y_axis")
+            points += times.size
+        dpg.fit_axis_data("history_x_axis")
+        dpg.fit_axis_data("history_y_axis")
+        dpg.set_value("history_status_text", f"{run}: {len(arrays)} channels, {points} points.")
+
     def start_stop_action(self, current_label_or_action):
+        # Runs on the acquisition loop; the button callback hands it over from the GUI thread
         print(f"DEBUG: start_stop_action called with: {current_label_or_action}")
         # current_label_or_action can be "Start", "Stop", or the label from the button
-        action_is_start = False
-        if isinstance(current_label_or_action, str) and current_label_or_action == "Start":
-            action_is_start = True
-        elif dpg.does_item_exist("start_stop_button") and dpg.get_item_label("start_stop_button") == "Start":
-            action_is_start = True
+        action_is_start = current_label_or_action == "Start"
 
         if action_is_start:
-            if dpg.does_item_exist("start_stop_button"): dpg.set_item_label("start_stop_button", "Stop")
-            if dpg.does_item_exist("save_button"): dpg.disable_item("save_button") # Disable Save when run starts
-            app_state.start()
+            if not app_state.start(): # e.g. HALTED, or the previous batch is still stopping
+                return
+            self.set_start_button(label="Stop")
+            self.post(dpg.disable_item, "save_button") # Disable Save when run starts
         else: # Action is Stop
-            if dpg.does_item_exist("start_stop_button"): dpg.set_item_label("start_stop_button", "Start")
-            if dpg.does_item_exist("save_button"): dpg.enable_item("save_button") # Enable Save when run stops
-            if dpg.does_item_exist("info_text"):
-                dpg.set_value("info_text", "Run stopped. Data auto-saved. Press Save for additional copy, or Start for next batch.")
+            was_running = app_state.is_running()
+            self.set_start_button(label="Start")
+            self.post(dpg.enable_item, "save_button") # Enable Save when run stops
+            if was_running: # A Stop while armed only cancels the start, the orchestrator re-arms the batch
+                self.set_info("Run stopped. Data auto-saved. Press Save for additional copy, or Start for next batch.")
             app_state.stop()
 
     ### GUI---Start button
     def start_stop_handler(self, sender, app_data, user_data):
         current_label = dpg.get_item_label(sender)
-        self.start_stop_action(current_label)
\ No newline at end of file
+        self.app_runner.call_in_loop(self.start_stop_action, current_label)
\ No newline at end of file
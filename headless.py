@@ -0,0 +1,113 @@
+# In headless.py
+import json
+import os
+import threading
+import time
+from state import app_state
+
+class HeadlessFrontend:
+    """Front end for unattended runs: same interface as GUIManager, without DearPyGui.
+
+    Every batch starts on its own. Status goes to the log and, if configured, to a JSON
+    status file that other tools can poll. The main thread only waits; it returns when
+    all batches are done or on Ctrl+C."""
+    def __init__(self, eqpt_manager, data_manager, app_runner_instance):
+        self.eqpt_manager = eqpt_manager
+        self.data_manager = data_manager
+        self.app_runner = app_runner_instance
+        headless_config = self.app_runner.config.get('headless', {})
+        self.status_file = headless_config.get('status_file', os.path.join("data", "status.json"))
+        self.auto_start = True
+        self.progress_marker_start_time = 0
+        self.closed = threading.Event()
+        self._status_lock = threading.Lock()
+        self.status = {'state': app_state.state, 'batch': None, 'info': "", 'safety_alert': None, 'save_status': ""}
+
+    ### Lifecycle, called by ApplicationRunner.run on the main thread
+    def setup(self):
+        print(f"Headless mode: status is logged{' and written to ' + self.status_file if self.status_file else ''}.")
+        self._update_status(info="Starting up.")
+
+    def render_loop(self):
+        try:
+            while not self.closed.wait(0.5): # Short waits keep Ctrl+C responsive
+                pass
+        except KeyboardInterrupt:
+            print("Headless mode: Interrupted, stopping the run...")
+
+    def mark_closed(self):
+        self.closed.set()
+
+    def batches_finished(self):
+        self._update_status(info="Finished.")
+        self.closed.set()
+
+    def teardown(self):
+        self._update_status(info="Stopped.")
+
+    ### Same interface as GUIManager
+    def gui_running(self):
+        return not self.closed.is_set()
+
+    def call_in_gui(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+    def set_info(self, message):
+        print(f"STATUS: {message}")
+        self._update_status(info=message)
+
+    def set_batch_info(self, message):
+        self._update_status(batch_info=message)
+
+    def set_start_button(self, **kwargs):
+        pass # Nothing to press without an operator
+
+    def show_safety_alert(self, message):
+        print(f"SAFETY: {message}")
+        self._update_status(safety_alert=message)
+
+    def show_save_status(self, message, error=False):
+        print(f"SAVE{' ERROR' if error else ''}: {message}")
+        self._update_status(save_status=message)
+
+    def show_save_result(self, result):
+        # Called by the PersistenceWorker when a background save finishes
+        what = f"Batch {result.batch_num}" if result.batch_num is not None else "Data copy"
+        if result.error:
+            self.show_save_status(f"{what}: saving to {result.file_path} FAILED: {result.error}", error=True)
+        else:
+            self.show_save_status(f"{what} saved to {result.file_path} ({result.rows} rows, {result.duration_s:.1f}s).")
+
+    def prepare_batch_display(self):
+        batch = f"{app_state.batch_current_run}/{app_state.batch_total_runs}"
+        print(f"STATUS: Preparing batch {batch}.")
+        self._update_status(batch=batch)
+
+    def reset_progress_marker_start_time(self, elapsed_offset=0.0):
+        self.progress_marker_start_time = time.time() - elapsed_offset
+
+    def start_stop_action(self, current_label_or_action):
+        if current_label_or_action == "Start":
+            if app_state.start():
+                self._update_status(info=f"Running batch {app_state.batch_current_run}.")
+        else:
+            app_state.stop()
+
+    def _update_status(self, **fields):
+        # Atomic like the checkpoint file, so readers never see half a status
+        with self._status_lock:
+            self.status.update(fields)
+            self.status['state'] = app_state.state
+            self.status['updated_at'] = time.time()
+            if not self.status_file:
+                return
+            try:
+                directory = os.path.dirname(self.status_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.status_file}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.status, f, indent=2)
+                os.replace(tmp_path, self.status_file)
+            except Exception as e:
+                print(f"Headless mode: Error writing status file {self.status_file}: {e}")
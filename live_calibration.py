@@ -0,0 +1,85 @@
+# In live_calibration.py
+import json
+import os
+import time
+import numpy as np
+from numpy.polynomial import polynomial
+
+class CalibrationStage:
+    """Applies channel calibrations to sample blocks as they are acquired.
+
+    Coefficients come from the same JSON as the post-processing scripts:
+        {"Channel_101": {"m": 1.0037, "b": 0.315}, ...}       value = m * raw + b
+        {"Channel_205": {"poly": [c0, c1, c2]}, ...}           value = c0 + c1 * raw + c2 * raw**2
+    Channels without an entry pass through unchanged. Blocks keep their raw values next to
+    the calibrated ones, so the stored data has both while plots, safety rules and the
+    burst summary use calibrated values. The file is reloaded when it changes."""
+    def __init__(self, config=None):
+        calibration_config = (config or {}).get('calibration', {})
+        self.enabled = calibration_config.get('enabled', False)
+        self.path = calibration_config.get('path', os.path.join('data', 'calibration_coefficients.json'))
+        self.check_interval = calibration_config.get('check_interval_seconds', 2)
+        self.coefficients = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self._cache = {} # channels tuple of a block -> (gain, offset, [(position, poly coefficients)])
+        if self.enabled:
+            self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r') as f:
+                coefficients = json.load(f)
+        except FileNotFoundError:
+            print(f"Calibration: {self.path} not found, values pass through uncalibrated.")
+            self.coefficients, self._mtime, self._cache = {}, None, {}
+            return False
+        except Exception as e:
+            # A half-saved file while someone edits it: keep the coefficients in use
+            print(f"Calibration: Error reading {self.path}, keeping the previous coefficients: {e}")
+            return False
+        self.coefficients, self._mtime, self._cache = coefficients, mtime, {}
+        print(f"Calibration: Loaded coefficients for {len(coefficients)} channels from {self.path}.")
+        return True
+
+    def _check_for_changes(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def _coefficients_for(self, channels):
+        cached = self._cache.get(channels)
+        if cached is None:
+            gain, offset, polys = np.ones(len(channels)), np.zeros(len(channels)), []
+            for position, channel in enumerate(channels):
+                entry = self.coefficients.get(channel)
+                if not entry:
+                    continue
+                if 'poly' in entry:
+                    polys.append((position, np.asarray(entry['poly'], dtype=np.float64)))
+                else:
+                    gain[position] = entry.get('m', 1.0)
+                    offset[position] = entry.get('b', 0.0)
+            cached = self._cache[channels] = (gain, offset, polys)
+        return cached
+
+    def apply(self, blocks):
+        if not self.enabled:
+            return blocks
+        self._check_for_changes()
+        calibrated = []
+        for block in blocks:
+            gain, offset, polys = self._coefficients_for(block.channels)
+            values = block.values * gain + offset # Whole scan at once, by channel position
+            for position, coefficients in polys:
+                values[position] = polynomial.polyval(block.values[position], coefficients)
+            calibrated.append(block._replace(values=values, raw=block.values))
+        return calibrated
@@ -0,0 +1,128 @@
+# In live_plot.py
+import time
+import dearpygui.dearpygui as dpg
+from channel_groups import load_channel_groups
+
+class LivePlotRenderer:
+    """Pushes only the channels whose data changed since the last frame into DearPyGui.
+
+    Channels are drawn in one plot per channel group, so quantities with different units
+    get their own y-axis. Each channel history carries a sequence number; a frame with
+    no new samples and no change of view is skipped before touching DearPyGui. Channels
+    of hidden groups are neither queried nor copied. Every channel is drawn at the
+    history level matching the visible x-range and plot width, so a 24 h run costs the
+    same per frame as a 1 min one. While 'follow' is set the whole run is shown and the
+    axes are refit; otherwise the operator's zoom/pan decides the range."""
+    def __init__(self, data_manager, groups=None, config=None):
+        self.data_manager = data_manager
+        self.groups = groups if groups is not None else load_channel_groups(config or {})
+        self.follow = True
+        self.series = {} # channel -> series tag
+        self.rendered_seq = {} # channel -> history seq last pushed to DearPyGui
+        self.levels = {} # channel -> history level currently drawn (0 = raw)
+        self._channel_groups = {} # channel -> ChannelGroup, resolved once per channel
+        self._last_plot_seq = -1
+        self._last_views = {} # group index -> (x_min, x_max, width) last drawn
+        # Per-frame CPU cost
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+        self.avg_frame_ms = 0.0 # Exponential moving average over rendered frames
+        self.last_frame_ms = 0.0
+
+    def reset(self):
+        for series_tag in self.series.values():
+            if dpg.does_item_exist(series_tag):
+                dpg.delete_item(series_tag)
+        self.series.clear()
+        self.rendered_seq.clear()
+        self.levels.clear()
+        self._last_plot_seq = -1
+        self._last_views.clear()
+
+    def set_follow(self, follow):
+        self.follow = follow
+        self._last_views.clear() # Redraw for the new range on the next frame
+
+    def set_group_visible(self, group, visible):
+        group.visible = visible
+        if dpg.does_item_exist(group.plot_tag):
+            dpg.configure_item(group.plot_tag, show=visible and self.group_has_channels(group))
+        self._last_views.pop(group.index, None) # Hidden channels were not kept up to date
+
+    def group_for(self, channel):
+        group = self._channel_groups.get(channel)
+        if group is None:
+            group = next((g for g in self.groups if g.channels is not None and channel in g.channels), self.groups[-1])
+            self._channel_groups[channel] = group
+        return group
+
+    def group_has_channels(self, group):
+        # The catch-all plot stays hidden until a channel outside the configured groups shows up
+        if group.channels is not None or len(self.groups) == 1:
+            return True
+        return any(self.group_for(channel) is group for channel in self.series)
+
+    def _current_view(self, group):
+        width = int(dpg.get_item_rect_size(group.plot_tag)[0] or 1024)
+        if self.follow:
+            return (None, None, width)
+        x_min, x_max = dpg.get_axis_limits(group.x_axis_tag)
+        return (round(x_min, 3), round(x_max, 3), width)
+
+    def render(self):
+        """Update changed series. Returns True if anything was pushed to DearPyGui."""
+        start = time.perf_counter()
+        visible = [g for g in self.groups if g.visible and dpg.does_item_exist(g.y_axis_tag)]
+        plot_seq = self.data_manager.plot_seq
+        views = {g.index: self._current_view(g) for g in visible}
+        changed_views = {index for index, view in views.items() if view != self._last_views.get(index)}
+        if not visible or (plot_seq == self._last_plot_seq and not changed_views):
+            self.frames_skipped += 1
+            return False
+        self._last_plot_seq = plot_seq
+        self._last_views.update(views)
+
+        # Copy what changed under the lock, the acquisition thread keeps appending meanwhile
+        updates = []
+        with self.data_manager.plot_lock:
+            for channel, history in self.data_manager.channel_histories.items():
+                group = self.group_for(channel)
+                if group.index not in views:
+                    continue # Hidden group: nothing is queried or copied
+                if group.index not in changed_views and self.rendered_seq.get(channel) == history.seq:
+                    continue
+                self.rendered_seq[channel] = history.seq
+                x_min, x_max, width = views[group.index]
+                # Two points per pixel column is enough to show every min/max spike
+                x, y, self.levels[channel] = history.query(x_min, x_max, max_points=2 * width)
+                updates.append((channel, group, x.tolist(), y.tolist()))
+
+        changed_groups = set()
+        for channel, group, x, y in updates:
+            series_tag = self.series.get(channel)
+            if series_tag is None:
+                series_tag = f"line_{channel}"
+                self.series[channel] = series_tag
+                dpg.add_line_series(x, y, parent=group.y_axis_tag, label=channel, tag=series_tag)
+                dpg.configure_item(group.plot_tag, show=True)
+            else:
+                dpg.configure_item(series_tag, x=x, y=y)
+            changed_groups.add(group.index)
+
+        if self.follow:
+            for group in visible:
+                if group.index in changed_groups:
+                    dpg.fit_axis_data(group.y_axis_tag)
+                    dpg.fit_axis_data(group.x_axis_tag)
+
+        self.last_frame_ms = (time.perf_counter() - start) * 1000
+        self.avg_frame_ms = self.last_frame_ms if not self.frames_rendered else 0.9 * self.avg_frame_ms + 0.1 * self.last_frame_ms
+        self.frames_rendered += 1
+        return bool(changed_groups)
+
+    def stats_text(self):
+        coarsest = max(self.levels.values(), default=0)
+        shown = sum(1 for channel in self.series if self.group_for(channel).visible)
+        return (f"Live plot: {self.avg_frame_ms:.2f} ms/frame avg ({self.last_frame_ms:.2f} last), "
+                f"{self.frames_rendered} drawn, {self.frames_skipped} skipped, "
+                f"{shown}/{len(self.series)} channels shown, history level {coarsest}")
@@ -1,4 +1,5 @@
 # In main.py
+import argparse
 import yaml
 import asyncio
 from application_runner import ApplicationRunner
@@ -9,9 +10,18 @@ def load_config(filename):
     with open(filename, 'r') as file:
         return yaml.safe_load(file)
 
-async def main_coroutine(loop_instance): # Renamed and accepts the loop instance
+def parse_args():
+    parser = argparse.ArgumentParser(description="DAQ/PSU control system")
+    parser.add_argument('--config', default='config.yaml', help="Configuration file to load.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the interrupted batch from the last checkpoint instead of starting at step 0.")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run without the GUI: batches start automatically, status goes to the log and a status file.")
+    return parser.parse_args()
+
+def main(args):
     # Load configuration
-    config = load_config('config.yaml')
+    config = load_config(args.config)
 
     # Setup batch parameters in app_state
     batch_config = config.get('batch_settings', {})
@@ -21,59 +31,19 @@ async def main_coroutine(loop_instance): # Renamed and accepts the loop instance
         app_state.auto_start_next_batch = batch_config.get('auto_start_next_batch', False)
         app_state.auto_start_delay_s = batch_config.get('auto_start_delay_seconds', 5)
 
-    # Create and run the application, passing the loop
-    app_runner = ApplicationRunner(config, loop_instance)
-    await app_runner.run()
+    # The front end (GUI or headless) runs on this (main) thread; the event loop for acquisition,
+    # schedules and safety runs in a background thread owned by the ApplicationRunner, which also closes it.
+    acquisition_loop = asyncio.new_event_loop()
+    app_runner = ApplicationRunner(config, acquisition_loop, resume=args.resume, headless=args.headless)
+    app_runner.run()
 
 if __name__ == "__main__":
-    active_loop = None
+    cli_args = parse_args()
     try:
-        # Get an event loop
-        try:
-            active_loop = asyncio.get_running_loop()
-        except RuntimeError: # No running loop
-            active_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(active_loop)
-
-        active_loop.run_until_complete(main_coroutine(active_loop))
+        main(cli_args)
     except KeyboardInterrupt:
         print("Caught keyboard interrupt. Exiting...")
-    except RuntimeError as e:
-        if "Event loop is closed" in str(e):
-            print(f"Main loop error: {e}. The event loop was closed unexpectedly.")
-        else:
-            print(f"Unexpected runtime error in main: {e}")
-            import traceback
-            traceback.print_exc()
     except Exception as e:
         print(f"Unexpected error in main: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        if active_loop and not active_loop.is_closed():
-            print("Main: Cleaning up tasks and closing event loop...")
-            # Gather all remaining tasks (except the current one, if any)
-            tasks = [t for t in asyncio.all_tasks(loop=active_loop) if t is not asyncio.current_task(loop=active_loop)]
-            if tasks:
-                print(f"Main: Cancelling {len(tasks)} outstanding tasks...")
-                for task in tasks:
-                    task.cancel()
-                # Give tasks a chance to process cancellation
-                try:
-                    # This gather should run on the loop if it's still running,
-                    # but if run_until_complete exited, the loop might be stopping.
-                    active_loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
-                    print("Main: Outstanding tasks processed.")
-                except RuntimeError as e_gather: # Handle if loop is already stopping/closed
-                     print(f"Main: Error during gather in finally: {e_gather}")
-                     # If loop is closed, tasks might not have cleaned up via gather
-                     for task in tasks: # Check their state
-                         if not task.done() and not task.cancelled():
-                             print(f"Main: Task {task.get_name()} did not complete cancellation.")
-
-            active_loop.close()
-            print("Main: Event loop closed.")
-        elif active_loop and active_loop.is_closed():
-            print("Main: Event loop was already closed.")
-        else:
-            print("Main: No active event loop found in finally block.")
\ No newline at end of file
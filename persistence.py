@@ -0,0 +1,80 @@
+# In persistence.py
+import asyncio
+import time
+from collections import namedtuple
+
+SaveJob = namedtuple('SaveJob', ['frame', 'file_path', 'batch_num', 'submitted_at', 'metadata'], defaults=(None,))
+SaveResult = namedtuple('SaveResult', ['file_path', 'batch_num', 'rows', 'duration_s', 'error'])
+
+class PersistenceWorker:
+    """Writes finished batches in the background so the next batch can start immediately.
+
+    Jobs carry a frozen DataFrame snapshot; the data manager never touches it again.
+    Serialisation runs in the default executor, so the event loop keeps driving
+    acquisition, schedules and safety checks while a batch is written."""
+    def __init__(self, write_function, on_result=None, catalog=None):
+        self.write_function = write_function # write_function(frame, file_path), blocking
+        self.on_result = on_result # Called in the loop with a SaveResult when a job finishes
+        self.catalog = catalog # RunCatalog; jobs submitted with metadata are indexed once written
+        self.queue = None
+        self.results = []
+        self.task = None
+
+    def start(self, loop):
+        self.queue = asyncio.Queue()
+        self.task = loop.create_task(self._run())
+
+    def submit(self, frame, file_path, batch_num=None, metadata=None):
+        if self.queue is None:
+            raise RuntimeError("PersistenceWorker.submit() called before start().")
+        if frame is None or frame.empty:
+            print(f"PersistenceWorker: No data to save for batch {batch_num}.")
+            return False
+        self.queue.put_nowait(SaveJob(frame, file_path, batch_num, time.time(), metadata))
+        print(f"PersistenceWorker: Batch {batch_num} queued for saving to {file_path} ({self.queue.qsize()} pending).")
+        return True
+
+    def pending(self):
+        return self.queue.qsize() if self.queue else 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                job = await self.queue.get()
+                start = time.perf_counter()
+                error = None
+                try:
+                    if self.catalog is not None and self.catalog.enabled and job.metadata is not None:
+                        await loop.run_in_executor(None, self.catalog.record, job.frame, job.file_path,
+                                                   job.metadata, self.write_function)
+                    else:
+                        await loop.run_in_executor(None, self.write_function, job.frame, job.file_path)
+                except Exception as e:
+                    error = e
+                    print(f"PersistenceWorker: Error saving batch {job.batch_num} to {job.file_path}: {e}")
+                result = SaveResult(job.file_path, job.batch_num, len(job.frame), time.perf_counter() - start, error)
+                self.results.append(result)
+                self.queue.task_done()
+                if self.on_result:
+                    try:
+                        self.on_result(result)
+                    except Exception as e:
+                        print(f"PersistenceWorker: Error in result callback: {e}")
+        except asyncio.CancelledError:
+            print("PersistenceWorker cancelled.")
+            raise
+
+    async def close(self, timeout=None):
+        # Let queued batches finish writing before shutdown
+        if self.task is None:
+            return
+        if self.pending():
+            print(f"PersistenceWorker: Waiting for {self.pending()} pending save(s)...")
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print("PersistenceWorker: Timed out waiting for pending saves.")
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
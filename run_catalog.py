@@ -0,0 +1,210 @@
+# In run_catalog.py
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from clock import clock, utc_offset_of
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    file_path TEXT UNIQUE NOT NULL,
+    label TEXT,
+    config_hash TEXT,
+    batch_num INTEGER,
+    start_time TEXT,
+    end_time TEXT,
+    row_count INTEGER,
+    schedule_files TEXT,
+    saved_at TEXT
+);
+CREATE TABLE IF NOT EXISTS run_channels (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    name TEXT, channel TEXT, count INTEGER, min REAL, max REAL, mean REAL
+);
+CREATE TABLE IF NOT EXISTS run_setpoints (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    equipment TEXT, value REAL
+);
+CREATE INDEX IF NOT EXISTS runs_label ON runs(label, start_time);
+CREATE INDEX IF NOT EXISTS runs_start ON runs(start_time);
+CREATE INDEX IF NOT EXISTS run_channels_channel ON run_channels(channel, mean);
+CREATE INDEX IF NOT EXISTS run_channels_run ON run_channels(run_id);
+CREATE INDEX IF NOT EXISTS run_setpoints_value ON run_setpoints(equipment, value);
+CREATE INDEX IF NOT EXISTS run_setpoints_run ON run_setpoints(run_id);
+"""
+
+def config_hash(config):
+    # Same settings -> same hash, whatever the key order in the YAML
+    text = json.dumps(config or {}, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+def schedule_files(config):
+    return {eq['name']: eq['schedule']['schedule_csv'] for eq in (config or {}).get('equipment', [])
+            if isinstance(eq.get('schedule'), dict) and 'schedule_csv' in eq['schedule']}
+
+def _as_text(ns, utc_offset_ns=None):
+    # Local datetime text, as in the CSV files; sorts and compares correctly as text
+    return str(clock.to_datetime(int(ns), utc_offset_ns).to_numpy().astype('datetime64[us]')).replace('T', ' ')
+
+def _iter_frames(frame):
+    # A SpilledBatch is read chunk by chunk
+    return frame.iter_frames() if hasattr(frame, 'iter_frames') else [frame]
+
+class RunCatalog:
+    """SQLite index of the saved batches, written by the persistence worker after each save.
+
+    One row per data file (label, config hash, batch number, time span, schedule files),
+    with the count/min/max/mean of every channel and the distinct setpoints applied, so
+    runs can be found without opening the files:
+        catalog.find(label='cc5', since='2024-08-01', channel_means={'Channel_108': (1.9, 2.1)})
+    Channel statistics use the calibrated values when the run has them."""
+    def __init__(self, config=None):
+        catalog_config = (config or {}).get('catalog', {})
+        self.enabled = catalog_config.get('enabled', True)
+        self.path = catalog_config.get('path', os.path.join('data', 'catalog.sqlite'))
+        self.label = catalog_config.get('label', '') # e.g. the cold plate under test, 'cc5'
+        self.config_hash = config_hash(config)
+        self.schedule_files = schedule_files(config)
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30) # One connection per call: saves run in executor threads
+        db.execute("PRAGMA foreign_keys = ON")
+        db.executescript(SCHEMA)
+        return db
+
+    def metadata(self, batch_num=None, summary=None):
+        # Built on the event loop when a save is queued; the burst summary gives the setpoints
+        setpoints = {}
+        if summary is not None and not summary.empty:
+            for column in summary.columns:
+                if column.startswith('Setpoint_'):
+                    values = pd.to_numeric(summary[column], errors='coerce').dropna().unique()
+                    setpoints[column[len('Setpoint_'):]] = sorted(float(v) for v in values)
+        return {'label': self.label, 'config_hash': self.config_hash, 'schedule_files': self.schedule_files,
+                'batch_num': batch_num, 'setpoints': setpoints}
+
+    def describe(self, frame):
+        """Time span, rows and per-channel count/min/max/mean of a batch frame (or SpilledBatch)."""
+        parts, start_ns, end_ns, rows = [], None, None, 0
+        for part in _iter_frames(frame):
+            if part.empty:
+                continue
+            value = 'Calibrated' if 'Calibrated' in part.columns else 'Data'
+            times = part['Timestamp'].to_numpy(dtype=np.int64)
+            start_ns = times.min() if start_ns is None else min(start_ns, times.min())
+            end_ns = times.max() if end_ns is None else max(end_ns, times.max())
+            rows += len(part)
+            parts.append(part.groupby(['Name', 'Channel'], observed=True, sort=False)[value]
+                         .agg(['count', 'sum', 'min', 'max']))
+        if not parts:
+            return None
+        stats = pd.concat(parts).groupby(level=['Name', 'Channel'], observed=True, sort=False) \
+            .agg({'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'})
+        stats['mean'] = stats['sum'] / stats['count'].where(stats['count'] > 0)
+        return {'start_ns': start_ns, 'end_ns': end_ns, 'rows': rows, 'channels': stats.drop(columns='sum'),
+                'utc_offset_ns': utc_offset_of(frame)} # The batch's offset, as in its CSV file
+
+    def add(self, file_path, description, metadata):
+        if description is None:
+            return
+        metadata = metadata or {}
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM runs WHERE file_path = ?", (file_path,)) # Saved again: replace the entry
+            run_id = db.execute(
+                "INSERT INTO runs (file_path, label, config_hash, batch_num, start_time, end_time, row_count, schedule_files, saved_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))",
+                (file_path, metadata.get('label', ''), metadata.get('config_hash'), metadata.get('batch_num'),
+                 _as_text(description['start_ns'], description.get('utc_offset_ns')),
+                 _as_text(description['end_ns'], description.get('utc_offset_ns')), description['rows'],
+                 json.dumps(metadata.get('schedule_files', {})))).lastrowid
+            db.executemany(
+                "INSERT INTO run_channels (run_id, name, channel, count, min, max, mean) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, str(name), str(channel), int(row['count']), float(row['min']), float(row['max']), float(row['mean']))
+                 for (name, channel), row in description['channels'].iterrows()])
+            db.executemany(
+                "INSERT INTO run_setpoints (run_id, equipment, value) VALUES (?, ?, ?)",
+                [(run_id, equipment, value) for equipment, values in metadata.get('setpoints', {}).items() for value in values])
+        print(f"RunCatalog: {file_path} added to {self.path}.")
+
+    def record(self, frame, file_path, metadata, write_function):
+        # Called in the persistence executor: statistics first (a SpilledBatch is discarded once written)
+        description = None
+        try:
+            description = self.describe(frame)
+        except Exception as e:
+            print(f"RunCatalog: Error describing {file_path}: {e}")
+        write_function(frame, file_path)
+        try:
+            self.add(file_path, description, metadata)
+        except Exception as e:
+            print(f"RunCatalog: Error adding {file_path}: {e}") # The data file itself is saved
+
+    def find(self, label=None, since=None, until=None, setpoints=None, channel_means=None, tolerance=1e-6):
+        """Runs matching all the given conditions, newest first.
+
+        since/until: dates or datetimes (local time) the run must start after / before.
+        setpoints: {equipment: value} applied at some point in the run.
+        channel_means: {channel: (low, high)} bounds of the channel's mean over the run."""
+        conditions, parameters = [], []
+        if label is not None:
+            conditions.append("runs.label = ?")
+            parameters.append(label)
+        if since is not None:
+            conditions.append("runs.start_time >= ?")
+            parameters.append(str(pd.Timestamp(since)))
+        if until is not None:
+            conditions.append("runs.start_time < ?")
+            parameters.append(str(pd.Timestamp(until)))
+        for equipment, value in (setpoints or {}).items():
+            conditions.append("EXISTS (SELECT 1 FROM run_setpoints s WHERE s.run_id = runs.id "
+                              "AND s.equipment = ? AND s.value BETWEEN ? AND ?)")
+            parameters += [equipment, value - tolerance, value + tolerance]
+        for channel, (low, high) in (channel_means or {}).items():
+            conditions.append("EXISTS (SELECT 1 FROM run_channels c WHERE c.run_id = runs.id "
+                              "AND c.channel = ? AND c.mean BETWEEN ? AND ?)")
+            parameters += [channel, low, high]
+        query = "SELECT * FROM runs" + (" WHERE " + " AND ".join(conditions) if conditions else "") + " ORDER BY start_time DESC"
+        with closing(self._connect()) as db:
+            return pd.read_sql_query(query, db, params=parameters)
+
+    def channels(self, file_path):
+        with closing(self._connect()) as db:
+            return pd.read_sql_query(
+                "SELECT c.name, c.channel, c.count, c.min, c.max, c.mean FROM run_channels c "
+                "JOIN runs ON runs.id = c.run_id WHERE runs.file_path = ?", db, params=[file_path])
+
+    def index_file(self, file_path, label='', chunksize=1_000_000):
+        # Existing CSV files (saved before the catalog, or copied in): read in chunks, no setpoints
+        parts = []
+        for chunk in pd.read_csv(file_path, chunksize=chunksize):
+            chunk['Timestamp'] = clock.from_datetime(chunk['Timestamp'])
+            parts.append(chunk)
+        description = self.describe(pd.concat(parts, ignore_index=True)) if parts else None
+        self.add(file_path, description, {'label': label})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find saved runs in the catalog, or add existing data files to it.")
+    parser.add_argument('--catalog', default=os.path.join('data', 'catalog.sqlite'))
+    parser.add_argument('--index', nargs='+', metavar='CSV', help="Add these data files to the catalog.")
+    parser.add_argument('--label', help="Label of the runs (stored with --index, matched otherwise).")
+    parser.add_argument('--since')
+    parser.add_argument('--until')
+    parser.add_argument('--setpoint', action='append', default=[], metavar='EQUIPMENT=VALUE')
+    parser.add_argument('--channel-mean', action='append', default=[], metavar='CHANNEL=LOW:HIGH')
+    args = parser.parse_args()
+
+    catalog = RunCatalog({'catalog': {'path': args.catalog}})
+    if args.index:
+        for path in args.index:
+            catalog.index_file(path, args.label or '')
+    else:
+        setpoints = {key: float(value) for key, value in (item.split('=', 1) for item in args.setpoint)}
+        channel_means = {key: tuple(float(v) for v in bounds.split(':')) for key, bounds in (item.split('=', 1) for item in args.channel_mean)}
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(catalog.find(args.label, args.since, args.until, setpoints, channel_means))
@@ -0,0 +1,229 @@
+# In run_store.py
+import os
+import numpy as np
+import pandas as pd
+from decimation import decimate_minmax
+from clock import local_to_epoch_ns
+
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+CALIBRATED_SUFFIX = '_calibrated'
+ID_COLUMNS = ['Timestamp', 'Name']
+ROW_GROUP_SCANS = 16384 # Scans per Parquet row group: the unit a time-range query skips or reads
+SCANNED_ATTR = 'scanned' # attrs entry {name: [channels]}: what each instrument read (kept in the columnar file)
+
+# Saved runs in columnar form, and queries over them.
+# A run CSV (long Timestamp/Name/Channel/Data) has a columnar copy next to it: one row per
+# scan (Timestamp, Name), one float column per channel (<channel>_calibrated for the
+# Calibrated column of live-calibrated runs), Name categorical, rows in time order.
+# query_run() reads a (channel set, time range) slice of it: Parquet row groups outside the
+# range are skipped from their Timestamp statistics, only the requested channel columns are
+# read, and the rows are cut with a binary search on the sorted timestamps.
+
+def columnar_path_for(csv_path, fmt='parquet'):
+    return os.path.splitext(csv_path)[0] + FORMATS[fmt]
+
+def read_run_csv(csv_path):
+    # Typed parse: no per-column type inference, categorical names, one ISO timestamp format
+    dtypes = {'Name': 'category', 'Channel': 'category', 'Data': 'float64', 'Calibrated': 'float64'}
+    try:
+        df = pd.read_csv(csv_path, dtype=dtypes, engine='pyarrow')
+    except (ImportError, ValueError):
+        df = pd.read_csv(csv_path, dtype=dtypes)
+    df['Timestamp'] = pd.to_datetime(df['Timestamp'], format='ISO8601')
+    return df
+
+def to_wide(df):
+    """Long run frame -> one row per (Timestamp, Name), one column per channel in scan order."""
+    # First-appearance order, so columns (and to_long() rows) keep the order of the scan
+    channels = list(pd.unique(df['Channel'].astype(str)))
+    values = ['Data'] + (['Calibrated'] if 'Calibrated' in df.columns else [])
+    frame = df.assign(Channel=pd.Categorical(df['Channel'].astype(str), categories=channels),
+                      Name=df['Name'].astype('category'))
+    wide = frame.pivot_table(index=ID_COLUMNS, columns='Channel', values=values, aggfunc='first',
+                             observed=True, sort=False, dropna=False)
+    columns = {}
+    for value in values:
+        suffix = CALIBRATED_SUFFIX if value == 'Calibrated' else ''
+        for channel in channels:
+            if (value, channel) in wide.columns:
+                columns[f"{channel}{suffix}"] = wide[(value, channel)].to_numpy(dtype=np.float64)
+    result = pd.DataFrame(columns, index=wide.index).reset_index()
+    result['Name'] = result['Name'].astype('category')
+    result = result.sort_values('Timestamp', kind='stable', ignore_index=True)
+    # A nan cell is either a failed reading or a channel of another instrument; keep which is which
+    pairs = frame[['Name', 'Channel']].drop_duplicates()
+    result.attrs[SCANNED_ATTR] = {str(name): [str(c) for c in group['Channel']]
+                                  for name, group in pairs.groupby('Name', observed=True, sort=False)}
+    return result
+
+def _scanned_mask(wide, data_columns):
+    # rows x channels: True where the row's instrument reads the channel
+    names = wide['Name'].astype('category')
+    scanned = wide.attrs.get(SCANNED_ATTR)
+    if scanned is not None:
+        membership = np.array([[c in scanned.get(str(name), ()) for c in data_columns]
+                               for name in names.cat.categories], dtype=bool).reshape(-1, len(data_columns))
+    else:
+        # Columnar copies written before the attribute: a channel belongs to the instruments that have a reading of it
+        membership = np.zeros((len(names.cat.categories), len(data_columns)), dtype=bool)
+        np.logical_or.at(membership, names.cat.codes.to_numpy(), ~np.isnan(wide[data_columns].to_numpy(dtype=np.float64)))
+    return membership[names.cat.codes.to_numpy()]
+
+def to_long(wide, channels=None):
+    """Wide run frame -> long Timestamp/Name/Channel/Data(/Calibrated), scan by scan.
+
+    Every scan has a row for each channel its instrument reads, nan for a failed reading,
+    as in the CSV; channels of other instruments are left out."""
+    data_columns = [c for c in wide.columns if c not in ID_COLUMNS and not c.endswith(CALIBRATED_SUFFIX)]
+    if channels is not None:
+        data_columns = [c for c in data_columns if c in channels]
+    rows, width = len(wide), len(data_columns)
+    data = wide[data_columns].to_numpy(dtype=np.float64).ravel() # Row-major: timestamp by timestamp
+    present = _scanned_mask(wide, data_columns).ravel()
+    long = pd.DataFrame({
+        'Timestamp': np.repeat(wide['Timestamp'].to_numpy(), width)[present],
+        'Name': pd.Categorical(np.repeat(wide['Name'].to_numpy(), width)[present]),
+        'Channel': pd.Categorical.from_codes(np.tile(np.arange(width), rows)[present], categories=data_columns),
+        'Data': data[present],
+    })
+    calibrated_columns = [f"{c}{CALIBRATED_SUFFIX}" for c in data_columns]
+    if all(c in wide.columns for c in calibrated_columns) and calibrated_columns:
+        long['Calibrated'] = wide[calibrated_columns].to_numpy(dtype=np.float64).ravel()[present]
+    return long
+
+def write_columnar(wide, path):
+    tmp_path = f"{path}.tmp"
+    if path.endswith(FORMATS['feather']):
+        wide.to_feather(tmp_path, compression='lz4')
+    else:
+        wide.to_parquet(tmp_path, compression='zstd', index=False, row_group_size=ROW_GROUP_SCANS)
+    os.replace(tmp_path, path) # A concurrent load never sees a half-written file
+
+def _projection(available, channels):
+    # Columns to read for these channels (with their calibrated column if the run has one)
+    if channels is None:
+        return None
+    wanted = ID_COLUMNS + [c for channel in channels for c in (channel, f"{channel}{CALIBRATED_SUFFIX}")]
+    return [c for c in wanted if c in available]
+
+def read_columnar(path, channels=None):
+    if path.endswith(FORMATS['feather']):
+        import pyarrow.feather as feather
+        columns = _projection(feather.read_table(path, memory_map=True).column_names, channels)
+        return pd.read_feather(path, columns=columns)
+    import pyarrow.parquet as parquet
+    columns = _projection(parquet.read_schema(path).names, channels)
+    return pd.read_parquet(path, columns=columns)
+
+def is_up_to_date(csv_path, columnar_path):
+    return os.path.exists(columnar_path) and os.path.getmtime(columnar_path) >= os.path.getmtime(csv_path)
+
+def convert_run(csv_path, fmt='parquet', force=False):
+    # Returns the columnar path; nothing is done if it is already newer than the CSV
+    path = columnar_path_for(csv_path, fmt)
+    if force or not is_up_to_date(csv_path, path):
+        write_columnar(to_wide(read_run_csv(csv_path)), path)
+    return path
+
+def _up_to_date_columnar(csv_path):
+    return next((columnar_path_for(csv_path, f) for f in FORMATS if is_up_to_date(csv_path, columnar_path_for(csv_path, f))), None)
+
+def load_run(path, channels=None, wide=False, fmt='parquet', cache=True):
+    """Load a run (CSV or columnar file) as the long frame the scripts expect, or wide.
+
+    For a CSV, an up-to-date .parquet/.feather next to it is used instead; without one the
+    CSV is parsed and, with cache=True, the columnar copy is written for the next time.
+    Timestamp is datetime64, Name and Channel are categorical."""
+    if path.endswith('.csv'):
+        columnar = _up_to_date_columnar(path)
+        if columnar is None:
+            frame = to_wide(read_run_csv(path))
+            if cache:
+                try:
+                    write_columnar(frame, columnar_path_for(path, fmt))
+                except (ImportError, OSError) as e:
+                    print(f"Warning: Could not write the columnar copy of {path}: {e}")
+            if channels is not None:
+                frame = frame[_projection(frame.columns, channels)]
+        else:
+            frame = read_columnar(columnar, channels)
+    else:
+        frame = read_columnar(path, channels)
+    return frame if wide else to_long(frame, channels)
+
+def _as_datetime64(value):
+    # Local naive datetime (or text), like the Timestamp column
+    return None if value is None else pd.Timestamp(value).to_datetime64().astype('datetime64[ns]')
+
+def _read_parquet_range(path, channels, start, end):
+    import pyarrow.parquet as parquet
+    run_file = parquet.ParquetFile(path)
+    schema = run_file.schema_arrow
+    columns = _projection(schema.names, channels)
+    time_index = schema.get_field_index('Timestamp')
+    groups = []
+    for group in range(run_file.metadata.num_row_groups):
+        statistics = run_file.metadata.row_group(group).column(time_index).statistics
+        if statistics is not None and statistics.has_min_max:
+            # Row groups entirely before or after the range are never read
+            if (start is not None and pd.Timestamp(statistics.max).to_datetime64() < start) or \
+                    (end is not None and pd.Timestamp(statistics.min).to_datetime64() > end):
+                continue
+        groups.append(group)
+    if not groups:
+        return schema.empty_table().select(columns or schema.names).to_pandas()
+    return run_file.read_row_groups(groups, columns=columns).to_pandas()
+
+def query_run(path, channels=None, start=None, end=None, output='frame', max_points=None, calibrated=True):
+    """Channels of a saved run between start and end (local datetimes, inclusive).
+
+    path is the run CSV (its columnar copy is created on the first query) or the columnar
+    file. output='frame' gives the wide frame (Timestamp, Name, channel columns), 'long'
+    the long frame of load_run(), 'arrays' {channel: (timestamps, values)} as NumPy arrays,
+    timestamps int64 ns since the UTC epoch (like the live data), readings without a value
+    left out. For 'arrays',
+    calibrated=True uses the calibrated values when the run has them, and max_points
+    min/max-decimates every channel for plotting."""
+    columnar = path
+    if path.endswith('.csv'):
+        columnar = _up_to_date_columnar(path) or convert_run(path)
+    start, end = _as_datetime64(start), _as_datetime64(end)
+    if columnar.endswith(FORMATS['parquet']):
+        frame = _read_parquet_range(columnar, channels, start, end)
+    else:
+        frame = read_columnar(columnar, channels)
+    # Rows are in time order: the range is two binary searches
+    times = frame['Timestamp'].to_numpy(dtype='datetime64[ns]')
+    first = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+    last = len(times) if end is None else int(np.searchsorted(times, end, side='right'))
+    frame = frame.iloc[first:last].reset_index(drop=True)
+
+    if output == 'long':
+        return to_long(frame, channels)
+    if output != 'arrays':
+        return frame
+    times = frame['Timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    names = [c for c in frame.columns if c not in ID_COLUMNS and not c.endswith(CALIBRATED_SUFFIX)]
+    arrays = {}
+    for channel in (names if channels is None else [c for c in channels if c in names]):
+        column = f"{channel}{CALIBRATED_SUFFIX}" if calibrated and f"{channel}{CALIBRATED_SUFFIX}" in frame.columns else channel
+        values = frame[column].to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        t, v = times[present], values[present]
+        if max_points:
+            t, v = decimate_minmax(t, v, max_points)
+        arrays[channel] = (local_to_epoch_ns(t.astype('datetime64[ns]')), v) # After decimation: few points to convert
+    return arrays
+
+def run_channels(path):
+    # Channel names of a saved run, from the columnar schema (no data read)
+    columnar = path
+    if path.endswith('.csv'):
+        columnar = _up_to_date_columnar(path) or convert_run(path)
+    if columnar.endswith(FORMATS['feather']):
+        import pyarrow.feather as feather
+        names = feather.read_table(columnar, memory_map=True).column_names
+    else:
+        import pyarrow.parquet as parquet
+        names = parquet.read_schema(columnar).names
+    return [c for c in names if c not in ID_COLUMNS and not c.endswith(CALIBRATED_SUFFIX)]
@@ -1,6 +1,7 @@
 import asyncio
-import csv
 from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
 from state import app_state
 
 class Schedule(ABC):
@@ -8,38 +9,99 @@ class Schedule(ABC):
     async def setup_schedule(self, task, *args, **kwargs):
         pass
 
+    def checkpoint_state(self):
+        # Position of the schedule, persisted by the checkpoint so a batch can be resumed
+        return None
+
+    def resume_from(self, elapsed):
+        # Continue the next run from 'elapsed' seconds into the schedule instead of from 0
+        pass
+
 class ConstantIntervalSchedule(Schedule):
     def __init__(self, interval):
         self.interval = interval
+        self.current_index = 0
+        self._run_start = None
+        self._elapsed_offset = 0.0
+        self._resume_elapsed = None
+
+    def elapsed(self):
+        if self._run_start is None:
+            return self._elapsed_offset
+        return self._elapsed_offset + asyncio.get_event_loop().time() - self._run_start
+
+    def checkpoint_state(self):
+        return {'step_index': self.current_index, 'elapsed': self.elapsed()}
+
+    def resume_from(self, elapsed):
+        self._resume_elapsed = elapsed
 
     async def setup_schedule(self, task, *args, **kwargs):
+        self._elapsed_offset = self._resume_elapsed or 0.0
+        self.current_index = int(self._elapsed_offset // self.interval) if self.interval > 0 else 0
+        self._resume_elapsed = None
+        self._run_start = asyncio.get_event_loop().time()
         while app_state.is_running():
-            await asyncio.sleep(self.interval)
+            if not await app_state.sleep(self.interval): # Wakes immediately on Stop
+                break
             await task(*args, **kwargs)
+            self.current_index += 1
 
 class CsvSchedule(Schedule):
     def __init__(self, csv_path):
         self.csv_path = csv_path
-        self.schedule_data = self._load_csv()
+        # Compact float64 arrays; fine-grained ramps can have tens of thousands of steps
+        self.times, self.values = self._load_csv()
+        self.current_index = 0 # Index of the next step to execute
+        self.current_value = None # Last value applied, the active setpoint
+        self.fast_forward = True # On resume, re-apply the last setpoint that was already passed
+        self._run_start = None
+        self._elapsed_offset = 0.0
+        self._resume_elapsed = None
 
     def _load_csv(self):
-        schedule_data = []
-        with open(self.csv_path, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                time = float(row['time'])
-                value = float(row['value'])
-                schedule_data.append((time, value))
-        return schedule_data
+        frame = pd.read_csv(self.csv_path, usecols=['time', 'value'], dtype='float64')
+        return frame['time'].to_numpy(), frame['value'].to_numpy()
+
+    def __len__(self):
+        return len(self.times)
+
+    def elapsed(self):
+        if self._run_start is None:
+            return self._elapsed_offset
+        return self._elapsed_offset + asyncio.get_event_loop().time() - self._run_start
+
+    def checkpoint_state(self):
+        return {'step_index': self.current_index, 'elapsed': self.elapsed()}
+
+    def resume_from(self, elapsed):
+        self._resume_elapsed = elapsed
 
     async def setup_schedule(self, task, *args, **kwargs):
-        start_time = asyncio.get_event_loop().time()
-        last_time = 0
-        for time, value in self.schedule_data:
-            if app_state.is_running():
-                elapsed_time = asyncio.get_event_loop().time() - start_time
-                sleep_time = max(0, time - last_time - elapsed_time)
-                await asyncio.sleep(sleep_time)
-                start_time = asyncio.get_event_loop().time()
-                await task(value=value)
-                last_time = time
+        start_index = 0
+        self._elapsed_offset = 0.0
+        self.current_value = None
+        if self._resume_elapsed is not None:
+            # Skip every step that was already due before the interruption
+            self._elapsed_offset = self._resume_elapsed
+            start_index = int(np.searchsorted(self.times, self._elapsed_offset, side='right'))
+            self._resume_elapsed = None
+            print(f"CsvSchedule({self.csv_path}): Resuming at step {start_index} ({self._elapsed_offset:.1f}s elapsed).")
+            if self.fast_forward and start_index > 0 and app_state.is_running():
+                # Bring the equipment straight to the setpoint it should have now
+                await task(value=float(self.values[start_index - 1]))
+                self.current_value = float(self.values[start_index - 1])
+
+        self.current_index = start_index
+        self._run_start = asyncio.get_event_loop().time()
+        # Steps are timed against the schedule start, so slow tasks do not accumulate drift
+        for index in range(start_index, len(self.times)):
+            if not app_state.is_running():
+                break
+            time, value = float(self.times[index]), float(self.values[index])
+            sleep_time = max(0, time - self.elapsed())
+            if not await app_state.sleep(sleep_time): # Wakes immediately on Stop
+                break
+            await task(value=value)
+            self.current_value = value
+            self.current_index = index + 1
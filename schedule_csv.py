@@ -1,77 +1,189 @@
+"""Compile a declarative test matrix into coordinated pump, heater, bath and DAQ schedule CSVs.
+
+The matrix (YAML) lists the flow-rate (pump), heater-voltage and bath-temperature setpoints
+to visit and a settling estimate for every kind of transition. The visiting order is chosen
+to minimise the predicted total settling time, and the estimated run duration is reported
+before anything is written.
+
+Usage:
+    python schedule_csv.py test_matrix.yaml [--out-dir .] [--plot] [--dry-run]
+"""
+import argparse
 import csv
-import matplotlib.pyplot as plt
+import itertools
+import os
+from collections import namedtuple
 
-def create_pump_schedule(speeds, stabilization_time, extra_initial_stabilization, heater_stable_time, record_time):
-    schedule = []
-    current_time = 0
-    for i, speed in enumerate(speeds):
-        if i == 0:
-            # Initial ramp-up
-            ramp_time = 10 if speed == 3.24 else 15
-            steps = 8
-            for step in range(steps):
-                intermediate_speed = 1 + (speed - 1) * (step) / steps
-                schedule.append((current_time + ramp_time * step / steps, round(intermediate_speed, 2)))
-            current_time += ramp_time
-            
-            # Add stabilization time for initial stage (including extra time)
-            schedule.append((current_time, speed))
-            current_time += stabilization_time + extra_initial_stabilization
-        else:
-            # Ramp to next speed
-            prev_speed = speeds[i-1]
-            ramp_time = 7
-            steps = 5
-            for step in range(steps):
-                intermediate_speed = prev_speed + (speed - prev_speed) * (step) / steps
-                schedule.append((current_time + ramp_time * step / steps, round(intermediate_speed, 2)))
-            current_time += ramp_time
-        
-            # Stabilization at new speed
-            schedule.append((current_time, speed))
-            current_time += stabilization_time
-
-        # Hold speed for heater cycle and DAQ recording
-        heater_cycle_time = len(heater_voltages) * (heater_stable_time + record_time)
-        current_time += heater_cycle_time
-
-    # Add final ramp-up to 3.24
-    final_speed = 3.24
-    ramp_time = 7
-    steps = 5
+import yaml
+
+AXES = ('flow', 'heater', 'bath')
+TestPoint = namedtuple('TestPoint', AXES)
+
+DEFAULT_SETTLING = {
+    'flow': {'fixed': 600, 'per_unit': 0, 'ramp_time': 7, 'ramp_steps': 5},
+    'heater': {'fixed': 600, 'per_unit': 0},
+    'bath': {'fixed': 1800, 'per_unit': 0},
+}
+
+def load_matrix(filename):
+    """Load a test matrix from a YAML file."""
+    with open(filename, 'r') as file:
+        return yaml.safe_load(file)
+
+def build_points(matrix):
+    # Axes missing from the matrix are held at a single "don't care" value (None)
+    flows = matrix.get('flow_rates') or [None]
+    voltages = matrix.get('heater_voltages') or [None]
+    temperatures = matrix.get('bath_temperatures') or [None]
+    return [TestPoint(*values) for values in itertools.product(flows, voltages, temperatures)]
+
+def settling_model(matrix):
+    settling = {axis: dict(DEFAULT_SETTLING[axis]) for axis in AXES}
+    for axis, params in (matrix.get('settling') or {}).items():
+        settling[axis].update(params)
+    return settling
+
+def transition_time(previous, point, settling, combine='max'):
+    """Predicted seconds until 'point' is stable after leaving 'previous'."""
+    costs = []
+    for axis in AXES:
+        old, new = getattr(previous, axis), getattr(point, axis)
+        if new is None or old == new:
+            continue
+        params = settling[axis]
+        delta = abs(new - old) if old is not None else 0
+        cost = params.get('fixed', 0) + params.get('per_unit', 0) * delta
+        if axis == 'flow':
+            cost += params.get('ramp_time', 0)
+        costs.append(cost)
+    if not costs:
+        return 0
+    # Axes settle concurrently by default; 'sum' models one waiting for the other
+    return sum(costs) if combine == 'sum' else max(costs)
+
+def order_cost(order, start, settling, combine='max'):
+    total = 0
+    previous = start
+    for point in order:
+        total += transition_time(previous, point, settling, combine)
+        previous = point
+    return total
+
+def _serpentine_orders(points):
+    # Boustrophedon sweeps for every nesting of the axes: the outer axis changes least often
+    # and inner axes reverse direction on each pass, so consecutive points stay close.
+    levels = {axis: sorted({getattr(p, axis) for p in points}, key=lambda v: (v is None, v)) for axis in AXES}
+    for nesting in itertools.permutations(AXES):
+        for reverse_outer in (False, True):
+            outer_values = levels[nesting[0]][::-1] if reverse_outer else levels[nesting[0]]
+            order = []
+            middle_flip = inner_flip = False
+            for outer in outer_values:
+                for middle in (levels[nesting[1]][::-1] if middle_flip else levels[nesting[1]]):
+                    for inner in (levels[nesting[2]][::-1] if inner_flip else levels[nesting[2]]):
+                        order.append(TestPoint(**dict(zip(nesting, (outer, middle, inner)))))
+                    inner_flip = not inner_flip
+                middle_flip = not middle_flip
+            yield order
+
+def _exact_order(points, start, settling, combine):
+    # Held-Karp dynamic programming, only affordable for small matrices
+    n = len(points)
+    cost = {(1 << i, i): (transition_time(start, points[i], settling, combine), None) for i in range(n)}
+    for size in range(2, n + 1):
+        for subset in itertools.combinations(range(n), size):
+            mask = sum(1 << i for i in subset)
+            for last in subset:
+                prev_mask = mask & ~(1 << last)
+                cost[(mask, last)] = min(
+                    (cost[(prev_mask, k)][0] + transition_time(points[k], points[last], settling, combine), k)
+                    for k in subset if k != last)
+    full = (1 << n) - 1
+    last = min(range(n), key=lambda i: cost[(full, i)][0])
+    order, mask = [], full
+    while last is not None:
+        order.append(points[last])
+        mask, last = mask & ~(1 << last), cost[(mask, last)][1]
+    return order[::-1]
+
+def _two_opt(order, start, settling, combine, max_passes=20):
+    best_cost = order_cost(order, start, settling, combine)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(len(order) - 1):
+            for j in range(i + 2, len(order) + 1):
+                candidate = order[:i] + order[i:j][::-1] + order[j:]
+                candidate_cost = order_cost(candidate, start, settling, combine)
+                if candidate_cost < best_cost:
+                    order, best_cost, improved = candidate, candidate_cost, True
+        if not improved:
+            break
+    return order
+
+def optimize_order(points, start, settling, combine='max', exact_limit=9):
+    """Return the visiting order of 'points' with the lowest predicted settling time."""
+    if len(points) <= exact_limit:
+        return _exact_order(points, start, settling, combine)
+    best = min(_serpentine_orders(points), key=lambda order: order_cost(order, start, settling, combine))
+    return _two_opt(best, start, settling, combine)
+
+def _ramp(schedule, start_time, old, new, ramp_time, steps):
+    # Pump speed is stepped towards the new setpoint rather than jumped
+    if old is None or ramp_time <= 0 or steps <= 1:
+        schedule.append((start_time, new))
+        return
     for step in range(steps):
-        intermediate_speed = speeds[-1] + (final_speed - speeds[-1]) * (step + 1) / steps
-        schedule.append((current_time + ramp_time * (step + 1) / steps, round(intermediate_speed, 2)))
-    current_time += ramp_time
-
-    # Add final entry
-    schedule.append((current_time, final_speed))
-
-    return schedule
-
-def create_heater_schedule(voltages, pump_speeds, stabilization_time, extra_initial_stabilization, heater_stable_time, record_time):
-    schedule = []
-    daq_schedule = []
-    current_time = 15  # Start right after initial pump ramp
-    now_speed = pump_speeds[0]
-    for i, speed in enumerate(pump_speeds):
-        for j, voltage in enumerate(voltages):
-            schedule.append((current_time, voltage))
-            if i == 0 and j == 0:
-                # For the first speed and first voltage, add stabilization time (including extra time)
-                current_time += stabilization_time + extra_initial_stabilization
-            elif now_speed != speed:
-                now_speed = speed
-                current_time += stabilization_time + 7  # Add time for stabilization and ramp
-            current_time += heater_stable_time  # Heater runs for heater_stable_time
-            daq_schedule.append(current_time)
-            current_time += record_time  # Time for DAQ recording
-            
-    schedule.append((current_time, 0))  # shutdown heater
-    return schedule, daq_schedule
-
-def create_daq_schedule(daq_value, heater_schedule):
-    return [(time, daq_value) for time in heater_schedule]
+        schedule.append((round(start_time + ramp_time * step / steps, 2), round(old + (new - old) * step / steps, 2)))
+    schedule.append((round(start_time + ramp_time, 2), new))
+
+def compile_schedules(matrix):
+    """Compile the matrix into schedules. Returns (schedules dict, ordered points, estimated duration in s)."""
+    settling = settling_model(matrix)
+    combine = matrix.get('combine', 'max')
+    timing = matrix.get('timing', {})
+    record_time = timing.get('record_time', 100)
+    initial_extra = timing.get('extra_initial_stabilization', 0)
+    daq_scans = timing.get('daq_scans', 60)
+    initial = matrix.get('initial', {})
+    start = TestPoint(initial.get('flow'), initial.get('heater', 0), initial.get('bath'))
+
+    points = build_points(matrix)
+    order = optimize_order(points, start, settling, combine)
+
+    schedules = {'pump': [], 'heater': [], 'bath': [], 'daq': []}
+    flow_params = settling['flow']
+    current_time = 0.0
+    previous = start
+    for i, point in enumerate(order):
+        if point.flow is not None and point.flow != previous.flow:
+            _ramp(schedules['pump'], current_time, previous.flow, point.flow,
+                  flow_params.get('ramp_time', 0), flow_params.get('ramp_steps', 1))
+        if point.heater is not None and point.heater != previous.heater:
+            schedules['heater'].append((current_time, point.heater))
+        if point.bath is not None and point.bath != previous.bath:
+            schedules['bath'].append((current_time, point.bath))
+        current_time += transition_time(previous, point, settling, combine)
+        if i == 0:
+            current_time += initial_extra
+        schedules['daq'].append((current_time, daq_scans))
+        current_time += record_time
+        previous = point
+
+    # Leave the rig safe: heater off, pump at its final speed
+    schedules['heater'].append((current_time, 0))
+    final_flow = matrix.get('final', {}).get('flow')
+    if final_flow is not None and previous.flow is not None:
+        _ramp(schedules['pump'], current_time, previous.flow, final_flow,
+              flow_params.get('ramp_time', 0), flow_params.get('ramp_steps', 1))
+        current_time += flow_params.get('ramp_time', 0)
+
+    schedules = {name: sorted(entries) for name, entries in schedules.items() if entries}
+    return schedules, order, current_time
+
+def format_duration(seconds):
+    hours, remainder = divmod(int(round(seconds)), 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours}h {minutes:02d}m {secs:02d}s"
 
 def write_csv(filename, schedule):
     with open(filename, 'w', newline='') as csvfile:
@@ -80,56 +192,60 @@ def write_csv(filename, schedule):
         for time, value in schedule:
             writer.writerow([time, value])
 
-def plot_schedules(pump_schedule, heater_schedule, daq_schedule):
+def plot_schedules(schedules, filename='schedule_plot.png'):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(14, 8))
-    
-    pump_times, pump_values = zip(*pump_schedule)
-    heater_times, heater_values = zip(*heater_schedule)
-    daq_times, daq_values = zip(*daq_schedule)
-    
-    plt.step(pump_times, pump_values, where='post', label='Pump Speed', linewidth=2)
-    plt.step(heater_times, heater_values, where='post', label='Heater Voltage', linewidth=2)
-    
+    labels = {'pump': 'Pump Speed', 'heater': 'Heater Voltage', 'bath': 'Bath Temperature'}
+    for name, label in labels.items():
+        if name in schedules:
+            times, values = zip(*schedules[name])
+            plt.step(times, values, where='post', label=label, linewidth=2)
+
     # Add vertical lines for DAQ trigger times
-    for daq_time in daq_times:
+    for daq_time, _ in schedules.get('daq', []):
         plt.axvline(x=daq_time, color='r', linestyle='--', alpha=0.5, linewidth=1)
-    
+
     # Add a single entry to the legend for DAQ triggers
     plt.axvline(x=0, color='r', linestyle='--', alpha=0.5, linewidth=1, label='DAQ Trigger')
-    
+
     plt.xlabel('Time (s)')
     plt.ylabel('Value')
-    plt.title('Pump, Heater, and DAQ Schedules')
+    plt.title('Pump, Heater, Bath and DAQ Schedules')
     plt.legend()
     plt.grid(True)
-    
-    # Adjust x-axis to show more tick marks
-    plt.xticks(range(0, int(max(pump_times[-1], heater_times[-1], daq_times[-1])) + 1, 1000))
-    
     plt.tight_layout()
-    plt.savefig('schedule_plot.png', dpi=300)
+    plt.savefig(filename, dpi=300)
     plt.close()
 
-# Define parameters
-pump_speeds = [3.24, 2.59, 1.83, 1.18, 0.8]
-heater_voltages = [14, 16, 18]
-daq_value = 60
-stabilization_time = 600  # Can be changed as needed
-extra_initial_stabilization = 1500  # Extra stabilization time at the initial stage
-heater_stable_time = 600
-record_time = 100
-
-# Create schedules
-pump_schedule = create_pump_schedule(pump_speeds, stabilization_time, extra_initial_stabilization, heater_stable_time, record_time)
-heater_schedule, daq_schedule = create_heater_schedule(heater_voltages, pump_speeds, stabilization_time, extra_initial_stabilization, heater_stable_time, record_time)
-daq_schedule = create_daq_schedule(daq_value, daq_schedule)
-
-# Write schedules to CSV files
-write_csv('schedule_pump.csv', pump_schedule)
-write_csv('schedule_heater.csv', heater_schedule)
-write_csv('schedule_daq.csv', daq_schedule)
-
-# Plot schedules
-plot_schedules(pump_schedule, heater_schedule, daq_schedule)
-
-print("CSV files and plot have been generated successfully.")
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="Compile a test matrix into schedule CSV files.")
+    parser.add_argument('matrix', nargs='?', default='test_matrix.yaml', help="Test matrix YAML file.")
+    parser.add_argument('--out-dir', default='.', help="Directory for the schedule_<name>.csv files.")
+    parser.add_argument('--plot', action='store_true', help="Also save schedule_plot.png.")
+    parser.add_argument('--dry-run', action='store_true', help="Only report the order and estimated duration.")
+    args = parser.parse_args()
+
+    matrix = load_matrix(args.matrix)
+    schedules, order, duration = compile_schedules(matrix)
+
+    print(f"Visiting order ({len(order)} points):")
+    for i, point in enumerate(order, start=1):
+        print(f"  {i:3d}: flow={point.flow} heater={point.heater} bath={point.bath}")
+    print(f"Estimated duration: {format_duration(duration)} ({duration:.0f} s)")
+    if args.dry_run:
+        return
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name, schedule in schedules.items():
+        path = os.path.join(args.out_dir, f'schedule_{name}.csv')
+        write_csv(path, schedule)
+        print(f"Wrote {path}")
+    if args.plot:
+        plot_schedules(schedules, os.path.join(args.out_dir, 'schedule_plot.png'))
+        print("Schedule plot saved.")
+
+if __name__ == "__main__":
+    main()
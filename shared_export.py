@@ -0,0 +1,215 @@
+# In shared_export.py
+import asyncio
+import os
+import time
+import numpy as np
+from data_bus import DROP_OLDEST
+
+# File layout: header, channel names, per-channel sample counts, then the time and value
+# rings of all channels (max_channels x capacity float64 each). Everything is little endian.
+MAGIC = b'DAQLIVE1'
+VERSION = 1
+NAME_BYTES = 32
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('max_channels', '<u4'), ('capacity', '<u4'),
+                         ('n_channels', '<u4'), ('seq', '<u8'), ('updated_at', '<f8'), ('pid', '<u4'),
+                         ('_pad', 'V20')]) # 64 bytes
+
+def _layout(max_channels, capacity):
+    # (offset, dtype, shape) of every section after the header
+    sections = {}
+    offset = HEADER_DTYPE.itemsize
+    for name, dtype, shape in (('names', f'S{NAME_BYTES}', (max_channels,)),
+                               ('counts', '<u8', (max_channels,)),
+                               ('t', '<f8', (max_channels, capacity)),
+                               ('v', '<f8', (max_channels, capacity))):
+        sections[name] = (offset, np.dtype(dtype), shape)
+        offset += np.dtype(dtype).itemsize * int(np.prod(shape))
+    return sections, offset
+
+def _map_sections(path, mode, max_channels, capacity):
+    sections, size = _layout(max_channels, capacity)
+    header = np.memmap(path, dtype=HEADER_DTYPE, mode=mode, offset=0, shape=(1,))
+    arrays = {name: np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape)
+              for name, (offset, dtype, shape) in sections.items()}
+    return header, arrays, size
+
+def _file_id(path):
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+class SharedDataExporter:
+    """Publishes the live per-channel ring buffers in a memory-mapped file.
+
+    Other processes on the machine (Jupyter, analysis scripts) attach read-only with
+    SharedDataReader and see new samples as they arrive, without parsing CSVs or
+    talking to this process. The writer is a bus subscriber of its own; the 'seq'
+    header counter is odd while a write is in progress (seqlock), so readers can
+    detect and retry a torn read."""
+    def __init__(self, config, data_manager):
+        export_config = config.get('shared_export', {})
+        self.enabled = export_config.get('enabled', False)
+        self.path = export_config.get('path', os.path.join('data', 'live_data.mmap'))
+        self.max_channels = export_config.get('max_channels', 64)
+        self.capacity = export_config.get('capacity', 4096) # Samples kept per channel
+        self.data_manager = data_manager
+        self.header = None
+        self.arrays = None
+        self.slots = {} # channel -> row in the rings
+        self.subscription = None
+        self.task = None
+        self._full_warned = False
+
+    def start(self, loop):
+        if not self.enabled:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _, size = _layout(self.max_channels, self.capacity)
+            header = np.zeros(1, dtype=HEADER_DTYPE)
+            header['magic'] = MAGIC
+            header['version'] = VERSION
+            header['max_channels'] = self.max_channels
+            header['capacity'] = self.capacity
+            header['pid'] = os.getpid()
+            header['updated_at'] = time.time()
+            # A new file swapped in: a reader may still have the previous export mapped, truncating
+            # it in place would make its next access fail (SIGBUS)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(header.tobytes())
+                f.truncate(size) # Zero filled, so every count starts at 0
+            os.replace(tmp_path, self.path)
+            self.header, self.arrays, _ = _map_sections(self.path, 'r+', self.max_channels, self.capacity)
+        except Exception as e:
+            print(f"SharedDataExporter: Could not create {self.path}: {e}")
+            return
+        self.subscription = self.data_manager.bus.subscribe('shared_export', maxsize=10000, policy=DROP_OLDEST)
+        self.task = loop.create_task(self._run())
+        print(f"SharedDataExporter: Live data exported to {self.path} "
+              f"({self.max_channels} channels x {self.capacity} samples).")
+
+    async def close(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        self.data_manager.bus.unsubscribe(self.subscription)
+        for array in [self.header] + list(self.arrays.values()):
+            array.flush()
+        # The file is left in place: readers keep the last data of the run
+        self.header = self.arrays = None
+        print("SharedDataExporter: Closed.")
+
+    def _slot(self, channel):
+        slot = self.slots.get(channel)
+        if slot is None:
+            if len(self.slots) >= self.max_channels:
+                if not self._full_warned:
+                    print(f"SharedDataExporter: More than {self.max_channels} channels, '{channel}' and later ones are not exported.")
+                    self._full_warned = True
+                return None
+            slot = self.slots[channel] = len(self.slots)
+            self.arrays['names'][slot] = str(channel).encode()[:NAME_BYTES]
+            self.header[0]['n_channels'] = len(self.slots)
+        return slot
+
+    def _write(self, blocks):
+        header = self.header[0]
+        counts, t_ring, v_ring = self.arrays['counts'], self.arrays['t'], self.arrays['v']
+        header['seq'] += 1 # Odd: write in progress
+        for block in blocks:
+            t = block.timestamp / 1e9 # Seconds since the UTC epoch
+            for channel, value in zip(block.channels, block.values):
+                slot = self._slot(channel)
+                if slot is None:
+                    continue
+                position = counts[slot] % self.capacity
+                t_ring[slot, position] = t
+                v_ring[slot, position] = value
+                counts[slot] += 1
+        header['updated_at'] = time.time()
+        header['seq'] += 1 # Even: consistent
+
+    async def _run(self):
+        try:
+            while True:
+                blocks = [await self.subscription.get()] + self.subscription.drain()
+                self._write(blocks)
+        except asyncio.CancelledError:
+            print("SharedDataExporter cancelled.")
+            raise
+
+class SharedDataReader:
+    """Read-only view of a file written by SharedDataExporter, for use in other processes.
+
+        reader = SharedDataReader('data/live_data.mmap')
+        data = reader.snapshot()          # {channel: (t, v)}, oldest first
+        t, v = data['Channel_101']        # t: seconds since the UTC epoch
+
+    snapshot() copies a consistent state; ring() gives the zero-copy arrays. When the
+    acquisition restarts, the export is a new file: snapshot() switches to it, ring()
+    arrays keep showing the previous one."""
+    def __init__(self, path=os.path.join('data', 'live_data.mmap')):
+        self.path = path
+        self._attach()
+
+    def _attach(self):
+        path = self.path
+        self.file_id = _file_id(path)
+        probe = np.memmap(path, dtype=HEADER_DTYPE, mode='r', offset=0, shape=(1,))[0]
+        if bytes(probe['magic']) != MAGIC or int(probe['version']) != VERSION:
+            raise ValueError(f"{path} is not a live data export (version {VERSION}).")
+        self.max_channels = int(probe['max_channels'])
+        self.capacity = int(probe['capacity'])
+        self.header, self.arrays, _ = _map_sections(path, 'r', self.max_channels, self.capacity)
+
+    def replaced(self):
+        # True when a new export has been swapped in at the path since this reader attached
+        try:
+            return _file_id(self.path) != self.file_id
+        except OSError:
+            return False # Between exports: keep the last data
+
+    @property
+    def seq(self):
+        return int(self.header[0]['seq'])
+
+    def updated_at(self):
+        return float(self.header[0]['updated_at'])
+
+    def channels(self):
+        n_channels = int(self.header[0]['n_channels'])
+        return [name.decode() for name in self.arrays['names'][:n_channels]]
+
+    def ring(self, channel):
+        # (t, v, count) without copying: the raw rings, written at count % capacity
+        slot = self.channels().index(channel)
+        return self.arrays['t'][slot], self.arrays['v'][slot], int(self.arrays['counts'][slot])
+
+    def snapshot(self, channels=None, retries=100):
+        if self.replaced():
+            self._attach()
+        for _ in range(retries):
+            seq = self.seq
+            if seq % 2:
+                time.sleep(0.001) # Writer busy
+                continue
+            data = {}
+            names = self.channels()
+            for channel in (channels or names):
+                if channel not in names:
+                    continue
+                slot = names.index(channel)
+                count = int(self.arrays['counts'][slot])
+                t, v = self.arrays['t'][slot], self.arrays['v'][slot]
+                if count <= self.capacity:
+                    data[channel] = (np.array(t[:count]), np.array(v[:count]))
+                else:
+                    start = count % self.capacity
+                    data[channel] = (np.roll(t, -start), np.roll(v, -start)) # np.roll copies
+            if self.seq == seq:
+                return data
+        raise TimeoutError(f"No consistent snapshot of {self.path} after {retries} attempts.")
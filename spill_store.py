@@ -0,0 +1,166 @@
+# In spill_store.py
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from clock import clock, with_datetimes
+
+COLUMNS = ['Timestamp', 'Name', 'Channel', 'Data']
+
+class SpillStore:
+    """Older rows of the running batch, moved from memory to disk in columnar chunks.
+
+    Each chunk is one .npz file with a plain array per column (timestamps in int64 ns,
+    names and channels as category codes), so reading back only touches the columns
+    and chunks needed. Chunks are written in row order and never modified.
+    While a copy (SpilledBatch with owned=False) still reads the chunks, clear() only
+    forgets them and the last copy to finish deletes the directory."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunks = [] # dicts: path, first_row, rows, t_min, t_max (ns), bytes
+        self.rows = 0
+        self._lock = threading.Lock() # Copies are released from the persistence executor
+        self._readers = 0 # Copies not written yet
+        self._delete_pending = False
+
+    def disk_bytes(self):
+        return sum(chunk['bytes'] for chunk in self.chunks)
+
+    def append(self, frame):
+        if frame.empty:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"chunk_{len(self.chunks):05d}.npz")
+        timestamps = frame['Timestamp'].to_numpy(dtype=np.int64)
+        columns = {'Timestamp': timestamps}
+        for name in frame.columns.drop(['Timestamp', 'Name', 'Channel']):
+            columns[f'value_{name}'] = frame[name].to_numpy(dtype=np.float64) # Data, and Calibrated if enabled
+        for name in ('Name', 'Channel'):
+            values = frame[name].astype('category')
+            columns[f'{name}_codes'] = values.cat.codes.to_numpy()
+            columns[f'{name}_categories'] = np.array(values.cat.categories.astype(str), dtype=str)
+        np.savez(path, **columns)
+        self.chunks.append({'path': path, 'first_row': self.rows, 'rows': len(frame),
+                            't_min': int(timestamps.min()), 't_max': int(timestamps.max()),
+                            'bytes': os.path.getsize(path)})
+        self.rows += len(frame)
+
+    def _load(self, chunk, channels=None):
+        with np.load(chunk['path']) as columns:
+            frame = pd.DataFrame({
+                'Timestamp': columns['Timestamp'],
+                'Name': pd.Categorical.from_codes(columns['Name_codes'], columns['Name_categories']),
+                'Channel': pd.Categorical.from_codes(columns['Channel_codes'], columns['Channel_categories']),
+            })
+            for key in columns.files:
+                if key.startswith('value_'):
+                    frame[key[len('value_'):]] = columns[key]
+        if channels is not None:
+            frame = frame[frame['Channel'].isin(channels)]
+        return frame
+
+    def read(self, start_ns=None, end_ns=None, channels=None):
+        # Rows with start_ns <= Timestamp <= end_ns; chunks outside the range are not opened
+        frames = []
+        for chunk in self.chunks:
+            if (start_ns is not None and chunk['t_max'] < start_ns) or (end_ns is not None and chunk['t_min'] > end_ns):
+                continue
+            frame = self._load(chunk, channels)
+            if start_ns is not None:
+                frame = frame[frame['Timestamp'] >= start_ns]
+            if end_ns is not None:
+                frame = frame[frame['Timestamp'] <= end_ns]
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+    def read_rows(self, first_row=0):
+        # Rows from position first_row (counted over all spilled rows) to the end
+        frames = []
+        for chunk in self.chunks:
+            chunk_end = chunk['first_row'] + chunk['rows']
+            if chunk_end <= first_row:
+                continue
+            frame = self._load(chunk)
+            frames.append(frame.iloc[max(0, first_row - chunk['first_row']):])
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+    def iter_frames(self, chunks=None):
+        # One chunk at a time, for writing a batch without loading it all
+        for chunk in (self.chunks if chunks is None else chunks):
+            yield self._load(chunk)
+
+    def clear(self):
+        with self._lock:
+            self._delete_pending = self._readers > 0
+            if not self._delete_pending:
+                self._delete()
+        self.chunks = []
+        self.rows = 0
+
+    def _delete(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def acquire(self):
+        with self._lock:
+            self._readers += 1
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            if self._readers == 0 and self._delete_pending:
+                self._delete_pending = False
+                self._delete() # Cleared while this copy was being written
+
+class SpilledBatch:
+    """Batch data made of spilled chunks plus the rows still in memory.
+
+    Stands in for the batch DataFrame where only empty, len(), columns and to_csv() are
+    used (PersistenceWorker, write_data_file): to_csv() streams the chunks, so a long
+    batch is written without loading it back into memory. A copy (Save button while
+    running) shares the store but only sees the chunks that existed when it was made."""
+    def __init__(self, store, frame, owned=True):
+        self.store = store
+        self.chunks = list(store.chunks)
+        self.frame = frame
+        self.owned = owned # The batch is finished: the chunks are deleted once written
+        if not owned:
+            store.acquire() # Keeps the chunks on disk until discard(), even if the batch is reset meanwhile
+        self.utc_offset_ns = clock.utc_offset_ns # Of this batch, for a write after the clock is anchored for the next
+
+    @property
+    def columns(self):
+        return self.frame.columns if len(self.frame.columns) else pd.Index(COLUMNS)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def __len__(self):
+        return sum(chunk['rows'] for chunk in self.chunks) + len(self.frame)
+
+    def iter_frames(self):
+        # Chunks in time order, then the rows still in memory; timestamps stay int64 ns
+        yield from self.store.iter_frames(self.chunks)
+        yield self.frame
+
+    def to_frame(self):
+        return with_datetimes(pd.concat(list(self.store.iter_frames(self.chunks)) + [self.frame], ignore_index=True),
+                              utc_offset_ns=self.utc_offset_ns)
+
+    def to_csv(self, file_path, index=False):
+        header = True
+        for frame in self.store.iter_frames(self.chunks):
+            with_datetimes(frame, utc_offset_ns=self.utc_offset_ns).to_csv(file_path, mode='w' if header else 'a', header=header, index=False)
+            header = False
+        if not self.frame.empty or header:
+            with_datetimes(self.frame, utc_offset_ns=self.utc_offset_ns).to_csv(
+                file_path, mode='w' if header else 'a', header=header, index=False)
+
+    def discard(self):
+        # Written (or, for a copy, given up): a finished batch deletes its chunks, a copy lets go of them
+        if self.owned:
+            self.store.clear()
+        else:
+            self.store.release()
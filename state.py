@@ -1,36 +1,123 @@
 # In state.py
+import asyncio
+import time
 import traceback # For stack trace
 
+# Batch lifecycle states
+IDLE = 'idle'         # No batch prepared
+ARMED = 'armed'       # Batch prepared, waiting for Start
+RUNNING = 'running'   # Batch tasks active
+STOPPING = 'stopping' # Stop requested, batch tasks being cleaned up
+HALTED = 'halted'     # Safety shutdown, terminal until restart
+
+ALLOWED_TRANSITIONS = {
+    IDLE: {ARMED, HALTED}, # Only an armed batch can be started
+    ARMED: {RUNNING, STOPPING, IDLE, HALTED},
+    RUNNING: {STOPPING, HALTED},
+    STOPPING: {IDLE, ARMED, HALTED},
+    HALTED: set(),
+}
+
 class AppState:
     def __init__(self):
-        self._is_running = False
+        self._state = IDLE
+        self.transitions = [] # Every state change: (wall time, from, to, reason)
+        self._changed = None # asyncio.Event set on the next transition, created lazily in the running loop
         self.batch_current_run = 0
         self.batch_total_runs = 1
         self.batch_mode_active = False
         self.auto_start_next_batch = False
         self.auto_start_delay_s = 5
         self.system_is_stable_for_monitoring = False # Default to not stable
-        print(f"AppState initialized. _is_running: {self._is_running}")
+        print(f"AppState initialized. state: {self._state}")
 
-    def start(self):
-        print(f"APP_STATE: start() called. Current batch_current_run: {self.batch_current_run}")
+    @property
+    def state(self):
+        return self._state
+
+    def _transition(self, new_state, reason=""):
+        old_state = self._state
+        if new_state == old_state:
+            return True
+        if new_state not in ALLOWED_TRANSITIONS[old_state]:
+            print(f"APP_STATE: Ignoring transition {old_state} -> {new_state} ({reason}).")
+            return False
+        self._state = new_state
+        self.transitions.append((time.time(), old_state, new_state, reason))
+        print(f"APP_STATE: {old_state} -> {new_state} (batch {self.batch_current_run}) {reason}")
         # For detailed debugging, uncomment the next line:
-        # print("Call stack for app_state.start():")
         # traceback.print_stack(limit=5)
-        print("AppState.start() called, _is_running set to True.")
-        self._is_running = True
+        if self._changed is not None:
+            # Wake every waiter; the next wait gets a fresh event
+            self._changed.set()
+            self._changed = None
+        return True
+
+    def arm(self):
+        return self._transition(ARMED, "batch ready")
+
+    def start(self):
+        return self._transition(RUNNING, "start")
 
     def stop(self):
-        print(f"APP_STATE: stop() called. Current batch_current_run: {self.batch_current_run}")
-        # For detailed debugging, uncomment the next line:
-        # print("Call stack for app_state.stop():")
-        # traceback.print_stack(limit=5)
-        self._is_running = False
-        print("AppState.stop() called, _is_running set to False.")
+        # A stop before Start just disarms the prepared batch
+        if self._state == ARMED:
+            return self._transition(IDLE, "stop while armed")
+        return self._transition(STOPPING, "stop")
+
+    def finish_stop(self):
+        # Called once the batch tasks are cleaned up
+        if self._state == STOPPING:
+            return self._transition(IDLE, "batch tasks stopped")
+        return False
+
+    def halt(self, reason="safety halt"):
+        return self._transition(HALTED, reason)
 
     def is_running(self):
-        return self._is_running
-    
+        return self._state == RUNNING
+
+    def is_halted(self):
+        return self._state == HALTED
+
+    def _event(self):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def wait_for_change(self):
+        """Awaitable for the next transition after this call, returning the new state.
+
+        The event is taken now, not when the awaitable first runs, so a transition made
+        before a create_task() wrapper gets scheduled still wakes it."""
+        event = self._event()
+
+        async def wait():
+            await event.wait()
+            return self._state
+        return wait()
+
+    async def wait_for(self, *states, timeout=None):
+        """Wait until the state is one of 'states'. Returns False on timeout."""
+        deadline = None if timeout is None else asyncio.get_event_loop().time() + timeout
+        while self._state not in states:
+            remaining = None if deadline is None else deadline - asyncio.get_event_loop().time()
+            if remaining is not None and remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._event().wait(), remaining)
+            except asyncio.TimeoutError:
+                return self._state in states
+        return True
+
+    async def sleep(self, seconds):
+        """Sleep while running; wakes as soon as the batch leaves RUNNING. Returns is_running()."""
+        if not self.is_running():
+            return False
+        if seconds > 0:
+            await self.wait_for(STOPPING, HALTED, IDLE, timeout=seconds)
+        return self.is_running()
+
     def set_system_stable(self, stable: bool):
         print(f"AppState: Setting system_is_stable_for_monitoring to {stable}")
         self.system_is_stable_for_monitoring = stable
@@ -38,4 +125,4 @@ class AppState:
     def is_system_stable(self):
         return self.system_is_stable_for_monitoring
 
-app_state = AppState()
\ No newline at end of file
+app_state = AppState()